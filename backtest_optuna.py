@@ -1,13 +1,20 @@
 # backtest_optuna.py
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
 import optuna
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from bot.data import fetch_bars
-from bot.features import make_features
-from bot.strategy import hybrid_signal, load_trading_model
+from bot.data import fetch_bars_many
+from bot.panel import make_panel
+from bot.strategy import signal_frame, load_trading_model
 from bot.sizing import volatility_target_size
-from bot.risk import compute_brackets
+from bot.fill_engine import ExtremaTable, first_passage_exits, bracket_exits
+from bot.config import settings
+from bot import result_cache
 from bot.util import logger
 
 
@@ -15,6 +22,13 @@ from bot.util import logger
 SYMBOLS = ["BTC/USD", "ETH/USD"]  # Añade más si quieres
 START_DATE = "2024-01-01"
 INITIAL_CAPITAL = 100000.0
+N_TRIALS = 50
+STUDY_NAME = "backtest_optuna"
+STORAGE_URL = "sqlite:///data/optuna/optuna.db"
+SHARED_DIR = "data/optuna/arrays"
+
+# Columnas que necesita el backtest (la señal ya calculada con el modelo)
+ARRAY_COLUMNS = ["open", "high", "low", "close", "atr_14", "signal"]
 
 optuna.logging.set_verbosity(optuna.logging.WARNING)
 
@@ -22,11 +36,158 @@ optuna.logging.set_verbosity(optuna.logging.WARNING)
 def simulate_trade(entry_price, exit_price, qty, side):
     return (exit_price - entry_price) * qty if side == "long" else (entry_price - exit_price) * qty
 
-def run_backtest(params, symbol_data, model=None):
-    """Ejecuta un backtest y devuelve métricas."""
+def symbol_arrays(feats: pd.DataFrame, model=None) -> dict:
+    """Arrays de ARRAY_COLUMNS de un símbolo, con la señal híbrida precalculada."""
+    arrays = {c: feats[c].to_numpy(dtype=float) for c in ARRAY_COLUMNS if c != "signal"}
+    arrays["signal"] = signal_frame(feats, model)["signal"].to_numpy(dtype=float)
+    return arrays
+
+
+def run_backtest(params, symbol_data, model=None, fill="intrabar", tie="stop"):
+    """
+    Ejecuta un backtest sobre DataFrames de features (symbol -> feats) y devuelve métricas.
+    Si la misma combinación (features, modelo, parámetros) ya está en la caché
+    de resultados no se recalcula ni la señal.
+    """
+    symbol_data = {s: f for s, f in symbol_data.items() if not f.empty and len(f) >= 100}
+    key = None
+    if result_cache.enabled():
+        key = result_cache.result_key("run_backtest", result_cache.data_fingerprint(symbol_data),
+                                      {**params, "fill": fill, "tie": tie},
+                                      result_cache.model_fingerprint(model))
+        hit = result_cache.lookup(key)
+        if hit is not None:
+            return hit["metrics"]
+    arrays = {s: symbol_arrays(f, model) for s, f in symbol_data.items()}
+    return _compute_and_store(key, "run_backtest", params, arrays, fill, tie)
+
+
+def cached_backtest_arrays(params, symbol_arrays_, fill="intrabar", tie="stop", data_fp: str = None):
+    """run_backtest_arrays con la caché de resultados (las señales ya van en los arrays)."""
+    if not result_cache.enabled():
+        return run_backtest_arrays(params, symbol_arrays_, fill=fill, tie=tie)
+    data_fp = data_fp or result_cache.data_fingerprint(symbol_arrays_)
+    key = result_cache.result_key("backtest_arrays", data_fp, {**params, "fill": fill, "tie": tie})
+    hit = result_cache.lookup(key)
+    if hit is not None:
+        return hit["metrics"]
+    return _compute_and_store(key, "backtest_arrays", params, symbol_arrays_, fill, tie)
+
+
+def _compute_and_store(key, kind, params, symbol_arrays_, fill, tie):
+    result = run_backtest_arrays(params, symbol_arrays_, fill=fill, tie=tie, details=key is not None)
+    if key is None:
+        return result
+    equity_curve, trades = result.pop("equity_curve"), result.pop("trades")
+    result_cache.store(key, kind, {**params, "fill": fill, "tie": tie}, result, equity_curve, trades)
+    return result
+
+
+def _exit_tables(a: dict, fill: str = "intrabar") -> tuple:
+    """Tablas de extremos de un símbolo (precio para brackets y señal), reutilizables entre configuraciones."""
+    price = ExtremaTable(a["close"]) if fill == "close" else ExtremaTable(a["high"], a["low"])
+    return price, ExtremaTable(a["signal"])
+
+
+def resolve_exits(a: dict, tp_pct: float, sl_pct: float, thr_exit: float = None,
+                  fill: str = "intrabar", tie: str = "stop", tables: tuple = None):
+    """
+    Salida de cada vela como posible entrada: bracket TP/SL (con cierres o
+    intrabar) y, si thr_exit no es None, cierre con señal contraria
+    (señal * lado < -thr_exit). Devuelve (exit_idx, exit_price); -1 si no sale.
+    """
+    close, signal = a["close"], a["signal"]
+    n = len(close)
+    price_table, sig_table = tables or _exit_tables(a, fill)
+    is_long = signal > 0
+    tp = np.where(is_long, close * (1 + tp_pct), close * (1 - tp_pct))
+    sl = np.where(is_long, close * (1 - sl_pct), close * (1 + sl_pct))
+    entries = np.arange(n)
+    if fill == "close":
+        exit_idx, exit_px, _ = first_passage_exits(close, entries, tp, sl, is_long, table=price_table)
+    else:
+        exit_idx, exit_px, _ = bracket_exits(a["open"], a["high"], a["low"], entries, tp, sl, is_long,
+                                             tie=tie, table=price_table)
+    if thr_exit is None:
+        return exit_idx, exit_px
+
+    # Señal contraria al cierre; en la misma vela el bracket (intrabar) va antes
+    thr = np.full(n, float(thr_exit))
+    sig_idx = np.where(is_long,
+                       sig_table.first_at_or_below(entries + 1, np.nextafter(-thr, -np.inf)),
+                       sig_table.first_at_or_above(entries + 1, np.nextafter(thr, np.inf)))
+    br_idx = np.where(exit_idx < 0, n, exit_idx)
+    idx = np.minimum(br_idx, sig_idx)
+    px = np.where(br_idx <= sig_idx, exit_px, close[np.minimum(sig_idx, n - 1)])
+    return np.where(idx < n, idx, -1), np.where(idx < n, px, np.nan)
+
+
+def _sharpe(equity_curve) -> float:
+    """Sharpe anualizado de los rendimientos vela a vela de una curva de equity."""
+    equity_curve = np.asarray(equity_curve)
+    daily_returns = np.diff(equity_curve) / (equity_curve[:-1] + 1e-8)
+    if len(daily_returns) > 1:
+        return (np.mean(daily_returns) / (np.std(daily_returns) + 1e-8)) * np.sqrt(252)
+    return 0.0
+
+
+class _ReturnStats:
+    """
+    Media y varianza (Welford) de los rendimientos vela a vela de K curvas de
+    equity a la vez, sin guardar las curvas: memoria O(K) sea cual sea el histórico.
+    """
+
+    def __init__(self, k: int):
+        self.prev = None
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+
+    def add(self, equity: np.ndarray):
+        if self.prev is not None:
+            r = (equity - self.prev) / (self.prev + 1e-8)
+            self.n += 1
+            delta = r - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (r - self.mean)
+        self.prev = equity
+
+    def sharpe(self) -> np.ndarray:
+        if self.n > 1:
+            return (self.mean / (np.sqrt(self.m2 / self.n) + 1e-8)) * np.sqrt(252)
+        return np.zeros_like(self.mean)
+
+
+def _metrics(total_pnl, num_trades, win_count, loss_count, max_drawdown, cash, sharpe):
+    """Métricas finales a partir de los acumulados (escalares o un array por configuración)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        win_rate = np.where(num_trades > 0, win_count / np.maximum(num_trades, 1), 0.0)
+        avg = total_pnl / np.maximum(num_trades, 1)
+        profit_factor = np.where(loss_count > 0, (win_count * avg) / (loss_count * np.abs(avg) + 1e-8), np.inf)
+    final_equity = cash  # las posiciones abiertas se valoran a su precio de entrada
+    objective_val = total_pnl + sharpe * 1000 + win_rate * 10000 - max_drawdown
+    return {
+        "pnl": total_pnl, "num_trades": num_trades, "win_rate": win_rate,
+        "profit_factor": profit_factor, "sharpe": sharpe, "max_drawdown": max_drawdown,
+        "final_equity": final_equity, "objective": objective_val
+    }
+
+
+def run_backtest_arrays(params, symbol_arrays_, fill="intrabar", tie="stop", details=False):
+    """
+    Ejecuta un backtest sobre arrays por símbolo (ver symbol_arrays) y devuelve métricas.
+    Las salidas TP/SL de todas las velas se resuelven de antemano con el motor
+    de primer paso (bot.fill_engine) y las posiciones abiertas se llevan como
+    agregados, así que cada vela cuesta O(1).
+    fill="intrabar" comprueba los brackets con high/low de cada vela (regla
+    'tie' si toca ambos); fill="close" solo con los cierres.
+    Opcionales: thr_entry (|señal| mínima para entrar, 0 por defecto) y
+    thr_exit (salida con señal contraria; None = solo brackets).
+    Con details=True añade "equity_curve" (array) y "trades" (DataFrame).
+    """
     cash = INITIAL_CAPITAL
-    positions = []
     equity_curve = []
+    trades = []
 
     total_pnl = 0.0
     num_trades = 0
@@ -35,133 +196,294 @@ def run_backtest(params, symbol_data, model=None):
     max_drawdown = 0.0
     peak = INITIAL_CAPITAL
 
+    # Posiciones abiertas como agregados: sum(qty) y sum(qty * entrada) por lado
+    long_q = long_qe = short_q = short_qe = 0.0
+
     RISK_PER_TRADE = params["risk_per_trade"]
     TAKE_PROFIT_PCT = params["take_profit_pct"]
     STOP_LOSS_PCT = params["stop_loss_pct"]
     MAX_GROSS_EXPOSURE = params["max_gross_exposure"]
+    THR_ENTRY = params.get("thr_entry", 0.0)
+    THR_EXIT = params.get("thr_exit")
 
-    for symbol, feats in symbol_data.items():
-        if feats.empty or len(feats) < 100:
+    for symbol, a in symbol_arrays_.items():
+        n_bars = len(a["close"])
+        if n_bars < 100:
             continue
 
-        # 🔹 Precalcular señales para todas las velas de este símbolo
-        feats["signal"] = feats.apply(lambda row: hybrid_signal(row, model), axis=1)
+        close, atr, signal = a["close"], a["atr_14"], a["signal"]
 
-        logger.info(f"📊 {symbol}: empezando backtest con {len(feats)} velas")
-        for i in range(100, len(feats)):
-            latest = feats.iloc[i]
-            price = float(latest["close"])
+        # 🔹 Salida de cada vela como posible entrada (una pasada vectorizada)
+        exit_idx, exit_px = resolve_exits(a, TAKE_PROFIT_PCT, STOP_LOSS_PCT, THR_EXIT, fill, tie)
+
+        close_l, atr_l, signal_l = close.tolist(), atr.tolist(), signal.tolist()
+        exit_idx_l, exit_px_l = exit_idx.tolist(), exit_px.tolist()
+
+        logger.debug(f"📊 {symbol}: empezando backtest con {n_bars} velas")
+        for i in range(100, n_bars):
+            price = close_l[i]
 
             # Equity
-            equity = cash + sum(simulate_trade(pos["entry_price"], price, pos["qty"], pos["side"]) for pos in positions)
+            equity = cash + (price * long_q - long_qe) + (short_qe - price * short_q)
             equity_curve.append(equity)
             peak = max(peak, equity)
             max_drawdown = max(max_drawdown, peak - equity)
 
-            gross_exposure = sum(abs(pos["qty"] * pos["entry_price"]) for pos in positions) / (equity + 1e-8)
+            gross_exposure = (long_qe + short_qe) / (equity + 1e-8)
             if gross_exposure >= MAX_GROSS_EXPOSURE:
                 continue
 
             # 🔹 Usar señal ya precalculada
-            sig = latest["signal"]
-            if sig == 0:
+            sig = signal_l[i]
+            if sig == 0 or abs(sig) <= THR_ENTRY:
                 continue
 
-            shares = volatility_target_size(equity, price, float(latest["atr_14"]))
+            shares = volatility_target_size(equity, price, atr_l[i], RISK_PER_TRADE)
             qty = shares * max(min(abs(sig) + 0.5, 1.5), 0.1)
             if qty < 1e-6:
                 continue
 
             side = "long" if sig > 0 else "short"
 
-            tp, sl, _ = compute_brackets(
-                price, side,
-                type('RiskParams', (), {
-                    'take_profit_pct': TAKE_PROFIT_PCT,
-                    'stop_loss_pct': STOP_LOSS_PCT
-                })()
-            )
-
             cost = qty * price
             if cost > cash * 0.95:
                 continue
-
-            positions.append({"qty": qty, "entry_price": price, "tp": tp, "sl": sl, "side": side, "open_idx": i})
             cash -= cost
 
-            # TP/SL en futuras velas
-            future_prices = feats.iloc[i+1:]["close"].values
-            exit_idx = None
-            exit_price = None
-            for j, f_price in enumerate(future_prices):
-                closed = False
-                if side == "long":
-                    if f_price >= tp:
-                        exit_price = tp
-                        closed = True
-                    elif f_price <= sl:
-                        exit_price = sl
-                        closed = True
+            # Salida ya resuelta para esta vela
+            if details:
+                trades.append((symbol, i, exit_idx_l[i], side, qty, price, exit_px_l[i],
+                               simulate_trade(price, exit_px_l[i], qty, side)))
+            if exit_idx_l[i] >= 0:
+                exit_price = exit_px_l[i]
+                pnl = simulate_trade(price, exit_price, qty, side)
+                cash += qty * exit_price
+                total_pnl += pnl
+                num_trades += 1
+                if pnl > 0:
+                    win_count += 1
                 else:
-                    if f_price <= tp:
-                        exit_price = tp
-                        closed = True
-                    elif f_price >= sl:
-                        exit_price = sl
-                        closed = True
-                if closed:
-                    pnl = simulate_trade(price, exit_price, qty, side)
-                    cash += qty * exit_price
-                    total_pnl += pnl
-                    num_trades += 1
-                    if pnl > 0:
-                        win_count += 1
-                    else:
-                        loss_count += 1
-                    exit_idx = i + 1 + j
-                    break
-            if exit_idx is not None:
-                positions = [p for p in positions if p["open_idx"] != i]
+                    loss_count += 1
+            elif side == "long":
+                long_q += qty
+                long_qe += qty * price
+            else:
+                short_q += qty
+                short_qe += qty * price
 
             if i % 5000 == 0:
-                logger.info(f"  Procesadas {i} velas de {symbol}")
-
-    equity_curve = np.array(equity_curve)
-    daily_returns = np.diff(equity_curve) / (equity_curve[:-1] + 1e-8)
-    sharpe = (np.mean(daily_returns) / (np.std(daily_returns) + 1e-8)) * np.sqrt(252) if len(daily_returns) > 1 else 0.0
-    win_rate = win_count / num_trades if num_trades > 0 else 0.0
-    profit_factor = (win_count * (total_pnl / num_trades)) / (loss_count * abs(total_pnl / num_trades) + 1e-8) if loss_count > 0 else float('inf')
-    final_equity = cash + sum(simulate_trade(pos["entry_price"], pos["entry_price"], pos["qty"], pos["side"]) for pos in positions)
-    objective_val = total_pnl + sharpe * 1000 + win_rate * 10000 - max_drawdown
-
-    return {
-        "pnl": total_pnl, "num_trades": num_trades, "win_rate": win_rate,
-        "profit_factor": profit_factor, "sharpe": sharpe, "max_drawdown": max_drawdown,
-        "final_equity": final_equity, "objective": objective_val
-    }
+                logger.debug(f"  Procesadas {i} velas de {symbol}")
+
+    m = _metrics(total_pnl, num_trades, win_count, loss_count, max_drawdown, cash, _sharpe(equity_curve))
+    result = {k: v.item() if isinstance(v, np.ndarray) else v for k, v in m.items()}
+    if details:
+        # exit_idx = -1: posición que sigue abierta al final (pnl NaN)
+        result["equity_curve"] = np.asarray(equity_curve)
+        result["trades"] = pd.DataFrame(trades, columns=["symbol", "entry_idx", "exit_idx", "side", "qty",
+                                                         "entry_price", "exit_price", "pnl"])
+    return result
+
+
+# --------------------- Barrido de parámetros --------------------- #
+SWEEP_PARAMS = ["risk_per_trade", "take_profit_pct", "stop_loss_pct", "max_gross_exposure", "thr_entry", "thr_exit"]
+SWEEP_CHUNK = 256  # configuraciones por bloque (acota la memoria de las salidas TP/SL)
+# Rejilla gruesa sobre los mismos rangos que 'objective' (semilla del estudio)
+SEED_GRID = {
+    "risk_per_trade": [0.002, 0.005, 0.01, 0.02],
+    "take_profit_pct": [0.01, 0.02, 0.03, 0.05],
+    "stop_loss_pct": [0.01, 0.02, 0.03],
+    "max_gross_exposure": [1.0, 2.0, 3.0],
+}
+
+
+def param_grid(**axes) -> list[dict]:
+    """Producto cartesiano de valores: param_grid(take_profit_pct=[...], stop_loss_pct=[...], ...)."""
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*(axes[k] for k in keys))]
+
+
+def sweep(param_sets, symbol_arrays_, fill="intrabar", tie="stop", chunk_size=SWEEP_CHUNK) -> pd.DataFrame:
+    """
+    Evalúa K configuraciones a la vez sobre los mismos arrays. Devuelve un
+    DataFrame (una fila por configuración) con los parámetros y las mismas
+    métricas que run_backtest_arrays.
+    El recorrido en el tiempo sigue siendo secuencial (el tamaño depende del
+    equity acumulado), pero cada vela actualiza el estado de las K
+    configuraciones con operaciones vectorizadas, y las salidas se resuelven
+    una vez por combinación distinta de (TP, SL, thr_exit).
+    """
+    param_sets = [dict(p) for p in param_sets]
+    rows = []
+    for lo in range(0, len(param_sets), chunk_size):
+        chunk = param_sets[lo:lo + chunk_size]
+        metrics = _sweep_chunk(chunk, symbol_arrays_, fill, tie)
+        for k, p in enumerate(chunk):
+            rows.append({**p, **{m: v[k].item() for m, v in metrics.items()}})
+        logger.debug(f"🧮 Barrido: {min(lo + chunk_size, len(param_sets))}/{len(param_sets)} configuraciones")
+    return pd.DataFrame(rows)
+
+
+def _sweep_chunk(chunk, symbol_arrays_, fill, tie) -> dict:
+    K = len(chunk)
+    col = lambda name, default=None: np.array([p.get(name, default) for p in chunk], dtype=float)
+    # volatility_target_size usa settings.risk_per_trade si el riesgo es 0
+    risk = col("risk_per_trade")
+    risk = np.where(risk == 0, settings.risk_per_trade, risk)
+    max_gross = col("max_gross_exposure")
+    thr_entry = col("thr_entry", 0.0)
+    combos = [(p["take_profit_pct"], p["stop_loss_pct"], p.get("thr_exit")) for p in chunk]
+    unique = list(dict.fromkeys(combos))
+    ucol = np.array([unique.index(c) for c in combos])
+
+    returns = _ReturnStats(K)  # Sharpe sin guardar las K curvas de equity
+    cash = np.full(K, INITIAL_CAPITAL)
+    peak = np.full(K, INITIAL_CAPITAL)
+    max_drawdown = np.zeros(K)
+    total_pnl = np.zeros(K)
+    num_trades = np.zeros(K, dtype=np.int64)
+    win_count = np.zeros(K, dtype=np.int64)
+    loss_count = np.zeros(K, dtype=np.int64)
+    long_q, long_qe, short_q, short_qe = (np.zeros(K) for _ in range(4))
+
+    for symbol, a in symbol_arrays_.items():
+        n_bars = len(a["close"])
+        if n_bars < 100:
+            continue
+        tables = _exit_tables(a, fill)
+        exits = [resolve_exits(a, tp, sl, thr, fill, tie, tables) for tp, sl, thr in unique]
+        # (velas, combinaciones distintas): se expande a K solo vela a vela
+        exit_idx = np.stack([e[0] for e in exits], axis=1)
+        exit_px = np.stack([e[1] for e in exits], axis=1)
+
+        close_l, atr_l, signal_l = a["close"].tolist(), a["atr_14"].tolist(), a["signal"].tolist()
+        for i in range(100, n_bars):
+            price = close_l[i]
+            equity = cash + (price * long_q - long_qe) + (short_qe - price * short_q)
+            returns.add(equity)
+            np.maximum(peak, equity, out=peak)
+            np.maximum(max_drawdown, peak - equity, out=max_drawdown)
+
+            sig, atr = signal_l[i], atr_l[i]
+            if sig == 0 or atr <= 0 or price <= 0:
+                continue
+            qty = np.maximum(equity * risk / atr, 0.0) * max(min(abs(sig) + 0.5, 1.5), 0.1)
+            cost = qty * price
+            ok = ((long_qe + short_qe) / (equity + 1e-8) < max_gross) & (abs(sig) > thr_entry) \
+                & (qty >= 1e-6) & ~(cost > cash * 0.95)
+            if not ok.any():
+                continue
+            cash -= np.where(ok, cost, 0.0)
+
+            found = exit_idx[i, ucol] >= 0
+            closed = ok & found
+            if closed.any():
+                exit_price = exit_px[i, ucol]
+                pnl = np.where(closed, (exit_price - price) * qty if sig > 0 else (price - exit_price) * qty, 0.0)
+                cash += np.where(closed, qty * exit_price, 0.0)
+                total_pnl += pnl
+                num_trades += closed
+                win_count += closed & (pnl > 0)
+                loss_count += closed & ~(pnl > 0)
+            opened = ok & ~found
+            if sig > 0:
+                long_q += np.where(opened, qty, 0.0)
+                long_qe += np.where(opened, qty * price, 0.0)
+            else:
+                short_q += np.where(opened, qty, 0.0)
+                short_qe += np.where(opened, qty * price, 0.0)
+
+    return _metrics(total_pnl, num_trades, win_count, loss_count, max_drawdown, cash, returns.sharpe())
+
+
+def seed_study(study, results: pd.DataFrame, top: int = 5, by: str = "objective"):
+    """Encola en el estudio las 'top' mejores configuraciones de un barrido (prior para el sampler)."""
+    names = [c for c in ("risk_per_trade", "take_profit_pct", "stop_loss_pct", "max_gross_exposure")
+             if c in results.columns]
+    for _, r in results.nlargest(top, by).iterrows():
+        study.enqueue_trial({c: float(r[c]) for c in names})
 
 
 # --------------------- Cargar datos --------------------- #
 def load_symbol_data(symbols, start_date):
     data = {}
+    bars = fetch_bars_many(symbols, start=start_date)
     for symbol in symbols:
-        df = fetch_bars(symbol, start=start_date)
-        if df.empty:
+        if bars[symbol].empty:
             logger.warning(f"⚠️ No hay datos para {symbol}")
-            continue
-        feats = make_features(df)
+    panel = make_panel(bars)
+    for symbol in panel.symbols:
+        feats = panel.frame(symbol)
         if feats.empty:
             continue
         data[symbol] = feats
     logger.info(f"📊 Datos cargados para {len(data)} símbolos")
     return data
 
-PRELOADED_DATA = load_symbol_data(SYMBOLS, START_DATE)
-MODEL = load_trading_model()
+
+def prepare_arrays(symbols=SYMBOLS, start_date=START_DATE, model=None):
+    """Descarga, features y señales (modelo cargado una vez) -> arrays por símbolo."""
+    model = model if model is not None else load_trading_model()
+    data = load_symbol_data(symbols, start_date)
+    return {s: symbol_arrays(f, model) for s, f in data.items() if len(f) >= 100}
+
+
+# --------------------- Datos compartidos entre procesos --------------------- #
+def export_shared(arrays: dict, path: str = SHARED_DIR) -> str:
+    """
+    Escribe todos los arrays en un único .npy (columnas x velas) y un índice
+    con el tramo de cada símbolo. Los workers lo abren con mmap: las páginas
+    se comparten a través de la caché del sistema, sin copias por proceso.
+    """
+    os.makedirs(path, exist_ok=True)
+    index, offset = {}, 0
+    for s, a in arrays.items():
+        n = len(a["close"])
+        index[s] = [offset, offset + n]
+        offset += n
+    matrix = np.lib.format.open_memmap(os.path.join(path, "arrays.npy"), mode="w+",
+                                       dtype=np.float64, shape=(len(ARRAY_COLUMNS), offset))
+    for s, (lo, hi) in index.items():
+        for k, c in enumerate(ARRAY_COLUMNS):
+            matrix[k, lo:hi] = arrays[s][c]
+    matrix.flush()
+    del matrix
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump({"columns": ARRAY_COLUMNS, "symbols": index}, f)
+    return path
+
+
+def attach_shared(path: str = SHARED_DIR) -> dict:
+    """Vistas de solo lectura (memmap) de los arrays exportados por export_shared."""
+    with open(os.path.join(path, "index.json")) as f:
+        meta = json.load(f)
+    matrix = np.load(os.path.join(path, "arrays.npy"), mmap_mode="r")
+    return {
+        s: {c: matrix[k, lo:hi] for k, c in enumerate(meta["columns"])}
+        for s, (lo, hi) in meta["symbols"].items()
+    }
+
+
+_DATA = None  # arrays por símbolo del proceso actual (carga perezosa)
+_DATA_FP = None  # huella de _DATA para la caché de resultados
+
+
+def get_data() -> dict:
+    global _DATA
+    if _DATA is None:
+        _DATA = prepare_arrays()
+    return _DATA
+
+
+def _data_fp() -> str:
+    global _DATA_FP
+    if _DATA_FP is None or _DATA_FP[0] is not _DATA:
+        _DATA_FP = (_DATA, result_cache.data_fingerprint(_DATA))
+    return _DATA_FP[1]
 
 # --------------------- Función objetivo --------------------- #
 def objective(trial):
-    if not PRELOADED_DATA:
+    data = get_data()
+    if not data:
         return -1e6
 
     params = {
@@ -171,7 +493,7 @@ def objective(trial):
         "max_gross_exposure": trial.suggest_float("max_gross_exposure", 1.0, 3.0, step=0.1),
     }
 
-    results = run_backtest(params, PRELOADED_DATA, model=MODEL)
+    results = cached_backtest_arrays(params, data, data_fp=_data_fp() if result_cache.enabled() else None)
 
     trial.set_user_attr("num_trades", results["num_trades"])
     trial.set_user_attr("win_rate", results["win_rate"])
@@ -180,11 +502,85 @@ def objective(trial):
 
     return results["objective"]
 
+# --------------------- Optimización (uno o varios procesos) --------------------- #
+def _storage(url: str):
+    if url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(url[len("sqlite:///"):]) or ".", exist_ok=True)
+    # timeout alto: varios procesos escriben en el mismo fichero SQLite
+    return optuna.storages.RDBStorage(url, engine_kwargs={"connect_args": {"timeout": 60}})
+
+
+def _worker(storage_url: str, study_name: str, n_trials: int, shared_dir: str):
+    """Proceso worker: se engancha a los arrays compartidos y al estudio en SQLite."""
+    global _DATA
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    _DATA = attach_shared(shared_dir)
+    study = optuna.load_study(study_name=study_name, storage=_storage(storage_url))
+    study.optimize(objective, n_trials=n_trials)
+
+
+def optimize(n_trials=N_TRIALS, workers=1, storage_url=STORAGE_URL, study_name=STUDY_NAME,
+             symbols=SYMBOLS, start_date=START_DATE, arrays=None, shared_dir=SHARED_DIR, seed_top=0):
+    """
+    Lanza (o reanuda) el estudio. Los datos y las señales se preparan una sola
+    vez en el proceso padre; con workers > 1 se reparten los trials entre
+    procesos que leen los mismos arrays en memoria compartida.
+    Con seed_top > 0 un estudio nuevo empieza por las mejores configuraciones
+    de un barrido de SEED_GRID.
+    """
+    global _DATA
+    _DATA = arrays if arrays is not None else prepare_arrays(symbols, start_date)
+    study = optuna.create_study(direction="maximize", study_name=study_name,
+                                storage=_storage(storage_url), load_if_exists=True)
+    done = len(study.trials)
+    if done:
+        logger.info(f"♻️ Reanudando estudio '{study_name}' con {done} trials previos")
+    elif seed_top > 0 and _DATA:
+        grid = param_grid(**SEED_GRID)
+        seed_study(study, sweep(grid, _DATA), top=seed_top)
+        logger.info(f"🌱 Estudio sembrado con las {seed_top} mejores de {len(grid)} configuraciones")
+
+    if workers <= 1:
+        study.optimize(objective, n_trials=n_trials, show_progress_bar=True)
+        return study
+
+    export_shared(_DATA, shared_dir)
+    ctx = mp.get_context("spawn")
+    share = [n_trials // workers + (1 if k < n_trials % workers else 0) for k in range(workers)]
+    procs = [ctx.Process(target=_worker, args=(storage_url, study_name, n, shared_dir))
+             for n in share if n > 0]
+    logger.info(f"⚙️ {len(procs)} workers | {n_trials} trials | storage {storage_url}")
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        if p.exitcode != 0:
+            logger.error(f"❌ Worker {p.pid} terminó con código {p.exitcode}")
+    return optuna.load_study(study_name=study_name, storage=_storage(storage_url))
+
+
 # --------------------- Main --------------------- #
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trials", type=int, default=N_TRIALS)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--storage", default=STORAGE_URL)
+    ap.add_argument("--study-name", default=STUDY_NAME)
+    ap.add_argument("--symbols", nargs="+", default=SYMBOLS)
+    ap.add_argument("--start", default=START_DATE)
+    ap.add_argument("--seed-top", type=int, default=0, help="sembrar con las N mejores del barrido SEED_GRID")
+    ap.add_argument("--sweep-out", default=None, help="solo barrido: guarda el mapa de sensibilidad en CSV")
+    args = ap.parse_args()
+
+    if args.sweep_out:
+        results = sweep(param_grid(**SEED_GRID), prepare_arrays(args.symbols, args.start))
+        results.to_csv(args.sweep_out, index=False)
+        logger.info(f"🗺️ Barrido de {len(results)} configuraciones guardado en {args.sweep_out}")
+        raise SystemExit(0)
+
     logger.info("🚀 Iniciando optimización de hiperparámetros con Optuna...")
-    study = optuna.create_study(direction="maximize")
-    study.optimize(objective, n_trials=50, show_progress_bar=True)
+    study = optimize(args.trials, args.workers, args.storage, args.study_name, args.symbols, args.start,
+                     seed_top=args.seed_top)
 
     best_params = study.best_params
     best_result = study.best_value
@@ -0,0 +1,69 @@
+# benchmark_inference.py
+"""
+Latencia de la etapa de señales de run_once: una llamada hybrid_signal por
+símbolo frente a una sola inferencia batch (hybrid_signal_batch).
+Usa el modelo entrenado si existe; si no, entrena uno con la misma
+configuración que train_model sobre datos sintéticos.
+
+    python benchmark_inference.py --symbols 50 --repeats 5
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from bot import strategy
+from bot.features import make_features
+from bot.strategy import FEATURES, load_trading_model, hybrid_signal, hybrid_signal_batch
+from bot.util import logger
+
+
+def synthetic_rows(n_symbols: int, n_bars: int = 300, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2024-01-01", periods=n_bars, freq="h", tz="UTC")
+    rows, frames = {}, []
+    for i in range(n_symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+        spread = np.abs(rng.normal(0, 0.5, n_bars))
+        df = pd.DataFrame({"open": np.r_[close[0], close[:-1]], "high": close + spread,
+                           "low": close - spread, "close": close,
+                           "volume": rng.integers(1, 1000, n_bars).astype(float)}, index=idx)
+        f = make_features(df).dropna()
+        f["symbol"] = f"S{i}"
+        frames.append(f)
+        rows[f"S{i}"] = f.iloc[-1].to_dict()
+    return rows, pd.concat(frames)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, default=50)
+    ap.add_argument("--repeats", type=int, default=5)
+    args = ap.parse_args()
+
+    rows, hist = synthetic_rows(args.symbols)
+    clf = load_trading_model()
+    if clf is None:
+        y = (hist["close"].shift(-1) > hist["close"]).astype(int)
+        clf = RandomForestClassifier(n_estimators=300, max_depth=8, random_state=42,
+                                     n_jobs=-1, class_weight="balanced").fit(hist[FEATURES], y)
+
+    per_symbol, batched = [], []
+    for _ in range(args.repeats):
+        strategy._last_signals = {}
+        t0 = time.perf_counter()
+        for row in rows.values():
+            hybrid_signal(row, clf)
+        per_symbol.append(time.perf_counter() - t0)
+
+        strategy._last_signals = {}
+        t0 = time.perf_counter()
+        hybrid_signal_batch(rows, clf)
+        batched.append(time.perf_counter() - t0)
+
+    a, b = np.median(per_symbol), np.median(batched)
+    logger.info(f"⏱️ {args.symbols} símbolos | por símbolo: {a*1000:.1f} ms | batch: {b*1000:.1f} ms | x{a/b:.1f}")
+
+
+if __name__ == "__main__":
+    main()
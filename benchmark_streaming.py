@@ -0,0 +1,131 @@
+# benchmark_streaming.py
+"""
+Memoria pico (RSS) y rendimiento del backtest de cartera en streaming
+(bot.stream_backtest) con 10, 100 y 500 símbolos sintéticos. Cada tamaño se
+mide en un proceso nuevo para que el pico de RSS sea solo suyo; los
+resultados se añaden a data/benchmarks/streaming.csv.
+
+Con --loader store las mismas velas se escriben antes en un almacén Parquet
+temporal (bot.bar_store, una parte por mes como las sincronizaciones reales)
+y el backtest las lee con stream_backtest.store_loader; los resultados van a
+data/benchmarks/streaming_store.csv.
+
+    python benchmark_streaming.py --symbols 10 100 500 --bars 8760 --memory-mb 256
+    python benchmark_streaming.py --symbols 10 100 500 --bars 8760 --loader store
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+RESULTS = {"synthetic": "data/benchmarks/streaming.csv", "store": "data/benchmarks/streaming_store.csv"}
+START = pd.Timestamp("2023-01-01", tz="UTC")
+PAGE = 1000  # velas por página de ruido (semilla = símbolo, página)
+
+
+def synthetic_loader(symbols, start, end):
+    """Velas horarias deterministas por (símbolo, hora): cada bloque se genera al vuelo, nada se guarda."""
+    out = {}
+    h0 = max(int((start - START) / pd.Timedelta("1h")), 0)
+    h1 = int((end - START) / pd.Timedelta("1h"))
+    if h1 <= h0:
+        return {s: pd.DataFrame() for s in symbols}
+    hours = np.arange(h0, h1)
+    for s in symbols:
+        k = int(s[1:])
+        noise = np.concatenate([np.random.default_rng([k, p]).normal(0, 0.004, PAGE)
+                                for p in range(h0 // PAGE, (h1 - 1) // PAGE + 1)])
+        noise = noise[h0 - (h0 // PAGE) * PAGE:][:len(hours)]
+        close = 100 * np.exp(0.2 * np.sin(hours / (300 + k % 50) + k) + 0.05 * np.sin(hours / 40 + 2 * k) + noise)
+        spread = close * 0.003
+        out[s] = pd.DataFrame({"open": close * (1 - noise / 4), "high": close + spread, "low": close - spread,
+                               "close": close, "volume": 1.0},
+                              index=START + pd.to_timedelta(hours, unit="h"))
+    return out
+
+
+def fill_store(path: str, n_symbols: int, bars: int, part_bars: int = 720):
+    """Escribe las velas sintéticas en un almacén Parquet en 'path' (una parte cada 'part_bars' velas)."""
+    from bot import bar_store
+    from bot.config import settings
+    settings.bar_store_path = path
+    end = START + pd.Timedelta(hours=bars)
+    for i in range(n_symbols):
+        s = f"S{i}"
+        df = synthetic_loader([s], START, end)[s].rename_axis("timestamp")
+        for j in range(0, len(df), part_bars):
+            part = df.iloc[j:j + part_bars]
+            bar_store.write_bars(s, part, part.index[0], part.index[-1], timeframe="1Hour")
+        bar_store.clear_cache()
+
+
+def run_one(n_symbols: int, bars: int, memory_mb: float, store: str = None) -> dict:
+    from bot import stream_backtest
+    from bot.config import settings
+    symbols = [f"S{i}" for i in range(n_symbols)]
+    if store is not None:
+        settings.bar_store_path = store
+        load_bars = stream_backtest.store_loader("1Hour")
+    else:
+        load_bars = synthetic_loader
+    t0 = time.perf_counter()
+    out = stream_backtest.backtest_streaming(symbols, START, START + pd.Timedelta(hours=bars),
+                                             load_bars=load_bars, memory_mb=memory_mb,
+                                             timeframe="1Hour", model=None)
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+    return {"symbols": n_symbols, "bars": bars, "memory_mb": memory_mb, "blocks": out["blocks"],
+            "trades": out["num_trades"], "seconds": round(elapsed, 2),
+            "symbol_bars_per_s": round(n_symbols * bars / elapsed), "peak_rss_mb": round(peak_mb, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, nargs="+", default=[10, 100, 500])
+    ap.add_argument("--bars", type=int, default=8760)
+    ap.add_argument("--memory-mb", type=float, default=256)
+    ap.add_argument("--loader", choices=sorted(RESULTS), default="synthetic")
+    ap.add_argument("--one", type=int, default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--store", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(run_one(args.one, args.bars, args.memory_mb, args.store)))
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bars-") as store:
+        extra = []
+        if args.loader == "store":
+            t0 = time.perf_counter()
+            fill_store(store, max(args.symbols), args.bars)
+            print(f"Almacén Parquet con {max(args.symbols)} símbolos escrito en {time.perf_counter() - t0:.1f} s")
+            extra = ["--store", store]
+        for n in args.symbols:
+            res = subprocess.run([sys.executable, __file__, "--one", str(n), "--bars", str(args.bars),
+                                  "--memory-mb", str(args.memory_mb), *extra],
+                                 capture_output=True, text=True, check=True)
+            row = json.loads(res.stdout.strip().splitlines()[-1])
+            rows.append(row)
+            print(f"{n:>4} símbolos | {row['blocks']:>3} bloques | {row['seconds']:>7.1f} s | "
+                  f"{row['symbol_bars_per_s']:>9,} velas/s | pico RSS {row['peak_rss_mb']:.0f} MB")
+
+    results = RESULTS[args.loader]
+    os.makedirs(os.path.dirname(results), exist_ok=True)
+    new = not os.path.exists(results)
+    with open(results, "a", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        if new:
+            w.writeheader()
+        w.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
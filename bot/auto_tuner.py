@@ -8,6 +8,7 @@ from .util import logger
 
 
 AUTO_CONFIG_FILE = "bot/auto_config.json"
+TRADES_FILE = "trades_log.csv"
 DEFAULT_CONFIG = {
     "risk_per_trade": 0.02,
     "max_gross_exposure": 0.5,
@@ -43,12 +44,12 @@ def _save_auto_config(config):
 
 def _calculate_daily_pnl():
     """Calcula el P&L de las últimas 24 horas."""
-    if not os.path.exists("trades_log.csv"):
+    if not os.path.exists(TRADES_FILE):
         logger.warning("⚠️ No existe trades_log.csv")
         return 0.0, 0
 
     try:
-        df = pd.read_csv("trades_log.csv")
+        df = pd.read_csv(TRADES_FILE)
 
         # ✅ Asegurar que sea una copia
         df = df.copy()
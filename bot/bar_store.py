@@ -0,0 +1,200 @@
+# bot/bar_store.py
+import os
+import threading
+import time
+import pandas as pd
+from .config import settings
+from .util import logger, jdump, jload
+
+try:
+    import pyarrow.parquet as pq  # motor Parquet de pandas
+    _HAS_PARQUET = True
+except Exception:
+    pq = None
+    _HAS_PARQUET = False
+
+# ------------------------------------------------------------------
+# Almacén local de barras en Parquet, particionado por timeframe y símbolo:
+#   <bar_store_path>/timeframe=1Hour/symbol=BTC_USD/part-<n>.parquet
+#   <bar_store_path>/timeframe=1Hour/symbol=BTC_USD/_meta.json
+# Cada sincronización añade un "part" pequeño con las velas nuevas; cuando
+# hay demasiados se compactan en uno solo. Los ficheros se escriben en
+# row groups de ROW_GROUP_SIZE velas para que las lecturas por ventana
+# (read_bars_window) se salten los que quedan fuera según sus estadísticas.
+# ------------------------------------------------------------------
+MAX_PARTS = 32
+ROW_GROUP_SIZE = 4096
+
+_cache: dict[tuple[str, str], pd.DataFrame] = {}
+_locks: dict[tuple[str, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+_warned = False
+
+
+def enabled() -> bool:
+    """True si el almacén está activo y hay motor Parquet disponible."""
+    global _warned
+    if not settings.bar_store_enabled:
+        return False
+    if not _HAS_PARQUET:
+        if not _warned:
+            logger.warning("⚠️ pyarrow no disponible; almacén local de barras desactivado.")
+            _warned = True
+        return False
+    return True
+
+
+def _lock(key) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _partition_dir(symbol: str, timeframe: str) -> str:
+    safe = symbol.replace("/", "_")
+    return os.path.join(settings.bar_store_path, f"timeframe={timeframe}", f"symbol={safe}")
+
+
+def _part_files(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        os.path.join(path, f) for f in os.listdir(path)
+        if f.startswith("part-") and f.endswith(".parquet")
+    )
+
+
+def _load_partition(symbol: str, timeframe: str) -> pd.DataFrame:
+    """Lee (una vez por proceso) todas las partes de un símbolo."""
+    key = (symbol, timeframe)
+    if key in _cache:
+        return _cache[key]
+    parts = _part_files(_partition_dir(symbol, timeframe))
+    if parts:
+        df = pd.concat([pd.read_parquet(p) for p in parts])
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+    else:
+        df = pd.DataFrame()
+    _cache[key] = df
+    return df
+
+
+def coverage(symbol: str, timeframe: str | None = None):
+    """
+    Devuelve (desde, hasta) del rango ya sincronizado con Alpaca, o None.
+    El rango puede ser más amplio que las velas guardadas (fines de semana,
+    activos que aún no cotizaban, etc.).
+    """
+    timeframe = timeframe or settings.bar_timeframe
+    meta = jload(os.path.join(_partition_dir(symbol, timeframe), "_meta.json"), None)
+    if not meta:
+        return None
+    return pd.Timestamp(meta["covered_from"]), pd.Timestamp(meta["covered_to"])
+
+
+def last_timestamp(symbol: str, timeframe: str | None = None):
+    """Timestamp de la última vela guardada, o None."""
+    df = _load_partition(symbol, timeframe or settings.bar_timeframe)
+    return None if df.empty else df.index[-1]
+
+
+def read_bars(symbol: str, timeframe: str | None = None, start=None, end=None) -> pd.DataFrame:
+    """Devuelve una copia de las velas guardadas en [start, end]."""
+    df = _load_partition(symbol, timeframe or settings.bar_timeframe)
+    if df.empty:
+        return df
+    return df.loc[start:end].copy()
+
+
+def _read_window(path: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """
+    Velas de un fichero en [start, end). Los row groups cuyas estadísticas
+    (mín/máx del índice) quedan fuera de la ventana no se leen; un fichero
+    entero fuera de la ventana solo cuesta leer su pie.
+    """
+    f = pq.ParquetFile(path)
+    cols = (f.schema_arrow.pandas_metadata or {}).get("index_columns") or []
+    names = [f.metadata.schema.column(j).path for j in range(f.metadata.num_columns)]
+    if len(cols) == 1 and cols[0] in names:
+        j = names.index(cols[0])
+        groups = []
+        for k in range(f.num_row_groups):
+            stats = f.metadata.row_group(k).column(j).statistics
+            if stats is None or not stats.has_min_max or (pd.Timestamp(stats.max) >= start
+                                                            and pd.Timestamp(stats.min) < end):
+                groups.append(k)
+        if not groups:
+            return pd.DataFrame()
+        df = f.read_row_groups(groups).to_pandas()
+    else:
+        df = f.read().to_pandas()  # índice sin columna propia: sin estadísticas que usar
+    return df[(df.index >= start) & (df.index < end)]
+
+
+def read_bars_window(symbol: str, start, end, timeframe: str | None = None) -> pd.DataFrame:
+    """
+    Velas en [start, end) leídas del disco parte a parte, sin pasar por la
+    caché del proceso (backtests en streaming: la memoria no crece con el
+    universo ni con el histórico). Solo se decodifican los row groups que
+    solapan la ventana.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    parts = _part_files(_partition_dir(symbol, timeframe or settings.bar_timeframe))
+    chunks = []
+    for p in parts:
+        df = _read_window(p, start, end)
+        if not df.empty:
+            chunks.append(df)
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks)
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+def write_bars(symbol: str, df: pd.DataFrame, covered_from, covered_to, timeframe: str | None = None):
+    """
+    Añade velas nuevas (sobrescribe las que tengan el mismo timestamp) y
+    amplía el rango cubierto.
+    """
+    timeframe = timeframe or settings.bar_timeframe
+    key = (symbol, timeframe)
+    path = _partition_dir(symbol, timeframe)
+
+    with _lock(key):
+        os.makedirs(path, exist_ok=True)
+        current = _load_partition(symbol, timeframe)
+
+        if not df.empty:
+            df = df.sort_index()
+            part = os.path.join(path, f"part-{time.time_ns():020d}.parquet")
+            df.to_parquet(part + ".tmp", row_group_size=ROW_GROUP_SIZE)
+            os.replace(part + ".tmp", part)
+            merged = pd.concat([current, df]) if not current.empty else df
+            current = merged[~merged.index.duplicated(keep="last")].sort_index()
+            _cache[key] = current
+
+            parts = _part_files(path)
+            if len(parts) > MAX_PARTS:
+                _compact(path, parts, current)
+
+        prev = coverage(symbol, timeframe)
+        if prev is not None:
+            covered_from = min(prev[0], pd.Timestamp(covered_from))
+            covered_to = max(prev[1], pd.Timestamp(covered_to))
+        jdump({"covered_from": pd.Timestamp(covered_from).isoformat(),
+               "covered_to": pd.Timestamp(covered_to).isoformat()},
+              os.path.join(path, "_meta.json"))
+
+
+def _compact(path: str, parts: list[str], df: pd.DataFrame):
+    """Reescribe todas las partes en una sola."""
+    target = os.path.join(path, f"part-{time.time_ns():020d}.parquet")
+    df.to_parquet(target + ".tmp", row_group_size=ROW_GROUP_SIZE)
+    os.replace(target + ".tmp", target)
+    for p in parts:
+        os.remove(p)
+    logger.debug(f"🗜️ Compactadas {len(parts)} partes en {path}")
+
+
+def clear_cache():
+    """Olvida las particiones cargadas en memoria (se releen del disco)."""
+    _cache.clear()
@@ -0,0 +1,326 @@
+# bot/bar_stream.py
+import asyncio
+import queue
+import threading
+import time
+import msgpack
+import numpy as np
+import pandas as pd
+from alpaca.data.enums import DataFeed
+from alpaca.data.live import CryptoDataStream, StockDataStream
+from .config import settings
+from .stream_backtest import bar_interval
+from .util import logger
+
+# ------------------------------------------------------------------
+# Velas en vivo por websocket (stream de datos de acciones y de cripto). Las
+# velas de 1 minuto se agregan al marco de settings.bar_timeframe; cada vela
+# cerrada entra en el buffer circular de su símbolo y avisa al loop, que
+# evalúa solo los símbolos que acaban de cerrar vela (ver main.stream_loop).
+# La latencia de la señal pasa a ser cierre de vela + cómputo, sin esperar al
+# siguiente ciclo de 60 s ni volver a descargar la historia. Si el último
+# minuto de una vela no llega (minuto sin operaciones en IEX, cierre de la
+# sesión), la vela se cierra por tiempo BAR_STREAM_GRACE segundos después de
+# su fin, medido con el reloj del stream.
+# ------------------------------------------------------------------
+MINUTE = pd.Timedelta(minutes=1)
+FLUSH_POLL = 1.0  # segundos entre comprobaciones de velas vencidas en wait()
+COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def _is_crypto(symbol: str) -> bool:
+    return "/" in symbol
+
+
+def _ns(ts) -> int:
+    return pd.Timestamp(ts).value
+
+
+class RingBuffer:
+    """Últimas 'capacity' velas OHLCV de un símbolo en arrays de tamaño fijo."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(COLUMNS)))
+        self.size = 0
+        self.head = 0  # posición de la próxima escritura
+
+    def append(self, ts, bar) -> bool:
+        """Añade una vela (la sustituye si es la última). Devuelve False si es más antigua."""
+        ns = _ns(ts)
+        row = [bar[c] for c in COLUMNS]
+        if self.size:
+            last = (self.head - 1) % self.capacity
+            if ns == self.ts[last]:
+                self.values[last] = row
+                return True
+            if ns < self.ts[last]:
+                return False
+        self.ts[self.head] = ns
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def extend(self, df: pd.DataFrame):
+        for ts, bar in zip(df.index[-self.capacity:], df[COLUMNS].iloc[-self.capacity:].to_dict("records")):
+            self.append(ts, bar)
+
+    @property
+    def last_ts(self):
+        return pd.Timestamp(self.ts[(self.head - 1) % self.capacity], tz="UTC") if self.size else None
+
+    def __len__(self):
+        return self.size
+
+    def frame(self) -> pd.DataFrame:
+        """Las velas en orden cronológico (mismo formato que data.fetch_bars)."""
+        order = np.arange(self.head - self.size, self.head) % self.capacity
+        index = pd.DatetimeIndex(pd.to_datetime(self.ts[order], utc=True), name="timestamp")
+        return pd.DataFrame(self.values[order], index=index, columns=COLUMNS)
+
+
+class BarAggregator:
+    """
+    Agrega velas de 1 minuto en velas de 'interval'. Una vela se da por cerrada
+    al llegar su último minuto o el primero de la siguiente, o con flush()
+    pasado 'grace' desde su fin. La primera vela de cada símbolo, si el stream
+    se conectó a mitad ('since'), está incompleta y se descarta.
+    """
+
+    def __init__(self, interval: pd.Timedelta, since: pd.Timestamp = None, grace: pd.Timedelta = pd.Timedelta(0)):
+        self.interval = interval
+        self.since = since
+        self.grace = grace
+        self._current: dict[str, tuple] = {}   # símbolo -> (inicio, {minuto: vela}, completa)
+        self._closed: dict[str, pd.Timestamp] = {}
+
+    def _bucket(self, ts: pd.Timestamp) -> pd.Timestamp:
+        return ts.floor(self.interval) if self.interval < pd.Timedelta(days=1) else ts.normalize()
+
+    @staticmethod
+    def _merge(minutes: dict) -> dict:
+        bars = [minutes[k] for k in sorted(minutes)]
+        return {"open": bars[0]["open"], "high": max(b["high"] for b in bars), "low": min(b["low"] for b in bars),
+                "close": bars[-1]["close"], "volume": sum(b["volume"] for b in bars)}
+
+    def _close(self, symbol: str) -> list:
+        start, minutes, complete = self._current.pop(symbol)
+        self._closed[symbol] = start
+        if not complete:
+            logger.debug(f"🕯️ {symbol}: vela {start} incompleta (stream conectado a mitad), se descarta")
+            return []
+        return [(symbol, start, self._merge(minutes))]
+
+    def add(self, symbol: str, ts, bar: dict) -> list:
+        """Vela de 1 minuto (nueva o actualizada). Devuelve las velas cerradas: [(símbolo, inicio, vela)]."""
+        ts = pd.Timestamp(ts).tz_convert("UTC") if pd.Timestamp(ts).tzinfo else pd.Timestamp(ts, tz="UTC")
+        start = self._bucket(ts)
+        closed = self._closed.get(symbol)
+        if closed is not None and start <= closed:
+            return []  # corrección de una vela ya cerrada
+        out = []
+        current = self._current.get(symbol)
+        if current is not None and current[0] != start:
+            out += self._close(symbol)
+            current = None
+        if current is None:
+            complete = closed is not None or ts == start or (self.since is not None and start >= self.since)
+            current = (start, {}, complete)
+            self._current[symbol] = current
+        current[1][ts] = bar
+        if ts + MINUTE >= start + self.interval:
+            out += self._close(symbol)
+        return out
+
+    def flush(self, now: pd.Timestamp) -> list:
+        """Cierra las velas en curso cuyo fin + 'grace' ya pasó. Devuelve [(símbolo, inicio, vela)]."""
+        out = []
+        for symbol, (start, _, _) in list(self._current.items()):
+            if now >= start + self.interval + self.grace:
+                out += self._close(symbol)
+        return out
+
+
+class BarStream:
+    """
+    Streams de velas de Alpaca (acciones y cripto) en hilos propios. Las velas
+    cerradas quedan en 'buffers' y sus símbolos en una cola que lee wait().
+    """
+
+    def __init__(self, symbols: list[str], history: dict = None, timeframe: str = None, capacity: int = None,
+                 stock_url: str = None, crypto_url: str = None, grace: float = None):
+        self.symbols = list(symbols)
+        grace = settings.bar_stream_grace if grace is None else grace
+        self.aggregator = BarAggregator(bar_interval(timeframe), grace=pd.Timedelta(seconds=grace))
+        capacity = capacity or settings.bar_buffer_size
+        self.buffers = {s: RingBuffer(capacity) for s in self.symbols}
+        for s, df in (history or {}).items():
+            if s in self.buffers and not df.empty:
+                self.buffers[s].extend(df)
+        self.closed = queue.Queue()
+        self._clock = None  # (fin del último minuto recibido, perf_counter al recibirlo)
+        self._lock = threading.Lock()  # stream de acciones, de cripto y wait() comparten el agregador
+        self.streams = []
+        creds = settings.alpaca_api_key, settings.alpaca_secret_key
+        stocks = [s for s in self.symbols if not _is_crypto(s)]
+        cryptos = [s for s in self.symbols if _is_crypto(s)]
+        if stocks:
+            stream = StockDataStream(*creds, feed=DataFeed(settings.bar_stream_feed),
+                                     url_override=stock_url or settings.stock_stream_url or None)
+            stream.subscribe_bars(self._on_bar, *stocks)
+            stream.subscribe_updated_bars(self._on_bar, *stocks)
+            self.streams.append(stream)
+        if cryptos:
+            stream = CryptoDataStream(*creds, url_override=crypto_url or settings.crypto_stream_url or None)
+            stream.subscribe_bars(self._on_bar, *cryptos)
+            stream.subscribe_updated_bars(self._on_bar, *cryptos)
+            self.streams.append(stream)
+        self._threads = []
+
+    async def _on_bar(self, bar):
+        self.handle_bar(bar.symbol, bar.timestamp, {c: float(getattr(bar, c)) for c in COLUMNS})
+
+    def handle_bar(self, symbol: str, ts, bar: dict):
+        with self._lock:
+            end = pd.Timestamp(ts) + MINUTE
+            if self._clock is None or end > self._clock[0]:
+                self._clock = (end, time.perf_counter())
+            self._publish(self.aggregator.add(symbol, ts, bar))
+
+    def _publish(self, closed: list):
+        for sym, start, merged in closed:
+            buf = self.buffers.get(sym)
+            if buf is not None and buf.append(start, merged):
+                self.closed.put((sym, start, time.perf_counter()))
+
+    def now(self):
+        """
+        Hora del stream: fin del último minuto recibido más lo transcurrido
+        desde entonces (la hora real en vivo; la de las velas en una reproducción).
+        """
+        if self._clock is None:
+            return None
+        end, at = self._clock
+        return end + pd.Timedelta(seconds=time.perf_counter() - at)
+
+    def flush(self, now=None):
+        """Cierra por tiempo las velas cuyo último minuto no llegó."""
+        now = self.now() if now is None else pd.Timestamp(now)
+        if now is None:
+            return
+        with self._lock:
+            self._publish(self.aggregator.flush(now))
+
+    def wait(self, timeout: float = None) -> dict:
+        """
+        Espera al cierre de alguna vela y devuelve {símbolo: instante de llegada}
+        de todas las que haya en cola (las que cierran a la vez van juntas).
+        Mientras espera cierra por tiempo las velas vencidas (flush).
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        events = []
+        while not events:
+            self.flush()
+            left = FLUSH_POLL if deadline is None else min(FLUSH_POLL, deadline - time.perf_counter())
+            try:
+                events.append(self.closed.get(timeout=max(left, 0.0)))
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return {}
+        while True:
+            try:
+                events.append(self.closed.get_nowait())
+            except queue.Empty:
+                break
+        return {sym: arrived for sym, _, arrived in events}
+
+    def frames(self, symbols) -> dict[str, pd.DataFrame]:
+        return {s: self.buffers[s].frame() for s in symbols}
+
+    def start(self):
+        self.aggregator.since = pd.Timestamp.now(tz="UTC")
+        for stream in self.streams:
+            t = threading.Thread(target=stream.run, name=f"bars-{type(stream).__name__}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"📡 Stream de velas iniciado: {len(self.symbols)} símbolos | {len(self.streams)} conexiones")
+
+    def stop(self, timeout: float = 10.0):
+        for stream in self.streams:
+            try:
+                stream.stop()
+            except Exception:
+                pass  # el loop aún no había arrancado
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+
+# ------------------------------------------------------------------
+# Servidor local que reproduce velas de 1 minuto con el protocolo del stream
+# de datos de Alpaca (msgpack): sustituye a Alpaca en tests y pruebas en
+# local (STOCK_STREAM_URL / CRYPTO_STREAM_URL = server.url).
+# ------------------------------------------------------------------
+class BarReplayServer:
+    def __init__(self, bars: dict[str, pd.DataFrame], delay: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.frames = self._frames(bars)
+        self.delay = delay
+        self.host, self.port = host, port
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frames(bars: dict[str, pd.DataFrame]) -> list[tuple[int, list]]:
+        """Mensajes de velas agrupados por minuto, en orden."""
+        rows = []
+        for symbol, df in bars.items():
+            for ts, b in zip(df.index, df[COLUMNS].to_dict("records")):
+                rows.append((_ns(ts), {"T": "b", "S": symbol, "o": b["open"], "h": b["high"], "l": b["low"],
+                                       "c": b["close"], "v": b["volume"], "n": 1, "vw": b["close"]}))
+        rows.sort(key=lambda r: r[0])
+        frames = []
+        for ns, msg in rows:
+            msg["t"] = msgpack.Timestamp.from_unix_nano(ns)
+            if frames and frames[-1][0] == ns:
+                frames[-1][1].append(msg)
+            else:
+                frames.append((ns, [msg]))
+        return frames
+
+    async def _handler(self, ws):
+        await ws.send(msgpack.packb([{"T": "success", "msg": "connected"}]))
+        await ws.recv()  # auth
+        await ws.send(msgpack.packb([{"T": "success", "msg": "authenticated"}]))
+        sub = msgpack.unpackb(await ws.recv())
+        wanted = set(sub.get("bars", []))
+        await ws.send(msgpack.packb([{"T": "subscription", "bars": sorted(wanted)}]))
+        for _, msgs in self.frames:
+            msgs = [m for m in msgs if m["S"] in wanted]
+            if msgs:
+                await ws.send(msgpack.packb(msgs, datetime=False))
+                await asyncio.sleep(self.delay)
+        await ws.wait_closed()
+
+    async def _main(self):
+        from websockets.asyncio.server import serve
+        self._stop = asyncio.Event()
+        async with serve(self._handler, self.host, self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self.url = f"ws://{self.host}:{self.port}"
+            self._ready.set()
+            await self._stop.wait()
+
+    def start(self) -> "BarReplayServer":
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._main(),),
+                                        name="bar-replay-server", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(10)
@@ -0,0 +1,134 @@
+# bot/broker_snapshot.py
+import time
+from dataclasses import dataclass, field
+from alpaca.trading.requests import GetOrdersRequest
+from alpaca.trading.enums import QueryOrderStatus
+from .util import logger
+
+# ------------------------------------------------------------------
+# Foto del broker tomada una vez por ciclo: cuenta, posiciones por símbolo y
+# órdenes abiertas (3 llamadas REST). El resto del ciclo (tamaño, exposición,
+# ejecución y monitor) la lee en lugar de volver a preguntar a Alpaca, y se
+# actualiza localmente después de cada orden enviada.
+# ------------------------------------------------------------------
+
+
+def _key(symbol: str) -> str:
+    """Clave de símbolo como la devuelve Alpaca en posiciones/órdenes (BTC/USD -> BTCUSD)."""
+    return symbol.replace("/", "")
+
+
+@dataclass
+class SnapshotPosition:
+    """Posición abierta con los campos que usa el bot (mismos nombres que alpaca.Position)."""
+    symbol: str
+    qty: float
+    avg_entry_price: float
+    market_value: float
+
+    @classmethod
+    def from_alpaca(cls, pos):
+        return cls(
+            symbol=pos.symbol,
+            qty=float(pos.qty),
+            avg_entry_price=float(pos.avg_entry_price or 0.0),
+            market_value=float(pos.market_value or 0.0),
+        )
+
+
+@dataclass
+class BrokerSnapshot:
+    equity: float
+    cash: float
+    last_equity: float
+    positions: dict[str, SnapshotPosition] = field(default_factory=dict)
+    open_orders: dict[str, list] | None = field(default_factory=dict)  # None: no se pudieron leer
+    taken_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def take(cls, client, book=None) -> "BrokerSnapshot":
+        """
+        Lee cuenta, posiciones y órdenes abiertas del broker. Con 'book' (libro
+        del stream de trade updates, ver bot.trade_stream) posiciones y órdenes
+        salen del libro y solo se consulta la cuenta. Si falla la lectura de
+        órdenes, 'open_orders' queda en None (desconocidas, no vacías).
+        """
+        account = client.get_account()
+        equity = float(account.equity)
+        if book is not None:
+            positions, open_orders = book.all_positions(), book.open_orders()
+        else:
+            positions = {}
+            for pos in client.get_all_positions():
+                p = SnapshotPosition.from_alpaca(pos)
+                positions[_key(p.symbol)] = p
+            open_orders = {}
+            try:
+                for order in client.get_orders(GetOrdersRequest(status=QueryOrderStatus.OPEN)):
+                    open_orders.setdefault(_key(order.symbol), []).append(order)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudieron leer órdenes abiertas: {e}")
+                open_orders = None
+        snap = cls(
+            equity=equity,
+            cash=float(account.cash),
+            last_equity=float(getattr(account, "last_equity", None) or equity),
+            positions=positions,
+            open_orders=open_orders,
+        )
+        logger.debug(f"📸 Snapshot broker: equity ${equity:,.2f} | {len(positions)} posiciones | "
+                     f"{sum(len(o) for o in (open_orders or {}).values())} órdenes abiertas")
+        return snap
+
+    # -------------------- Consultas -------------------- #
+    def position(self, symbol: str):
+        """Posición abierta en 'symbol' o None."""
+        return self.positions.get(_key(symbol))
+
+    def all_positions(self) -> list[SnapshotPosition]:
+        return list(self.positions.values())
+
+    def has_open_order(self, symbol: str) -> bool:
+        return bool((self.open_orders or {}).get(_key(symbol)))
+
+    def gross_value(self) -> float:
+        return sum(abs(p.market_value) for p in self.positions.values())
+
+    def gross_exposure(self) -> float:
+        """Exposición bruta como múltiplo del equity (0.0 si el equity no es positivo)."""
+        return self.gross_value() / self.equity if self.equity > 0 else 0.0
+
+    # -------------------- Actualizaciones locales -------------------- #
+    def apply_order(self, symbol: str, qty: float, side: str, price: float, order=None):
+        """
+        Refleja una orden de mercado enviada: ajusta cash y posición como si se
+        hubiera ejecutado a 'price'. La orden (si se pasa) queda como abierta.
+        """
+        key = _key(symbol)
+        signed = qty if side == "buy" else -qty
+        self.cash -= signed * price
+
+        pos = self.positions.get(key)
+        old = pos.qty if pos else 0.0
+        new = old + signed
+        if abs(new) < 1e-9:
+            self.positions.pop(key, None)
+        else:
+            if pos is None or old * new < 0:
+                avg = price  # nueva posición o cambio de lado
+            elif abs(new) > abs(old):
+                avg = (pos.avg_entry_price * abs(old) + price * abs(signed)) / abs(new)
+            else:
+                avg = pos.avg_entry_price  # reducción: el precio medio no cambia
+            self.positions[key] = SnapshotPosition(key, new, avg, new * price)
+
+        if order is not None and self.open_orders is not None:
+            self.open_orders.setdefault(key, []).append(order)
+
+    def remove_position(self, symbol: str, price: float = None):
+        """Refleja el cierre total de una posición (el cash vuelve a precio de mercado)."""
+        pos = self.positions.pop(_key(symbol), None)
+        if pos is None:
+            return
+        value = pos.qty * price if price else pos.market_value
+        self.cash += value
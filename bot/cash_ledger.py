@@ -0,0 +1,154 @@
+# bot/cash_ledger.py
+import threading
+import time
+from dataclasses import dataclass
+from .util import logger
+
+# ------------------------------------------------------------------
+# Libro de reservas de cash por orden (client_order_id). Las compras reservan
+# su coste al enviarse y lo liberan al ejecutarse (el cash baja por lo
+# realmente ejecutado), cancelarse o rechazarse, ya sea por eventos del
+# stream de trade updates o al conciliar con la foto del broker una vez por
+# ciclo. La comprobación previa a cada orden es local y O(1).
+# ------------------------------------------------------------------
+CASH_FRACTION = 0.9     # solo se usa el 90% del cash
+LEDGER_MAX_AGE = 60.0   # segundos sin conciliar antes de volver a leer la cuenta
+RELEASE_EVENTS = ("canceled", "expired", "rejected", "replaced")
+FILL_EVENTS = ("fill", "partial_fill")
+_STATUS_EVENTS = {"filled": "fill", "partially_filled": "partial_fill", "canceled": "canceled",
+                  "expired": "expired", "rejected": "rejected", "replaced": "replaced"}
+
+
+def _value(x) -> str:
+    return getattr(x, "value", x)
+
+
+@dataclass
+class Reservation:
+    side: str
+    amount: float             # cash aún reservado (solo compras)
+    filled_cost: float = 0.0  # importe ya ejecutado (para fills parciales acumulados)
+
+
+class CashLedger:
+    def __init__(self):
+        self.cash = None
+        self.reserved = 0.0
+        self.reservations: dict[str, Reservation] = {}
+        self.reconciled_at = 0.0
+        self._lock = threading.Lock()
+
+    # -------------------- Conciliación -------------------- #
+    def reconcile(self, cash: float, open_order_ids=None, at: float = None):
+        """
+        Fija el cash del broker. Con 'open_order_ids' se liberan las reservas de
+        órdenes que ya no están abiertas (su efecto ya está en ese cash).
+        """
+        with self._lock:
+            self.cash = float(cash)
+            if open_order_ids is not None:
+                open_ids = set(open_order_ids)
+                dropped = [k for k in self.reservations if k not in open_ids]
+                for k in dropped:
+                    del self.reservations[k]
+                if dropped:
+                    logger.debug(f"💵 Ledger: {len(dropped)} reservas liberadas al conciliar")
+            self.reserved = sum(r.amount for r in self.reservations.values())
+            self.reconciled_at = at if at is not None else time.time()
+
+    def reconcile_snapshot(self, snapshot):
+        """
+        Concilia con la foto del ciclo (cash + órdenes abiertas) si es más
+        reciente. Si la foto no pudo leer las órdenes (open_orders None) solo
+        se fija el cash y se mantienen todas las reservas.
+        """
+        if self.cash is not None and snapshot.taken_at <= self.reconciled_at:
+            return  # ya conciliado con esta foto: sus órdenes del ciclo están reservadas
+        ids = None
+        if snapshot.open_orders is not None:
+            ids = {getattr(o, "client_order_id", None) or str(getattr(o, "id", ""))
+                   for orders in snapshot.open_orders.values() for o in orders}
+        self.reconcile(snapshot.cash, ids, at=snapshot.taken_at)
+
+    def refresh(self, client):
+        """Concilia leyendo cuenta y órdenes abiertas (fuera del loop, sin foto)."""
+        from alpaca.trading.requests import GetOrdersRequest
+        from alpaca.trading.enums import QueryOrderStatus
+        cash = float(client.get_account().cash)
+        try:
+            orders = client.get_orders(GetOrdersRequest(status=QueryOrderStatus.OPEN))
+            ids = {o.client_order_id or str(o.id) for o in orders}
+        except Exception as e:
+            logger.warning(f"⚠️ Ledger: no se pudieron leer órdenes abiertas: {e}")
+            ids = None
+        self.reconcile(cash, ids)
+
+    def needs_reconcile(self, max_age: float = LEDGER_MAX_AGE) -> bool:
+        return self.cash is None or time.time() - self.reconciled_at > max_age
+
+    # -------------------- Reservas -------------------- #
+    def available(self, fraction: float = CASH_FRACTION) -> float:
+        return (self.cash or 0.0) * fraction - self.reserved
+
+    def try_reserve(self, order_id: str, amount: float, fraction: float = CASH_FRACTION) -> bool:
+        """Reserva 'amount' para una compra si cabe en el cash disponible (idempotente por orden)."""
+        with self._lock:
+            if order_id in self.reservations:
+                return True  # reintento del mismo ciclo: la reserva ya existe
+            if amount > (self.cash or 0.0) * fraction - self.reserved:
+                return False
+            self.reservations[order_id] = Reservation("buy", amount)
+            self.reserved += amount
+            return True
+
+    def track(self, order_id: str, side: str = "sell"):
+        """Sigue una orden sin reservar cash (ventas: el cash sube al ejecutarse)."""
+        with self._lock:
+            self.reservations.setdefault(order_id, Reservation(side, 0.0))
+
+    def release(self, order_id: str) -> float:
+        with self._lock:
+            r = self.reservations.pop(order_id, None)
+            if r is None:
+                return 0.0
+            self.reserved -= r.amount
+            return r.amount
+
+    # -------------------- Eventos -------------------- #
+    def on_trade_update(self, event: str, order) -> None:
+        """
+        Aplica un evento de orden (stream de trade updates o sondeo):
+        fill/partial_fill mueven el cash por lo ejecutado y consumen la
+        reserva; canceled/expired/rejected/replaced la liberan.
+        """
+        event = _value(event)
+        order_id = getattr(order, "client_order_id", None) or str(getattr(order, "id", ""))
+        if event in RELEASE_EVENTS:
+            self.release(order_id)
+            return
+        if event not in FILL_EVENTS:
+            return
+        with self._lock:
+            r = self.reservations.get(order_id)
+            if r is None:
+                return  # orden ajena: la próxima conciliación la recoge
+            cost = float(getattr(order, "filled_qty", 0) or 0) * float(getattr(order, "filled_avg_price", 0) or 0)
+            new = cost - r.filled_cost
+            r.filled_cost = cost
+            if self.cash is not None:
+                self.cash += -new if r.side == "buy" else new
+            used = min(r.amount, max(new, 0.0))
+            r.amount -= used
+            self.reserved -= used
+            if event == "fill":
+                self.reserved -= r.amount  # lo que sobró de la reserva (precio mejor que el estimado)
+                del self.reservations[order_id]
+
+    def on_submitted(self, order) -> None:
+        """Respuesta de submit_order: si el broker ya la devuelve en un estado final se aplica."""
+        event = _STATUS_EVENTS.get(_value(getattr(order, "status", None)))
+        if event is not None:
+            self.on_trade_update(event, order)
+
+
+ledger = CashLedger()
@@ -0,0 +1,139 @@
+# bot/clients.py
+import threading
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from alpaca.trading.client import TradingClient
+from alpaca.data.historical import StockHistoricalDataClient, CryptoHistoricalDataClient
+from .config import settings
+from .util import logger
+
+# ------------------------------------------------------------------
+# Registro central de clientes Alpaca. Se construyen al primer uso y se
+# reutilizan; todos los clientes con las mismas credenciales comparten una
+# sesión HTTP con pool de conexiones (keep-alive + TLS reutilizado) de
+# tamaño configurable para el uso concurrente del ejecutor de datos.
+# ------------------------------------------------------------------
+_lock = threading.Lock()
+_sessions: dict[tuple, requests.Session] = {}
+_clients: dict[tuple, object] = {}
+
+
+def _credentials() -> tuple[str, str]:
+    return settings.alpaca_api_key, settings.alpaca_secret_key
+
+
+def get_session(api_key: str = None, secret_key: str = None) -> requests.Session:
+    """Sesión HTTP compartida para un juego de credenciales."""
+    creds = (api_key, secret_key) if api_key is not None else _credentials()
+    with _lock:
+        session = _sessions.get(creds)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.http_pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[creds] = session
+        return session
+
+
+def _get(kind: str, factory, *extra):
+    creds = _credentials()
+    key = (kind, *creds, *extra)
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+    client = factory(*creds)
+    # RESTClient (alpaca-py >= 0.44) crea una Session propia en el atributo
+    # privado '_session': se cierra y se sustituye por la compartida. Si una
+    # versión futura lo renombra, el cliente sigue con su propia sesión.
+    own = getattr(client, "_session", None)
+    if isinstance(own, requests.Session):
+        if own is not get_session(*creds):
+            own.close()
+        client._session = get_session(*creds)
+    else:
+        logger.warning(f"⚠️ {type(client).__name__} sin '_session': no comparte el pool HTTP (¿cambió alpaca-py?)")
+    with _lock:
+        return _clients.setdefault(key, client)
+
+
+def get_trading_client() -> TradingClient:
+    paper = settings.mode == "paper"
+    return _get("trading", lambda k, s: TradingClient(api_key=k, secret_key=s, paper=paper), paper)
+
+
+def get_stock_client() -> StockHistoricalDataClient:
+    return _get("stock", lambda k, s: StockHistoricalDataClient(api_key=k, secret_key=s))
+
+
+def get_crypto_client() -> CryptoHistoricalDataClient:
+    return _get("crypto", lambda k, s: CryptoHistoricalDataClient(api_key=k, secret_key=s))
+
+
+@contextmanager
+def use_clients(trading=None, stock=None, crypto=None):
+    """
+    Sustituye temporalmente los clientes del registro por objetos propios con la
+    misma interfaz (broker y datos simulados del modo replay, tests). Al salir
+    se restaura el registro anterior.
+    """
+    creds = _credentials()
+    paper = settings.mode == "paper"
+    with _lock:
+        saved = dict(_clients)
+        for key, client in ((("trading", *creds, paper), trading), (("stock", *creds), stock),
+                            (("crypto", *creds), crypto)):
+            if client is not None:
+                _clients[key] = client
+    try:
+        yield
+    finally:
+        with _lock:
+            _clients.clear()
+            _clients.update(saved)
+
+
+# ------------------------------------------------------------------
+# Instrumentación: urllib3 cuenta conexiones abiertas y peticiones por pool
+# ------------------------------------------------------------------
+def connection_stats() -> dict:
+    """
+    Por host: peticiones, conexiones abiertas y ratio de reutilización
+    (1 - conexiones/peticiones). Incluye un total en la clave "_total".
+    """
+    stats = {}
+    with _lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        adapter = session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            s = stats.setdefault(pool.host, {"requests": 0, "connections": 0})
+            s["requests"] += pool.num_requests
+            s["connections"] += pool.num_connections
+    total = {"requests": sum(s["requests"] for s in stats.values()),
+             "connections": sum(s["connections"] for s in stats.values())}
+    stats["_total"] = total
+    for s in stats.values():
+        s["reuse_ratio"] = 1 - s["connections"] / s["requests"] if s["requests"] else 0.0
+    return stats
+
+
+def log_connection_stats():
+    t = connection_stats()["_total"]
+    logger.info(f"🔌 HTTP Alpaca: {t['requests']} peticiones | {t['connections']} conexiones | "
+                f"reutilización {t['reuse_ratio']:.0%}")
+
+
+def reset():
+    """Cierra sesiones y olvida clientes (tests / cambio de credenciales)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _clients.clear()
@@ -0,0 +1,158 @@
+# bot/compiled_model.py
+import os
+import numpy as np
+import pandas as pd
+from .util import logger
+
+# ------------------------------------------------------------------
+# Bosque "compilado": los árboles de un RandomForest de sklearn aplanados en
+# arrays contiguos (feature, umbral, hijos, probabilidades de hoja) y un
+# predictor en NumPy puro sin la validación de sklearn.
+# Las hojas apuntan a sí mismas, de modo que basta con avanzar 'depth' pasos
+# a la vez en todos los árboles. Como en sklearn, se va a la izquierda si
+# x <= umbral, y un NaN va al hijo que indica missing_go_to_left del nodo.
+# ------------------------------------------------------------------
+
+
+def compiled_path(model_path: str) -> str:
+    """Ruta del artefacto compilado junto al pickle (models/rf_clf.pkl -> models/rf_clf.npz)."""
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+class CompiledForest:
+    """Predictor equivalente a predict_proba/predict de un bosque de clasificación."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, depth, classes, feature_names,
+                 missing_left=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        # missing_left[n]: un NaN en el nodo n va a la izquierda (missing_go_to_left de sklearn)
+        self.missing_left = np.zeros(len(feature), bool) if missing_left is None else np.asarray(missing_left, bool)
+        self.children = np.stack([left, right], axis=1).ravel()  # children[2n + va a la derecha]
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Aplana un RandomForestClassifier/ExtraTreesClassifier ya entrenado."""
+        if not hasattr(model, "estimators_") or getattr(model, "n_outputs_", 1) != 1:
+            raise TypeError(f"Modelo no compilable: {type(model).__name__}")
+        feats, thrs, lefts, rights, values, roots, missing = [], [], [], [], [], [], []
+        offset, depth = 0, 0
+        for est in model.estimators_:
+            t = est.tree_
+            n = t.node_count
+            leaf = t.children_left == -1
+            idx = np.arange(n)
+            feats.append(np.where(leaf, 0, t.feature))
+            thrs.append(np.where(leaf, np.inf, t.threshold))
+            lefts.append(np.where(leaf, idx, t.children_left) + offset)
+            rights.append(np.where(leaf, idx, t.children_right) + offset)
+            # sklearn < 1.3 no admite NaN: sin la columna, a la derecha (como x <= umbral falso)
+            missing.append(np.asarray(getattr(t, "missing_go_to_left", np.zeros(n)), dtype=bool) & ~leaf)
+            v = t.value[:, 0, :]
+            values.append(v / np.clip(v.sum(axis=1, keepdims=True), 1e-300, None))
+            roots.append(offset)
+            offset += n
+            depth = max(depth, t.max_depth)
+        return cls(
+            feature=np.concatenate(feats).astype(np.intp),
+            threshold=np.concatenate(thrs).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            depth=depth,
+            classes=model.classes_,
+            feature_names=getattr(model, "feature_names_in_", [f"x{i}" for i in range(model.n_features_in_)]),
+            missing_left=np.concatenate(missing),
+        )
+
+    # -------------------- Predicción -------------------- #
+    def _matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            names = list(self.feature_names_in_)
+            X = X.to_numpy() if list(X.columns) == names else X[names].to_numpy()
+        elif isinstance(X, dict):
+            X = [[X[f] for f in self.feature_names_in_]]
+        # sklearn compara en float32: se replica para obtener las mismas hojas
+        return np.atleast_2d(np.asarray(X, dtype=np.float32)).astype(np.float64)
+
+    def _go_left(self, x: np.ndarray, node: np.ndarray) -> np.ndarray:
+        """Regla de sklearn en cada nodo: x <= umbral, o NaN y missing_go_to_left."""
+        return (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = self._matrix(X)
+        if len(X) == 1:  # camino rápido para el loop en vivo
+            x, node = X[0], self.roots
+            for _ in range(self.depth):
+                node = self.children[2 * node + ~self._go_left(x[self.feature[node]], node)]
+            return self.value[node].mean(axis=0)[None, :]
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = self._go_left(X[rows, self.feature[node]], node)
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    # -------------------- Persistencia -------------------- #
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            value=self.value, roots=self.roots, depth=self.depth, classes=self.classes_,
+            feature_names=self.feature_names_in_.astype(str), missing_left=self.missing_left,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["feature"], z["threshold"], z["left"], z["right"], z["value"], z["roots"],
+                       z["depth"], z["classes"], z["feature_names"].tolist(),
+                       z["missing_left"] if "missing_left" in z.files else None)
+
+
+def export_compiled(model, model_path: str):
+    """Guarda la versión compilada de 'model' junto a model_path. Devuelve la ruta o None."""
+    try:
+        path = compiled_path(model_path)
+        CompiledForest.from_sklearn(model).save(path)
+        logger.info(f"⚡ Modelo compilado guardado en {path}")
+        return path
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo compilar el modelo: {e}")
+        return None
+
+
+def load_compiled(model_path: str):
+    """Carga el artefacto compilado si existe y no es más antiguo que el pickle; si no, None."""
+    path = compiled_path(model_path)
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(model_path) and os.path.getmtime(path) < os.path.getmtime(model_path):
+        logger.warning(f"⚠️ {path} es anterior a {model_path}; se usa el pickle.")
+        return None
+    try:
+        return CompiledForest.load(path)
+    except Exception as e:
+        logger.warning(f"⚠️ Modelo compilado inválido ({e}); se usa el pickle.")
+        return None
+
+
+if __name__ == "__main__":
+    # Compila el pickle existente: python -m bot.compiled_model
+    import joblib
+    from .config import settings
+    export_compiled(joblib.load(settings.model_path), settings.model_path)
@@ -23,10 +23,28 @@ class Settings(BaseModel):
     stop_loss_pct: float = Field(default_factory=lambda: float(os.getenv("STOP_LOSS_PCT","0.02")))
     trailing_stop_pct: float = Field(default_factory=lambda: float(os.getenv("TRAILING_STOP_PCT","0.01")))
     model_path: str = Field(default_factory=lambda: os.getenv("MODEL_PATH","models/rf_clf.pkl"))
+    compiled_model_enabled: bool = Field(default_factory=lambda: os.getenv("COMPILED_MODEL_ENABLED","true").lower() in ("1","true","yes"))
     state_path: str = Field(default_factory=lambda: os.getenv("STATE_PATH","bot/state.json"))
     log_level: str = Field(default_factory=lambda: os.getenv("LOG_LEVEL","INFO"))
     wfo_train_window: str = Field(default_factory=lambda: os.getenv("WFO_TRAIN_WINDOW","365D"))
     wfo_test_window: str = Field(default_factory=lambda: os.getenv("WFO_TEST_WINDOW","90D"))
+    bar_store_enabled: bool = Field(default_factory=lambda: os.getenv("BAR_STORE_ENABLED","true").lower() in ("1","true","yes"))
+    bar_store_path: str = Field(default_factory=lambda: os.getenv("BAR_STORE_PATH","data/bars"))
+    data_max_workers: int = Field(default_factory=lambda: int(os.getenv("DATA_MAX_WORKERS","8")))
+    data_rate_per_min: float = Field(default_factory=lambda: float(os.getenv("DATA_RATE_PER_MIN","200")))
+    result_cache_enabled: bool = Field(default_factory=lambda: os.getenv("RESULT_CACHE_ENABLED","true").lower() in ("1","true","yes"))
+    result_cache_path: str = Field(default_factory=lambda: os.getenv("RESULT_CACHE_PATH","data/results.db"))
+    order_max_workers: int = Field(default_factory=lambda: int(os.getenv("ORDER_MAX_WORKERS","8")))
+    trade_stream_enabled: bool = Field(default_factory=lambda: os.getenv("TRADE_STREAM_ENABLED","true").lower() in ("1","true","yes"))
+    trade_stream_url: str = Field(default_factory=lambda: os.getenv("TRADE_STREAM_URL",""))
+    trade_stream_resync: float = Field(default_factory=lambda: float(os.getenv("TRADE_STREAM_RESYNC","300")))
+    bar_stream_enabled: bool = Field(default_factory=lambda: os.getenv("BAR_STREAM_ENABLED","false").lower() in ("1","true","yes"))
+    bar_stream_feed: str = Field(default_factory=lambda: os.getenv("BAR_STREAM_FEED","iex"))
+    stock_stream_url: str = Field(default_factory=lambda: os.getenv("STOCK_STREAM_URL",""))
+    crypto_stream_url: str = Field(default_factory=lambda: os.getenv("CRYPTO_STREAM_URL",""))
+    bar_buffer_size: int = Field(default_factory=lambda: int(os.getenv("BAR_BUFFER_SIZE","500")))
+    bar_stream_grace: float = Field(default_factory=lambda: float(os.getenv("BAR_STREAM_GRACE","10")))
+    http_pool_size: int = Field(default_factory=lambda: int(os.getenv("HTTP_POOL_SIZE","16")))
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
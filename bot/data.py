@@ -1,25 +1,157 @@
 # bot/data.py
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 import pandas as pd
-from alpaca.data.historical import StockHistoricalDataClient, CryptoHistoricalDataClient
-from alpaca.data.requests import StockBarsRequest, CryptoBarsRequest
+from alpaca.data.requests import StockBarsRequest, CryptoBarsRequest, StockLatestBarRequest, CryptoLatestBarRequest
 from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 from alpaca.common.exceptions import APIError
 from .config import settings
 from .util import logger
+from . import bar_store
+from . import clients
 
 
 # ------------------------------------------------------------------
-# Clientes autenticados (globales del módulo)
+# Ejecutor concurrente con límite de peticiones (cuota por minuto de Alpaca)
 # ------------------------------------------------------------------
-stock_client = StockHistoricalDataClient(
-    api_key=settings.alpaca_api_key,
-    secret_key=settings.alpaca_secret_key
-)
+PRIORITY_PRICE = 0   # precios del monitor de posiciones: pasan primero
+PRIORITY_BARS = 10   # historia / lotes de velas
 
-crypto_client = CryptoHistoricalDataClient(
-    api_key=settings.alpaca_api_key,
-    secret_key=settings.alpaca_secret_key
-)
+
+class TokenBucket:
+    """
+    Cubo de fichas: 'rate_per_min' fichas por minuto con ráfagas de hasta 'capacity'.
+    acquire() bloquea hasta que hay ficha disponible.
+    """
+
+    def __init__(self, rate_per_min: float, capacity: float | None = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity or max(1.0, rate_per_min / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Consume una ficha. Devuelve los segundos esperados."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class FetchExecutor:
+    """
+    Pool acotado de hilos para peticiones de datos.
+    - 'max_workers' hilos persistentes (se crean con la primera petición).
+    - Cola con prioridad: los precios del monitor adelantan a la historia.
+    - Cada petición consume una ficha del TokenBucket antes de salir; la
+      petición se elige al obtener la ficha, así que una de mayor prioridad
+      que llegue mientras se espera cuota pasa delante.
+    - Registra espera en cola, espera por cuota y duración de cada petición.
+    """
+
+    def __init__(self, max_workers: int = 8, rate_per_min: float = 200, history: int = 500):
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(rate_per_min)
+        self.timings = deque(maxlen=history)
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._gate = threading.Lock()  # un solo hilo espera cuota a la vez
+        self._workers = []
+
+    def submit(self, fn, *args, priority: int = PRIORITY_BARS, label: str | None = None, **kwargs) -> Future:
+        fut = Future()
+        item = (priority, next(self._seq), time.perf_counter(), label or fn.__name__, fn, args, kwargs, fut)
+        with self._cond:
+            heapq.heappush(self._queue, item)
+            self._cond.notify()
+            if not self._workers:
+                for i in range(self.max_workers):
+                    t = threading.Thread(target=self._work, name=f"fetch-worker-{i}", daemon=True)
+                    t.start()
+                    self._workers.append(t)
+        return fut
+
+    def _next(self):
+        """Espera a que haya trabajo y cuota; devuelve (petición más prioritaria, segundos por cuota)."""
+        with self._gate:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            throttled = self.bucket.acquire()
+            with self._cond:  # solo quien tiene el turno saca de la cola: sigue habiendo trabajo
+                return heapq.heappop(self._queue), throttled
+
+    def _work(self):
+        while True:
+            item, throttled = self._next()
+            self._run(item, throttled)
+
+    def _run(self, item, throttled: float):
+        _, _, queued_at, label, fn, args, kwargs, fut = item
+        if not fut.set_running_or_notify_cancel():
+            return
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            error = e
+        # La duración queda registrada antes de resolver el futuro: quien
+        # espera el resultado ya la ve en stats()
+        elapsed = time.perf_counter() - started
+        self.timings.append({
+            "label": label, "wait": started - queued_at, "throttled": throttled,
+            "elapsed": elapsed, "ok": error is None,
+        })
+        logger.debug(f"⏱️ {label}: {elapsed*1000:.0f} ms (cola {(started - queued_at)*1000:.0f} ms)")
+        if error is None:
+            fut.set_result(result)
+        else:
+            fut.set_exception(error)
+
+    def stats(self) -> dict:
+        """Resumen por etiqueta: nº de peticiones, media y máximo (ms)."""
+        out = {}
+        for t in list(self.timings):
+            s = out.setdefault(t["label"], {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = t["elapsed"] * 1000
+            s["count"] += 1
+            s["errors"] += 0 if t["ok"] else 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+        for s in out.values():
+            s["avg_ms"] = s["total_ms"] / s["count"]
+        return out
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> FetchExecutor:
+    """Ejecutor compartido del proceso (se crea al primer uso)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = FetchExecutor(settings.data_max_workers, settings.data_rate_per_min)
+        return _executor
 
 
 # ------------------------------------------------------------------
@@ -36,64 +168,234 @@ def _tf():
     return tf_map.get(settings.bar_timeframe, TimeFrame.Hour)
 
 
+def _bar_delta() -> pd.Timedelta:
+    """Duración de una vela de settings.bar_timeframe."""
+    deltas = {"1Min": "1min", "5Min": "5min", "15Min": "15min", "1Hour": "1h", "1Day": "1D"}
+    return pd.Timedelta(deltas.get(settings.bar_timeframe, "1h"))
+
+
+# Máximo de símbolos por petición (la URL lleva la lista completa)
+MAX_SYMBOLS_PER_REQUEST = 100
+
+
+def _is_crypto(symbol: str) -> bool:
+    return "/" in symbol
+
+
+def _utcnow() -> pd.Timestamp:
+    """Hora actual en UTC (el modo replay la sustituye por su reloj virtual)."""
+    return pd.Timestamp.now(tz="UTC")
+
+
+def _split_frames(df: pd.DataFrame, symbols: list[str]) -> dict[str, pd.DataFrame]:
+    """Separa el MultiIndex (symbol, timestamp) de Alpaca en un frame por símbolo."""
+    out = {s: pd.DataFrame() for s in symbols}
+    if df.empty:
+        return out
+    df = df.rename(columns=str.lower)
+    if not isinstance(df.index, pd.MultiIndex):
+        out[symbols[0]] = df.sort_index()
+        return out
+    for sym, g in df.groupby(level=0, sort=False):
+        if sym in out:
+            out[sym] = g.droplevel(0).sort_index()
+    return out
+
+
 # ------------------------------------------------------------------
 # Descarga de barras con fechas UTC correctas
 # ------------------------------------------------------------------
+def _bars_request(symbols: list[str], start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> dict[str, pd.DataFrame]:
+    """Una petición de velas para símbolos de la misma clase de activo."""
+    if _is_crypto(symbols[0]):
+        req = CryptoBarsRequest(
+            symbol_or_symbols=symbols,
+            start=start_dt,
+            end=end_dt,
+            timeframe=_tf()
+        )
+        return _split_frames(clients.get_crypto_client().get_crypto_bars(req).df, symbols)
+    req = StockBarsRequest(
+        symbol_or_symbols=symbols,
+        start=start_dt,
+        end=end_dt,
+        timeframe=_tf(),
+        adjustment="raw",
+        feed="iex"
+    )
+    return _split_frames(clients.get_stock_client().get_stock_bars(req).df, symbols)
+
+
+def _submit_download(symbols: list[str], start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> list[Future]:
+    """
+    Encola una petición por clase de activo (cripto / acciones) y bloque de
+    MAX_SYMBOLS_PER_REQUEST. alpaca-py recorre la paginación internamente.
+    """
+    ex = get_executor()
+    futures = []
+    for group in ([s for s in symbols if _is_crypto(s)], [s for s in symbols if not _is_crypto(s)]):
+        for i in range(0, len(group), MAX_SYMBOLS_PER_REQUEST):
+            chunk = group[i:i + MAX_SYMBOLS_PER_REQUEST]
+            kind = "crypto" if _is_crypto(chunk[0]) else "stock"
+            futures.append(ex.submit(_bars_request, chunk, start_dt, end_dt, label=f"bars:{kind}"))
+    return futures
+
+
+def _collect(futures: list[Future]) -> dict[str, pd.DataFrame]:
+    """Espera todas las peticiones; las excepciones se propagan al llamador."""
+    out = {}
+    for fut in futures:
+        out.update(fut.result())
+    return out
+
+
+def _download_many(symbols: list[str], start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> dict[str, pd.DataFrame]:
+    """
+    Descarga [start_dt, end_dt] para varios símbolos. Las peticiones de cada
+    clase de activo y bloque salen en paralelo por el ejecutor compartido.
+    Las excepciones se propagan al llamador.
+    """
+    return _collect(_submit_download(symbols, start_dt, end_dt))
+
+
+def _sync_store(symbols: list[str], start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> dict[str, pd.DataFrame]:
+    """
+    Completa el almacén local para [start_dt, end_dt] pidiendo a Alpaca solo
+    lo que falta: el rango entero para los símbolos sin historia, la cabeza
+    [start_dt, covered_from] si se pide más atrás de lo guardado y la cola
+    desde la última vela de cada símbolo (que se vuelve a pedir por si estaba
+    incompleta). La cola nunca empieza antes de una vela antes del rango ya
+    cubierto: un símbolo parado (suspendido, fin de semana) no arrastra al
+    resto hasta su última vela. Los símbolos con el mismo rango comparten lote.
+    """
+    tf = settings.bar_timeframe
+    bar = _bar_delta()
+    batches: dict[tuple, list[str]] = {}  # (desde, hasta) -> símbolos
+
+    for s in symbols:
+        cov = bar_store.coverage(s, tf)
+        if cov is None:
+            batches.setdefault((start_dt, end_dt), []).append(s)
+            continue
+        if start_dt < cov[0]:
+            batches.setdefault((start_dt, cov[0]), []).append(s)
+        if end_dt > cov[1]:
+            last = bar_store.last_timestamp(s, tf)
+            tail_start = cov[1] if last is None else max(last, cov[1] - bar)
+            batches.setdefault((tail_start, end_dt), []).append(s)
+
+    # Todos los lotes salen a la vez
+    jobs = [(lo, hi, syms, _submit_download(syms, lo, hi)) for (lo, hi), syms in batches.items()]
+    for lo, hi, syms, futures in jobs:
+        got = _collect(futures)
+        for s in syms:
+            bar_store.write_bars(s, got.get(s, pd.DataFrame()), lo, hi, tf)
+    if jobs:
+        logger.debug(f"🧩 Almacén sincronizado en {len(jobs)} lotes: "
+                     + ", ".join(f"{len(syms)} desde {lo}" for lo, _, syms, _ in jobs))
+
+    return {s: bar_store.read_bars(s, tf, start_dt, end_dt) for s in symbols}
+
+
+def _fetch_range(symbols: list[str], start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> dict[str, pd.DataFrame]:
+    """Descarga un rango; si falla una clase de activo se devuelve lo guardado en disco."""
+    try:
+        if bar_store.enabled():
+            return _sync_store(symbols, start_dt, end_dt)
+        return _download_many(symbols, start_dt, end_dt)
+    except APIError as e:
+        logger.error(f"❌ Alpaca API error: {e}")
+    except Exception as e:
+        logger.exception(f"💥 Error construyendo petición de datos ({', '.join(symbols)}): {e}")
+    return {s: _stored_fallback(s, start_dt, end_dt) for s in symbols}
+
+
+def fetch_bars_many(symbols: list[str], start: str | None = None, end: str | None = None, min_bars: int = 100) -> dict[str, pd.DataFrame]:
+    """
+    Descarga barras de varios símbolos agrupando las peticiones por clase de activo.
+    Devuelve {símbolo: DataFrame}; los símbolos sin datos quedan con un DataFrame vacío.
+    Si no se da 'start' y algún símbolo tiene pocas velas, retrocede más solo para esos.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    result = {}
+    pending = symbols
+    lookback_days = 365
+
+    while pending:
+        start_dt = pd.Timestamp(start, tz="UTC") if start else (_utcnow() - pd.Timedelta(days=lookback_days))
+        end_dt   = pd.Timestamp(end, tz="UTC") if end else (_utcnow() - pd.Timedelta(minutes=16))
+
+        got = _fetch_range(pending, start_dt, end_dt)
+        short = []
+        for s in pending:
+            bars = got.get(s, pd.DataFrame())
+            result[s] = bars
+            if bars.empty:
+                logger.warning(f"⚠️ No hay datos para {s}")
+            elif len(bars) < min_bars:
+                short.append(s)
+
+        if not short:
+            break
+        if start or lookback_days > 3650:
+            for s in short:
+                logger.warning(f"⚠️ Solo {len(result[s])} velas para {s}, por debajo del mínimo {min_bars}.")
+            break
+        logger.info(f"🔍 Pocas velas para {', '.join(short)}, retrocediendo más...")
+        lookback_days *= 2
+        pending = short
+
+    return {s: result[s] for s in symbols}
+
+
 def fetch_bars(symbol: str, start: str | None = None, end: str | None = None, min_bars: int = 100):
     """
     Descarga barras desde Alpaca. Si hay pocas, retrocede más en el tiempo automáticamente.
     Compatible con acciones y criptos.
+    Con el almacén local activo solo se piden a Alpaca las velas que aún no están en disco.
     """
-    lookback_days = 365
-    bars = pd.DataFrame()
+    return fetch_bars_many([symbol], start, end, min_bars)[symbol]
+
 
-    while True:
-        start_dt = pd.Timestamp(start, tz="UTC") if start else (pd.Timestamp.utcnow() - pd.Timedelta(days=lookback_days))
-        end_dt   = pd.Timestamp(end, tz="UTC") if end else (pd.Timestamp.utcnow() - pd.Timedelta(minutes=16))
+def _stored_fallback(symbol: str, start_dt: pd.Timestamp, end_dt: pd.Timestamp) -> pd.DataFrame:
+    """Si Alpaca falla, devuelve lo que haya en el almacén local (o vacío)."""
+    if not bar_store.enabled():
+        return pd.DataFrame()
+    try:
+        df = bar_store.read_bars(symbol, settings.bar_timeframe, start_dt, end_dt)
+    except Exception:
+        return pd.DataFrame()
+    if not df.empty:
+        logger.warning(f"⚠️ Usando {len(df)} velas locales de {symbol} (Alpaca no disponible)")
+    return df
+
+# ------------------------------------------------------------------
+# Último precio (cola prioritaria, para el monitor de posiciones)
+# ------------------------------------------------------------------
+def _latest_request(symbols: list[str]) -> dict[str, float]:
+    if _is_crypto(symbols[0]):
+        bars = clients.get_crypto_client().get_crypto_latest_bar(CryptoLatestBarRequest(symbol_or_symbols=symbols))
+    else:
+        bars = clients.get_stock_client().get_stock_latest_bar(StockLatestBarRequest(symbol_or_symbols=symbols, feed="iex"))
+    return {s: float(b.close) for s, b in bars.items()}
 
+
+def fetch_latest_prices(symbols: list[str]) -> dict[str, float]:
+    """
+    Cierre de la última vela de 1 minuto para varios símbolos, con prioridad
+    sobre las descargas de historia. Los símbolos que fallen no aparecen.
+    """
+    ex = get_executor()
+    groups = [[s for s in symbols if _is_crypto(s)], [s for s in symbols if not _is_crypto(s)]]
+    futures = [ex.submit(_latest_request, g, priority=PRIORITY_PRICE, label="latest_price") for g in groups if g]
+    out = {}
+    for fut in futures:
         try:
-            if "/" in symbol:  # cripto
-                req = CryptoBarsRequest(
-                    symbol_or_symbols=symbol,
-                    start=start_dt,
-                    end=end_dt,
-                    timeframe=_tf()
-                )
-                df = crypto_client.get_crypto_bars(req).df
-            else:  # acción
-                req = StockBarsRequest(
-                    symbol_or_symbols=symbol,
-                    start=start_dt,
-                    end=end_dt,
-                    timeframe=_tf(),
-                    adjustment="raw",
-                    feed="iex"
-                )
-                df = stock_client.get_stock_bars(req).df
-
-            if df.empty:
-                logger.warning(f"⚠️ No hay datos para {symbol}")
-                return df
-
-            if isinstance(df.index, pd.MultiIndex):
-                df = df.xs(symbol, level=0)
-
-            bars = df.sort_index().rename(columns=str.lower)
-
-        except APIError as e:
-            logger.error(f"❌ Alpaca API error: {e}")
-            return pd.DataFrame()
+            out.update(fut.result())
         except Exception as e:
-            logger.exception(f"💥 Error construyendo petición de datos ({symbol}): {e}")
-            return pd.DataFrame()
+            logger.error(f"❌ No se pudo obtener último precio: {e}")
+    return out
 
-        if len(bars) >= min_bars or lookback_days > 3650:
-            if len(bars) < min_bars:
-                logger.warning(f"⚠️ Solo {len(bars)} velas para {symbol}, por debajo del mínimo {min_bars}.")
-            return bars
-        else:
-            logger.info(f"🔍 Solo {len(bars)} velas para {symbol}, retrocediendo más...")
-            lookback_days *= 2
 
 # ------------------------------------------------------------------
 # Wrapper para obtener las últimas n barras (para alertas)
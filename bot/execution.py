@@ -1,123 +1,69 @@
-from alpaca.trading.client import TradingClient
-from alpaca.trading.requests import MarketOrderRequest
-from alpaca.trading.enums import OrderSide, TimeInForce
 from alpaca.common.exceptions import APIError
 from .config import settings
-from .telegram import alert_trade_entry, alert_trade_exit
+from .clients import get_trading_client
+from .telegram import alert_trade_exit
+from .cash_ledger import ledger
+from .orders import _is_crypto, alert_sent, build_order, log_sent
+from .targets import Target, rebalance
 from .util import logger
-import math
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
-# --- Configuración ---
-MIN_ORDER_NOTIONAL = 10.0  # mínimo en USD para cripto y fraccionales
-
-# Variable para rastrear el cash que hemos reservado localmente
-_reserved_cash = 0.0
-
-
 def _client():
-    return TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
-
-
-def _is_crypto(symbol: str) -> bool:
-    return "/" in symbol or (symbol.endswith("USD") and symbol.isupper() and len(symbol) > 3)
+    return get_trading_client()
 
 
-def _is_fractional_equity(symbol: str, qty: float) -> bool:
-    return not _is_crypto(symbol) and (not float(qty).is_integer())
-
-
-def place_order(symbol: str, qty: float, side: str, price: float, fractional: bool = True, is_crypto: bool = False):
+def place_order(symbol: str, qty: float, side: str, price: float, fractional: bool = True, is_crypto: bool = False,
+                snapshot=None, client_order_id: str = None):
     """
-    Envía una orden de mercado con validación de saldo real.
+    Envía una orden de mercado con validación de saldo contra el ledger de
+    cash (bot.cash_ledger): la comprobación es local y la compra queda
+    reservada hasta que se ejecuta, se cancela o se rechaza.
+    Con 'snapshot' (BrokerSnapshot del ciclo) el ledger se concilia con la
+    foto y la foto se actualiza con la orden enviada; sin ella, con la cuenta
+    cuando la última conciliación ha caducado.
+    Para enviar las órdenes de un ciclo a la vez, ver bot.order_gateway.
     """
-    global _reserved_cash
     client = _client()
-    base_symbol = symbol.replace("/", "")
 
-    if qty < 1e-6:
-        logger.warning(f"⚠️ Cantidad {qty} demasiado pequeña. Skip {symbol}.")
+    ticket = build_order(symbol, qty, side, price, fractional, is_crypto, client_order_id or uuid.uuid4().hex)
+    if ticket is None:
         return
+    order_id = ticket.request.client_order_id
 
     cost = qty * price
 
-    # Validación mínimos
-    if is_crypto and cost < MIN_ORDER_NOTIONAL:
-        logger.warning(f"⚠️ Costo orden ${cost:.2f} < ${MIN_ORDER_NOTIONAL} en cripto. Skip {symbol}.")
-        return
-
-    # Verificar saldo REAL disponible
+    # Verificar saldo disponible (90% del cash menos lo reservado)
     try:
-        account = client.get_account()
-        total_cash = float(account.cash)
-
-        # 🛑 Usa solo el 90% del cash y resta lo ya reservado
-        available_cash = total_cash * 0.9 - _reserved_cash
-
-        if side == "buy" and cost > available_cash:
-            logger.warning(
-                f"⚠️ Saldo real insuficiente: necesitas ${cost:.2f}, solo tienes ${available_cash:.2f} (reservado: {_reserved_cash:.2f}). Skip {symbol}."
-            )
-            return
-
-        # 🔒 Reserva el cash inmediatamente
-        _reserved_cash += cost
+        if snapshot is not None:
+            ledger.reconcile_snapshot(snapshot)
+        elif ledger.needs_reconcile():
+            ledger.refresh(client)
+
+        # 🔒 Reserva el cash de la compra en el mismo paso que la comprobación
+        if side == "buy":
+            if not ledger.try_reserve(order_id, cost):
+                logger.warning(
+                    f"⚠️ Saldo real insuficiente: necesitas ${cost:.2f}, solo tienes ${ledger.available():.2f} (reservado: {ledger.reserved:.2f}). Skip {symbol}."
+                )
+                return
+        else:
+            ledger.track(order_id, side)
     except Exception as e:
         logger.error(f"❌ No se pudo verificar saldo: {e}")
         return
 
-    order_side = OrderSide.BUY if side == "buy" else OrderSide.SELL
-
     try:
-        # Caso 1: CRYPTO → notional + GTC
-        if is_crypto:
-            order = MarketOrderRequest(
-                symbol=base_symbol,
-                notional=round(cost, 2),
-                side=order_side,
-                time_in_force=TimeInForce.GTC,
-            )
-            client.submit_order(order)
-            logger.info(f"✅ Orden CRYPTO enviada: {side.upper()} ${cost:.2f} {symbol}")
-            alert_trade_entry(symbol, side, qty, price, tp_price=None, sl_price=None)
-
-        # Caso 2: FRACTIONAL EQUITY → notional + DAY
-        elif fractional:
-            order = MarketOrderRequest(
-                symbol=base_symbol,
-                notional=round(cost, 2),
-                side=order_side,
-                time_in_force=TimeInForce.DAY,
-            )
-            client.submit_order(order)
-            logger.info(f"✅ Orden FRACTIONAL enviada: {side.upper()} ${cost:.2f} {symbol}")
-            alert_trade_entry(symbol, side, qty, price, tp_price=None, sl_price=None)
-
-        # Caso 3: NON-FRACTIONAL EQUITY → qty entero + GTC
-        else:
-            qty_int = math.floor(qty)
-            if qty_int < 1:
-                logger.warning(f"🚫 Cantidad < 1 para equity no fraccional. Skip {symbol}.")
-                return
-            order = MarketOrderRequest(
-                symbol=base_symbol,
-                qty=qty_int,
-                side=order_side,
-                time_in_force=TimeInForce.GTC,
-            )
-            client.submit_order(order)
-            logger.info(f"✅ Orden EQUITY enviada: {side.upper()} {qty_int} {symbol}")
-            alert_trade_entry(symbol, side, qty_int, price, tp_price=None, sl_price=None)
-
+        submitted = client.submit_order(ticket.request)
+        log_sent(ticket)
+        ledger.on_submitted(submitted)
+        if snapshot is not None:
+            snapshot.apply_order(symbol, ticket.qty, side, price, order=submitted)
     except APIError as e:
         # 🔁 Libera el cash si falla
-        _reserved_cash -= cost
+        ledger.release(order_id)
         if "insufficient balance" in str(e).lower():
             logger.error(f"❌ Saldo insuficiente: {e}")
         elif "invalid crypto time_in_force" in str(e).lower():
@@ -126,13 +72,20 @@ def place_order(symbol: str, qty: float, side: str, price: float, fractional: bo
             logger.error(f"❌ Costo mínimo no alcanzado: {e}")
         else:
             logger.error(f"❌ Error API al enviar orden {symbol}: {e}")
+        return
     except Exception as e:
         # 🔁 Libera el cash si falla
-        _reserved_cash -= cost
+        ledger.release(order_id)
         logger.error(f"❌ Error inesperado al enviar orden {symbol}: {e}")
+        return
+
+    try:
+        alert_sent(ticket)
+    except Exception:
+        logger.warning(f"⚠️ No se pudo enviar alerta de entrada de {symbol}.")
 
 
-def close_position(symbol: str, side: str = None):
+def close_position(symbol: str, side: str = None, snapshot=None):
     """
     Cierra TODA la posición abierta en un símbolo dado usando Alpaca API.
     Usa el método nativo close_position para evitar errores de qty/TIF.
@@ -140,11 +93,17 @@ def close_position(symbol: str, side: str = None):
     client = _client()
     base_symbol = symbol.replace("/", "")
 
-    try:
-        position = client.get_position(base_symbol)
-    except Exception:
-        logger.info(f"No hay posición abierta para {symbol}.")
-        return
+    if snapshot is not None:
+        position = snapshot.position(symbol)
+        if position is None:
+            logger.info(f"No hay posición abierta para {symbol}.")
+            return
+    else:
+        try:
+            position = client.get_position(base_symbol)
+        except Exception:
+            logger.info(f"No hay posición abierta para {symbol}.")
+            return
 
     qty = float(position.qty)
 
@@ -162,6 +121,8 @@ def close_position(symbol: str, side: str = None):
                 exit_price = float(df["close"].iloc[-1])
         except Exception:
             logger.warning(f"⚠️ No se pudo obtener precio de salida para {base_symbol}")
+        if snapshot is not None:
+            snapshot.remove_position(symbol, exit_price or None)
 
         # 🚀 Enviar alerta a Telegram
         try:
@@ -211,7 +172,7 @@ def close_all():
 # --- NUEVO: asignación dinámica de capital según score (positivo: buy, negativo: sell) ---
 
 # --- NUEVO: asignación de capital optimizada con long/short y alertas Telegram ---
-def allocate_and_place_orders(predictions: dict):
+def allocate_and_place_orders(predictions: dict, snapshot=None):
     """
     Distribuye capital y abre/cierra posiciones según scores del modelo.
     predictions: dict con {symbol: score}
@@ -222,8 +183,10 @@ def allocate_and_place_orders(predictions: dict):
     client = _client()
 
     try:
-        account = client.get_account()
-        total_cash = float(account.cash) * 0.9  # usar solo 90% del cash
+        if snapshot is None:
+            from .broker_snapshot import BrokerSnapshot
+            snapshot = BrokerSnapshot.take(client)
+        total_cash = snapshot.cash * 0.9  # usar solo 90% del cash
     except Exception as e:
         logger.error(f"❌ No se pudo obtener cash de la cuenta: {e}")
         return
@@ -236,9 +199,9 @@ def allocate_and_place_orders(predictions: dict):
     total_positive = sum(v for v in predictions.values() if v > 0)
     total_negative = sum(abs(v) for v in predictions.values() if v < 0)
 
+    targets = []
     for sym, score in predictions.items():
         is_crypto = _is_crypto(sym)
-        base_symbol = sym.replace("/", "")
 
         # Obtener último precio
         try:
@@ -252,17 +215,15 @@ def allocate_and_place_orders(predictions: dict):
             logger.warning(f"⚠️ Error al obtener precio de {sym}: {e}")
             continue
 
+        position = snapshot.position(sym)
+        current_qty = float(position.qty) if position else 0.0
+
         # --- SCORE POSITIVO: LONG ---
         if score > 0 and total_positive > 0:
             weight = score / total_positive
-            alloc_cash = total_cash * weight
-            qty = alloc_cash / price
+            qty = total_cash * weight / price
             logger.info(f"📊 LONG {sym}: score={score:.3f}, qty={qty:.6f}")
-            place_order(sym, qty, "buy", price, fractional=True, is_crypto=is_crypto)
-            try:
-                alert_trade_entry(sym, "buy", qty, price, tp_price=None, sl_price=None)
-            except Exception:
-                logger.warning(f"⚠️ No se pudo enviar alerta Telegram LONG {sym}")
+            targets.append(Target(sym, current_qty + qty, price))
 
         # --- SCORE NEGATIVO ---
         elif score < 0 and total_negative > 0:
@@ -270,28 +231,17 @@ def allocate_and_place_orders(predictions: dict):
 
             if is_crypto:
                 # Cripto: solo cerrar long existente
-                try:
-                    position = client.get_position(base_symbol)
-                    current_qty = float(position.qty)
-                    qty_to_sell = current_qty * weight
-                    if qty_to_sell < 1e-6:
-                        continue
-                    logger.info(f"📊 CIERRE PARCIAL {sym} (cripto): qty={qty_to_sell:.6f}")
-                    place_order(sym, qty_to_sell, "sell", price, fractional=True, is_crypto=True)
-                    try:
-                        alert_trade_exit(sym, "flat", qty_to_sell, price, 0.0, 0.0)
-                    except Exception:
-                        logger.warning(f"⚠️ No se pudo enviar alerta Telegram cierre {sym}")
-                except Exception:
+                qty_to_sell = max(current_qty, 0.0) * weight
+                if qty_to_sell < 1e-6:
                     logger.info(f"No hay posición abierta para {sym}, skip venta cripto.")
+                    continue
+                logger.info(f"📊 CIERRE PARCIAL {sym} (cripto): qty={qty_to_sell:.6f}")
+                targets.append(Target(sym, current_qty - qty_to_sell, price))
             else:
                 # Acciones: abrir short
-                alloc_cash = total_cash * weight
-                qty = alloc_cash / price
+                qty = total_cash * weight / price
                 logger.info(f"📊 SHORT {sym}: score={score:.3f}, qty={qty:.6f}")
-                place_order(sym, qty, "sell", price, fractional=True, is_crypto=False)
-                try:
-                    alert_trade_entry(sym, "sell", qty, price, tp_price=None, sl_price=None)
-                except Exception:
-                    logger.warning(f"⚠️ No se pudo enviar alerta Telegram SHORT {sym}")
+                targets.append(Target(sym, current_qty - qty, price))
 
+    # Una orden neta por símbolo (place_order ya envía la alerta de cada una)
+    rebalance(targets, snapshot)
@@ -1,27 +1,24 @@
 # bot/exposure.py
-from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetOrdersRequest
 from alpaca.trading.enums import QueryOrderStatus
-from .config import settings
+from .clients import get_trading_client
+from .broker_snapshot import BrokerSnapshot
 from .util import logger
 
-def get_total_exposure():
+def get_total_exposure(snapshot: BrokerSnapshot = None):
     """
     Calcula la exposición bruta total como porcentaje del equity.
     Ej: 1.2 = 120% del equity en posiciones abiertas.
+    Con 'snapshot' se usa la foto del ciclo y no se llama a Alpaca.
     """
-    client = TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
     try:
-        positions = client.get_all_positions()
-        equity = float(client.get_account().equity)
+        if snapshot is None:
+            snapshot = BrokerSnapshot.take(get_trading_client())
+        equity = snapshot.equity
         if equity <= 0:
             logger.error("Equity <= 0, no se puede calcular exposición")
             return 0.0
-        gross_value = sum(abs(float(pos.market_value)) for pos in positions)
+        gross_value = snapshot.gross_value()
         exposure_ratio = gross_value / equity
         logger.info(f"📊 Exposición bruta: {exposure_ratio:.2f}x (${gross_value:.2f}) | Equity: ${equity:.2f}")
         return exposure_ratio
@@ -30,15 +27,13 @@ def get_total_exposure():
         return 0.0
 
 
-def has_open_order(symbol: str) -> bool:
+def has_open_order(symbol: str, snapshot: BrokerSnapshot = None) -> bool:
     """
     Verifica si hay órdenes abiertas para el símbolo.
     """
-    client = TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
+    if snapshot is not None:
+        return snapshot.has_open_order(symbol)
+    client = get_trading_client()
     base_symbol = symbol.replace("/", "")
     try:
         req = GetOrdersRequest(status=QueryOrderStatus.OPEN, symbols=[base_symbol])
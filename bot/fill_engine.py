@@ -0,0 +1,142 @@
+# bot/fill_engine.py
+import numpy as np
+
+# ------------------------------------------------------------------
+# Motor de "primer paso" para backtests: para cada entrada, primera vela
+# posterior en la que el precio toca el take-profit o el stop-loss.
+# Una tabla dispersa de máximos/mínimos (bloques de 2^k velas) permite saltar
+# por bloques que no tocan el umbral: O(log n) por entrada y todas las
+# entradas a la vez con operaciones vectorizadas, en lugar de recorrer el
+# futuro vela a vela (O(n^2) por símbolo).
+# ------------------------------------------------------------------
+
+
+class ExtremaTable:
+    """
+    Máximos y mínimos en bloques [j, j + 2^k) para consultas de primer cruce.
+    Los máximos se toman de 'x' y los mínimos de 'x_low' (por defecto la misma
+    serie; con velas: ExtremaTable(high, low)).
+    """
+
+    def __init__(self, x, x_low=None):
+        x = np.asarray(x, dtype=float)
+        x_low = x if x_low is None else np.asarray(x_low, dtype=float)
+        self.n = len(x)
+        # NaN nunca cruza un umbral (igual que una comparación con NaN)
+        hi = [np.where(np.isnan(x), -np.inf, x)]
+        lo = [np.where(np.isnan(x_low), np.inf, x_low)]
+        step = 1
+        while 2 * step <= self.n:
+            hi.append(np.maximum(hi[-1][:-step], hi[-1][step:]))
+            lo.append(np.minimum(lo[-1][:-step], lo[-1][step:]))
+            step *= 2
+        self.hi = hi
+        self.lo = lo
+
+    def _first(self, levels, start, skip_block):
+        """Avanza por bloques mientras skip_block(bloque) sea cierto; devuelve n si no hay cruce."""
+        pos = np.asarray(start, dtype=np.int64).copy()
+        for k in range(len(levels) - 1, -1, -1):
+            table = levels[k]
+            step = 1 << k
+            fits = pos + step <= self.n
+            idx = np.minimum(pos, len(table) - 1)
+            pos = np.where(fits & skip_block(table[idx]), pos + step, pos)
+        return np.minimum(pos, self.n)
+
+    def _done(self, pos, threshold):
+        return np.where(np.isnan(threshold), self.n, pos)  # umbral NaN: nunca se toca
+
+    def first_at_or_above(self, start, threshold):
+        """Primer índice >= start con x >= threshold (n si no existe)."""
+        threshold = np.asarray(threshold, dtype=float)
+        return self._done(self._first(self.hi, start, lambda block_max: block_max < threshold), threshold)
+
+    def first_at_or_below(self, start, threshold):
+        """Primer índice >= start con x <= threshold (n si no existe)."""
+        threshold = np.asarray(threshold, dtype=float)
+        return self._done(self._first(self.lo, start, lambda block_min: block_min > threshold), threshold)
+
+
+def first_passage_exits(close, entry_idx, tp, sl, is_long, table: ExtremaTable = None):
+    """
+    Resuelve las salidas TP/SL de todas las entradas en una pasada.
+    Se mira desde la vela siguiente a la entrada; si TP y SL caen en la misma
+    vela gana el TP (mismo orden de comprobación que el bucle original).
+    Devuelve (exit_idx, exit_price, hit_tp); exit_idx = -1 si no sale nunca.
+    """
+    table = table or ExtremaTable(close)
+    entry_idx = np.asarray(entry_idx, dtype=np.int64)
+    tp = np.asarray(tp, dtype=float)
+    sl = np.asarray(sl, dtype=float)
+    is_long = np.asarray(is_long, dtype=bool)
+    start = entry_idx + 1
+
+    # Largo: TP por arriba y SL por abajo; corto al revés
+    up = table.first_at_or_above(start, np.where(is_long, tp, sl))
+    down = table.first_at_or_below(start, np.where(is_long, sl, tp))
+    i_tp = np.where(is_long, up, down)
+    i_sl = np.where(is_long, down, up)
+
+    hit_tp = i_tp <= i_sl
+    exit_idx = np.where(hit_tp, i_tp, i_sl)
+    found = exit_idx < table.n
+    exit_price = np.where(hit_tp, tp, sl)
+    return np.where(found, exit_idx, -1), np.where(found, exit_price, np.nan), hit_tp & found
+
+
+# ------------------------------------------------------------------
+# Ejecución intrabar: los brackets se comprueban contra el máximo y el mínimo
+# de cada vela, no solo contra el cierre.
+# ------------------------------------------------------------------
+TIE_RULES = ("stop", "target", "open")
+
+
+def bracket_exits(open_, high, low, entry_idx, tp, sl, is_long, tie: str = "stop", table: ExtremaTable = None):
+    """
+    Salidas TP/SL con velas OHLC para todas las entradas a la vez (la entrada
+    se ejecuta al cierre de su vela; se mira desde la siguiente).
+    - Largo: TP si high >= tp, SL si low <= sl. Corto al revés.
+    - Hueco: si la vela abre ya más allá de un nivel, se sale a la apertura
+      (peor que el stop / mejor que el objetivo) y ese nivel es el primero.
+    - Vela que toca ambos niveles sin hueco, según 'tie':
+        "stop"   -> SL (pesimista, por defecto)
+        "target" -> TP
+        "open"   -> el nivel más cercano a la apertura
+    Devuelve (exit_idx, exit_price, hit_tp); exit_idx = -1 si no sale nunca.
+    """
+    if tie not in TIE_RULES:
+        raise ValueError(f"Regla de empate desconocida: {tie} (opciones: {TIE_RULES})")
+    open_ = np.asarray(open_, dtype=float)
+    table = table or ExtremaTable(high, low)
+    entry_idx = np.asarray(entry_idx, dtype=np.int64)
+    tp = np.asarray(tp, dtype=float)
+    sl = np.asarray(sl, dtype=float)
+    is_long = np.asarray(is_long, dtype=bool)
+    start = entry_idx + 1
+
+    up = table.first_at_or_above(start, np.where(is_long, tp, sl))
+    down = table.first_at_or_below(start, np.where(is_long, sl, tp))
+    i_tp = np.where(is_long, up, down)
+    i_sl = np.where(is_long, down, up)
+    exit_idx = np.minimum(i_tp, i_sl)
+    found = exit_idx < table.n
+
+    o = open_[np.minimum(exit_idx, table.n - 1)] if table.n else np.full(len(exit_idx), np.nan)
+    direction = np.where(is_long, 1.0, -1.0)
+    gap_tp = (o - tp) * direction >= 0   # abre por encima del TP (largo) / por debajo (corto)
+    gap_sl = (sl - o) * direction >= 0   # abre por debajo del SL (largo) / por encima (corto)
+
+    both = i_tp == i_sl
+    if tie == "stop":
+        tie_tp = np.zeros(len(exit_idx), bool)
+    elif tie == "target":
+        tie_tp = np.ones(len(exit_idx), bool)
+    else:
+        tie_tp = np.abs(o - tp) < np.abs(o - sl)
+    tie_tp = np.where(gap_sl, False, np.where(gap_tp, True, tie_tp))
+    hit_tp = np.where(both, tie_tp, i_tp < i_sl)
+
+    gapped = np.where(hit_tp, gap_tp, gap_sl)
+    exit_price = np.where(gapped, o, np.where(hit_tp, tp, sl))
+    return np.where(found, exit_idx, -1), np.where(found, exit_price, np.nan), hit_tp & found
@@ -0,0 +1,326 @@
+# bot/incremental.py
+import math
+from collections import deque
+import pandas as pd
+from .util import logger, jdump, jload
+
+# ------------------------------------------------------------------
+# Indicadores en streaming: cada vela nueva se procesa en tiempo constante
+# (independiente de la longitud del histórico). Reproducen make_features:
+# EMA con adjust=False, medias/desviaciones móviles con ventana completa.
+# ------------------------------------------------------------------
+NAN = float("nan")
+FEATURE_STATE_FILE = "bot/feature_state.json"
+
+
+def _f(x):
+    """float -> valor serializable en JSON (NaN -> None)."""
+    return None if x is None or (isinstance(x, float) and math.isnan(x)) else x
+
+
+def _nan(x):
+    return NAN if x is None else x
+
+
+class EMA:
+    """Media exponencial con adjust=False: y0 = x0, y = a*x + (1-a)*y."""
+
+    def __init__(self, span: int):
+        self.span = span
+        self.alpha = 2.0 / (span + 1)
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+    def to_state(self) -> dict:
+        return {"value": _f(self.value)}
+
+    def load_state(self, state: dict):
+        self.value = _nan(state["value"])
+
+
+class RollingMean:
+    """Media de las últimas 'window' observaciones (NaN hasta llenar la ventana)."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.buf = deque(maxlen=window)
+        self.total = 0.0
+        self._n = 0
+
+    def update(self, x: float) -> float:
+        if len(self.buf) == self.window:
+            self.total -= self.buf[0]
+        self.buf.append(x)
+        self.total += x
+        self._n += 1
+        if self._n % self.window == 0:  # resincroniza para evitar deriva numérica
+            self.total = math.fsum(self.buf)
+        if len(self.buf) < self.window:
+            return NAN
+        return self.total / self.window
+
+    def to_state(self) -> dict:
+        return {"buf": list(self.buf)}
+
+    def load_state(self, state: dict):
+        self.buf = deque(state["buf"], maxlen=self.window)
+        self.total = math.fsum(self.buf)
+        self._n = 0
+
+
+class RollingStd:
+    """Desviación típica muestral (ddof=1) de las últimas 'window' observaciones."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.buf = deque(maxlen=window)
+        self.s1 = 0.0
+        self.s2 = 0.0
+        self._n = 0
+
+    def update(self, x: float) -> float:
+        if len(self.buf) == self.window:
+            old = self.buf[0]
+            self.s1 -= old
+            self.s2 -= old * old
+        self.buf.append(x)
+        self.s1 += x
+        self.s2 += x * x
+        self._n += 1
+        if self._n % self.window == 0:
+            self.s1 = math.fsum(self.buf)
+            self.s2 = math.fsum(v * v for v in self.buf)
+        n = len(self.buf)
+        if n < self.window:
+            return NAN
+        var = (self.s2 - self.s1 * self.s1 / n) / (n - 1)
+        return math.sqrt(max(var, 0.0))
+
+    def to_state(self) -> dict:
+        return {"buf": list(self.buf)}
+
+    def load_state(self, state: dict):
+        self.buf = deque(state["buf"], maxlen=self.window)
+        self.s1 = math.fsum(self.buf)
+        self.s2 = math.fsum(v * v for v in self.buf)
+        self._n = 0
+
+
+class RSI:
+    """RSI con medias simples de subidas/bajadas (igual que features.rsi)."""
+
+    def __init__(self, period: int = 14):
+        self.prev = NAN
+        self.up = RollingMean(period)
+        self.dn = RollingMean(period)
+
+    def update(self, close: float) -> float:
+        if math.isnan(self.prev):
+            self.prev = close
+            return NAN
+        d = close - self.prev
+        self.prev = close
+        up = self.up.update(max(d, 0.0))
+        dn = self.dn.update(-min(d, 0.0))
+        if math.isnan(up):
+            return NAN
+        rs = up / (dn + 1e-9)
+        return 100 - (100 / (1 + rs))
+
+    def to_state(self) -> dict:
+        return {"prev": _f(self.prev), "up": self.up.to_state(), "dn": self.dn.to_state()}
+
+    def load_state(self, state: dict):
+        self.prev = _nan(state["prev"])
+        self.up.load_state(state["up"])
+        self.dn.load_state(state["dn"])
+
+
+class MACD:
+    """MACD, señal e histograma (igual que features.macd)."""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, close: float):
+        m = self.fast.update(close) - self.slow.update(close)
+        s = self.signal.update(m)
+        return m, s, m - s
+
+    def to_state(self) -> dict:
+        return {"fast": self.fast.to_state(), "slow": self.slow.to_state(), "signal": self.signal.to_state()}
+
+    def load_state(self, state: dict):
+        self.fast.load_state(state["fast"])
+        self.slow.load_state(state["slow"])
+        self.signal.load_state(state["signal"])
+
+
+class ATR:
+    """Media simple del rango verdadero (igual que features.atr)."""
+
+    def __init__(self, period: int = 14):
+        self.prev_close = NAN
+        self.mean = RollingMean(period)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        tr = high - low
+        if not math.isnan(self.prev_close):
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        return self.mean.update(tr)
+
+    def to_state(self) -> dict:
+        return {"prev_close": _f(self.prev_close), "mean": self.mean.to_state()}
+
+    def load_state(self, state: dict):
+        self.prev_close = _nan(state["prev_close"])
+        self.mean.load_state(state["mean"])
+
+
+class IncrementalFeatures:
+    """
+    Versión en streaming de make_features para un símbolo.
+    update(bar) devuelve un dict con la vela y las columnas de FEATURES, o None
+    mientras no haya historia suficiente (las filas que make_features descarta).
+    Si llega otra vez la última vela (vela en formación actualizada), se
+    deshace la anterior y se aplica la nueva.
+    """
+
+    def __init__(self, symbol: str = "UNKNOWN"):
+        self.symbol = symbol
+        self.last_ts = None
+        self.prev_close = NAN
+        self.ema_12 = EMA(12)
+        self.ema_26 = EMA(26)
+        self.rsi_14 = RSI(14)
+        self.macd = MACD()
+        self.atr_14 = ATR(14)
+        self.vol = RollingStd(24)
+        self.last_row = None
+        self._checkpoint = None
+
+    def update(self, bar, ts=None):
+        ts = ts if ts is not None else getattr(bar, "name", None)
+        if ts is not None and self.last_ts is not None:
+            ts = pd.Timestamp(ts)
+            if ts < self.last_ts:
+                return None  # vela antigua: ya procesada
+            if ts == self.last_ts:
+                if self._checkpoint is None:
+                    return self.last_row
+                self.load_state(self._checkpoint)
+        self._checkpoint = self.to_state()
+
+        close = float(bar["close"])
+        ret_1 = close / self.prev_close - 1 if not math.isnan(self.prev_close) else NAN
+        self.prev_close = close
+
+        out = {k: bar[k] for k in ("open", "high", "low", "close", "volume") if k in bar}
+        out["symbol"] = self.symbol
+        out["ret_1"] = ret_1
+        out["ema_12"] = self.ema_12.update(close)
+        out["ema_26"] = self.ema_26.update(close)
+        out["rsi_14"] = self.rsi_14.update(close)
+        out["macd"], out["macd_sig"], out["macd_hist"] = self.macd.update(close)
+        out["atr_14"] = self.atr_14.update(float(bar["high"]), float(bar["low"]), close)
+        out["vol_roll"] = (self.vol.update(ret_1) if not math.isnan(ret_1) else NAN) * (24**0.5)
+        if ts is not None:
+            self.last_ts = pd.Timestamp(ts)
+            out["timestamp"] = self.last_ts
+
+        if any(isinstance(v, float) and math.isnan(v) for v in out.values()):
+            return None
+        self.last_row = out
+        return out
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, symbol: str = "UNKNOWN"):
+        """Calienta los indicadores con un histórico completo (coste O(n) una sola vez)."""
+        eng = cls(symbol)
+        for ts, bar in zip(df.index, df[["open", "high", "low", "close", "volume"]].to_dict("records")):
+            eng.update(bar, ts)
+        return eng
+
+    # -------------------- Serialización -------------------- #
+    def to_state(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "last_ts": self.last_ts.isoformat() if self.last_ts is not None else None,
+            "prev_close": _f(self.prev_close),
+            "ema_12": self.ema_12.to_state(),
+            "ema_26": self.ema_26.to_state(),
+            "rsi_14": self.rsi_14.to_state(),
+            "macd": self.macd.to_state(),
+            "atr_14": self.atr_14.to_state(),
+            "vol": self.vol.to_state(),
+        }
+
+    def load_state(self, state: dict):
+        self.symbol = state["symbol"]
+        self.last_ts = pd.Timestamp(state["last_ts"]) if state["last_ts"] else None
+        self.prev_close = _nan(state["prev_close"])
+        self.ema_12.load_state(state["ema_12"])
+        self.ema_26.load_state(state["ema_26"])
+        self.rsi_14.load_state(state["rsi_14"])
+        self.macd.load_state(state["macd"])
+        self.atr_14.load_state(state["atr_14"])
+        self.vol.load_state(state["vol"])
+
+    @classmethod
+    def from_state(cls, state: dict):
+        eng = cls(state["symbol"])
+        eng.load_state(state)
+        return eng
+
+
+class FeatureEngines:
+    """
+    Motores incrementales por símbolo para el loop en vivo.
+    latest(symbol, df) solo procesa las velas posteriores a la última vista.
+    """
+
+    def __init__(self):
+        self.engines: dict[str, IncrementalFeatures] = {}
+
+    def latest(self, symbol: str, df: pd.DataFrame):
+        """Última fila de features de 'symbol' (dict) o None si no hay historia suficiente."""
+        if df.empty:
+            return None
+        eng = self.engines.get(symbol)
+        if eng is None or eng.last_ts is None or eng.last_ts not in df.index:
+            eng = IncrementalFeatures.from_history(df, symbol)
+            self.engines[symbol] = eng
+            return eng.last_row
+
+        new = df.loc[eng.last_ts:]  # incluye la última vela por si se actualizó
+        for ts, bar in zip(new.index, new[["open", "high", "low", "close", "volume"]].to_dict("records")):
+            eng.update(bar, ts)
+        return eng.last_row
+
+    def save(self, path: str = FEATURE_STATE_FILE):
+        """Guarda el estado de cada símbolo (y el previo a la última vela, para poder rehacerla)."""
+        jdump({s: {"state": e.to_state(), "checkpoint": e._checkpoint} for s, e in self.engines.items()}, path)
+
+    def load(self, path: str = FEATURE_STATE_FILE):
+        states = jload(path, {})
+        try:
+            self.engines = {}
+            for s, st in states.items():
+                eng = IncrementalFeatures.from_state(st["state"])
+                eng._checkpoint = st["checkpoint"]
+                self.engines[s] = eng
+        except Exception as e:
+            logger.warning(f"⚠️ Estado de indicadores inválido, se recalculará: {e}")
+            self.engines = {}
+
+
+engines = FeatureEngines()
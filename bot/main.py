@@ -2,38 +2,39 @@
 import logging
 import time
 from tenacity import retry, wait_exponential, stop_after_attempt
-from alpaca.trading.client import TradingClient
 
 from .auto_tuner import tune_risk_parameters
 from .config import settings
-from .data import fetch_bars
-from .features import make_features
-from .strategy import load_trading_model, hybrid_signal
+from .data import fetch_bars_many
+from .incremental import engines as feature_engines
+from .strategy import load_trading_model, hybrid_signal_batch
 from .sizing import volatility_target_size, kelly_cap
-from .execution import place_order, close_position
+from .execution import close_position
 from .state import BotState
+from .targets import Target, target_from_signal, rebalance
 from .exposure import get_total_exposure
+from .broker_snapshot import BrokerSnapshot
+from .cash_ledger import ledger
 from .telegram import alert_risk_stop, alert_error
 from .position_monitor import monitor_closed_positions
+from .trade_stream import live_order_book, start_trade_stream
+from .bar_stream import BarStream
+from .clients import get_trading_client, log_connection_stats
 from .util import logger
 
 
 logging.basicConfig(level=getattr(logging, settings.log_level.upper(), logging.INFO))
 
-
-def _client():
-    return TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
+LOOP_INTERVAL = 60  # segundos entre iteraciones del loop en vivo
 
 
-def _is_crypto(symbol: str) -> bool:
-    return "/" in symbol or (symbol.endswith("USD") and symbol.isupper() and len(symbol) > 3)
+def _client():
+    return get_trading_client()
 
 
-def _get_position(symbol: str):
+def _get_position(symbol: str, snapshot: BrokerSnapshot = None):
+    if snapshot is not None:
+        return snapshot.position(symbol)
     client = _client()
     try:
         return client.get_open_position(symbol.replace("/", ""))
@@ -42,18 +43,26 @@ def _get_position(symbol: str):
 
 
 @retry(wait=wait_exponential(multiplier=1, min=5, max=60), stop=stop_after_attempt(5))
-def run_once(state: BotState, clf):
+def run_once(state: BotState, clf, symbols: list[str] = None, bars: dict = None):
+    """
+    Un ciclo del bot. Por defecto evalúa todo el universo con velas descargadas;
+    el modo streaming (stream_loop) pasa solo los símbolos que acaban de cerrar
+    vela y sus velas del buffer ('bars'), sin descargar historia.
+    """
     client = _client()
+    streaming = bars is not None
+    symbols = settings.symbols if symbols is None else symbols
 
     # 0. Auto-ajuste
     auto_config = tune_risk_parameters()
     settings.risk_per_trade = auto_config["risk_per_trade"]
     settings.max_gross_exposure = auto_config["max_gross_exposure"]
 
-    # 1. Equity actual
+    # 1. Foto del broker (cuenta, posiciones y órdenes abiertas) para todo el ciclo;
+    # con el stream de trade updates vivo, posiciones y órdenes salen de su libro
     try:
-        account = client.get_account()
-        current_equity = float(account.equity)
+        snapshot = BrokerSnapshot.take(client, book=live_order_book(client))
+        current_equity = snapshot.equity
         state.state["equity"] = current_equity
     except Exception as e:
         logger.error(f"❌ No se pudo obtener equity: {e}")
@@ -70,18 +79,18 @@ def run_once(state: BotState, clf):
 
     # 3. Exposición bruta
     try:
-        current_exposure = get_total_exposure()
+        current_exposure = get_total_exposure(snapshot)
         if current_exposure >= settings.max_gross_exposure:
             logger.critical(f"🛑 Exposición {current_exposure:.2f}x ≥ límite {settings.max_gross_exposure}x. Cerrando posiciones...")
             try:
-                positions = client.get_all_positions()
+                positions = snapshot.all_positions()
                 sorted_positions = sorted(positions, key=lambda p: abs(float(p.qty)), reverse=False)
                 for pos in sorted_positions:
                     qty = float(pos.qty)
                     symbol = pos.symbol
                     side = "long" if qty > 0 else "short"
                     logger.info(f"🔁 Reduciendo exposición: cerrando {abs(qty)} de {symbol}")
-                    close_position(symbol, side)
+                    close_position(symbol, side, snapshot=snapshot)
                     break
             except Exception as e:
                 logger.error(f"❌ No se pudieron obtener posiciones para cierre: {e}")
@@ -90,28 +99,48 @@ def run_once(state: BotState, clf):
         logger.exception("💥 Error al verificar exposición")
         return
 
-    # 4. Cash disponible
+    # 4. Cash disponible: el ledger se concilia con la foto una vez por ciclo
+    # (libera reservas de órdenes ya ejecutadas/canceladas, mantiene las abiertas)
+    ledger.reconcile_snapshot(snapshot)
+    available_cash = snapshot.cash - ledger.reserved
+    logger.info(f"💵 Cash disponible al inicio: ${available_cash:,.2f} (reservado: ${ledger.reserved:,.2f})")
+
+    total_equity = current_equity
+
+    # Velas de todo el universo en un solo lote (una o dos peticiones)
+    if not streaming:
+        bars = fetch_bars_many(symbols, start="2023-01-01")
+
+    # Última fila de features de cada símbolo y una sola inferencia para todos
+    latest_rows = {}
+    for symbol in symbols:
+        try:
+            df = bars[symbol]
+            if df.empty or len(df) < 100:
+                continue
+            latest = feature_engines.latest(symbol, df)
+            if latest is not None:
+                latest_rows[symbol] = latest
+        except Exception as e:
+            logger.warning(f"⚠️ Error al calcular features para {symbol}: {e}")
     try:
-        available_cash = float(client.get_account().cash)
-        logger.info(f"💵 Cash disponible al inicio: ${available_cash:,.2f}")
+        batch_signals = hybrid_signal_batch(latest_rows, clf)
     except Exception as e:
-        logger.warning(f"⚠️ No se pudo obtener cash: {e}")
-        available_cash = 10000.0
+        logger.error(f"❌ Error en señales batch: {e}")
+        batch_signals = {}
 
-    total_equity = current_equity
+    # Posición deseada por símbolo; al final una sola orden neta por símbolo
+    targets = []
 
     # --- 5. BTC/USD 40% ---
     btc_allocation = 0.40
     equity_for_btc = total_equity * btc_allocation
 
-    if "BTC/USD" in settings.symbols:
+    if "BTC/USD" in symbols:
         try:
-            df = fetch_bars("BTC/USD", start="2023-01-01")
-            if not df.empty and len(df) >= 100:
-                feats = make_features(df)
-                latest = feats.iloc[-1]
-
-                sig = hybrid_signal(latest, clf)
+            latest = latest_rows.get("BTC/USD")
+            if latest is not None and "BTC/USD" in batch_signals:
+                sig = batch_signals["BTC/USD"]
                 if sig != 0:
                     price = float(latest["close"])
                     atr = float(latest["atr_14"])
@@ -126,54 +155,29 @@ def run_once(state: BotState, clf):
                     qty = min(qty, max_qty_by_cash)
 
                     if qty >= 1e-6:
-                        is_crypto = True
-                        pos = _get_position("BTC/USD")
-
-                        if pos:
-                            current_qty = float(pos.qty)
-                            if (side == "buy" and current_qty > 0) or (side == "sell" and current_qty < 0):
-                                logger.info(f"🟢 Posición {'larga' if current_qty > 0 else 'corta'} existente en BTC/USD. Aumentando...")
-                                place_order("BTC/USD", qty, side, price, fractional=False, is_crypto=is_crypto)
-                            elif side == "buy" and current_qty < 0:
-                                logger.info("🔄 Cerrando corto y abriendo largo en BTC/USD")
-                                place_order("BTC/USD", abs(current_qty), "buy", price, fractional=False, is_crypto=is_crypto)
-                                place_order("BTC/USD", qty, "buy", price, fractional=False, is_crypto=is_crypto)
-                            elif side == "sell" and current_qty > 0:
-                                logger.info("🔄 Cerrando largo y abriendo corto en BTC/USD")
-                                place_order("BTC/USD", abs(current_qty), "sell", price, fractional=False, is_crypto=is_crypto)
-                                place_order("BTC/USD", qty, "sell", price, fractional=False, is_crypto=is_crypto)
-                        else:
-                            logger.info(f"📈 Abriendo nueva posición en BTC/USD ({'long' if side == 'buy' else 'short'})")
-                            place_order("BTC/USD", qty, side, price, fractional=False, is_crypto=is_crypto)
+                        pos = _get_position("BTC/USD", snapshot)
+                        current_qty = float(pos.qty) if pos else 0.0
+                        targets.append(Target("BTC/USD", target_from_signal(current_qty, qty, side), price))
         except Exception as e:
             logger.error(f"💥 Error procesando BTC/USD: {e}")
 
     # --- 6. Resto de símbolos 60% ---
     equity_for_rest = total_equity * 0.60
-    other_symbols = [s for s in settings.symbols if s != "BTC/USD"]
+    other_symbols = [s for s in symbols if s != "BTC/USD"]
     signals = []
 
     for symbol in other_symbols:
-        try:
-            df = fetch_bars(symbol, start="2023-01-01")
-            if df.empty or len(df) < 100:
-                continue
-            feats = make_features(df)
-            latest = feats.iloc[-1]
-
-            sig = hybrid_signal(latest, clf)
-            if sig == 0:
-                continue
-
-            signals.append({
-                "symbol": symbol,
-                "signal": sig,
-                "features": latest,
-                "price": float(latest["close"]),
-                "atr": float(latest["atr_14"])
-            })
-        except Exception as e:
-            logger.warning(f"⚠️ Error al calcular señal para {symbol}: {e}")
+        latest = latest_rows.get(symbol)
+        sig = batch_signals.get(symbol, 0)
+        if latest is None or sig == 0:
+            continue
+        signals.append({
+            "symbol": symbol,
+            "signal": sig,
+            "features": latest,
+            "price": float(latest["close"]),
+            "atr": float(latest["atr_14"])
+        })
 
     signals.sort(key=lambda x: abs(x["signal"]), reverse=True)
 
@@ -190,36 +194,16 @@ def run_once(state: BotState, clf):
         if qty < 1e-6:
             continue
 
-        is_crypto = _is_crypto(symbol)
-        pos = _get_position(symbol)
-        if pos:
-            current_qty = float(pos.qty)
-            is_long = current_qty > 0
-            is_short = current_qty < 0
-
-            if side == "buy":
-                if is_long:
-                    logger.info(f"🟢 Posición larga existente en {symbol}. Aumentando...")
-                    place_order(symbol, qty, "buy", price, fractional=not is_crypto, is_crypto=is_crypto)
-                elif is_short:
-                    logger.info(f"🔄 Cerrando corto y abriendo largo en {symbol}")
-                    place_order(symbol, abs(current_qty), "buy", price, fractional=not is_crypto, is_crypto=is_crypto)
-                    place_order(symbol, qty, "buy", price, fractional=not is_crypto, is_crypto=is_crypto)
-            else:
-                if is_short:
-                    logger.info(f"🔴 Posición corta existente en {symbol}. Aumentando...")
-                    place_order(symbol, qty, "sell", price, fractional=not is_crypto, is_crypto=is_crypto)
-                elif is_long:
-                    logger.info(f"🔄 Cerrando largo y abriendo corto en {symbol}")
-                    place_order(symbol, abs(current_qty), "sell", price, fractional=not is_crypto, is_crypto=is_crypto)
-                    place_order(symbol, qty, "sell", price, fractional=not is_crypto, is_crypto=is_crypto)
-        else:
-            logger.info(f"📈 Abriendo nueva posición en {symbol}")
-            place_order(symbol, qty, side, price, fractional=not is_crypto, is_crypto=is_crypto)
+        pos = _get_position(symbol, snapshot)
+        current_qty = float(pos.qty) if pos else 0.0
+        targets.append(Target(symbol, target_from_signal(current_qty, qty, side), price))
+
+    # Órdenes netas: un giro es una sola orden, sin quedar plano entre cierre y apertura
+    rebalance(targets, snapshot, cycle_id=state.cycle_id)
 
     # 7. Monitorear cierres
     try:
-        result = monitor_closed_positions(clf)
+        result = monitor_closed_positions(clf, snapshot, bars=bars if streaming else None)
         if result == "STOP":
             return "STOP"
     except Exception as e:
@@ -228,6 +212,8 @@ def run_once(state: BotState, clf):
     # 8. Guardar estado
     try:
         state.save()
+        feature_engines.save()
+        log_connection_stats()
     except Exception as e:
         logger.error(f"❌ No se pudo guardar estado: {e}")
 
@@ -237,6 +223,7 @@ def run_once(state: BotState, clf):
 def main():
     logger.info("🚀 Bot de trading institucional iniciado (modo paper). Ctrl+C para detener.")
     state = BotState()
+    feature_engines.load()
 
     try:
         clf = load_trading_model()
@@ -249,9 +236,28 @@ def main():
         logger.error(f"❌ No se pudo cargar el modelo: {e}")
         return
 
-    while True:
+    if settings.trade_stream_enabled:
         try:
-            result = run_once(state, clf)
+            start_trade_stream()
+        except Exception as e:
+            logger.warning(f"⚠️ Stream de trade updates no disponible, se usará la API REST: {e}")
+
+    if settings.bar_stream_enabled:
+        stream_loop(state, clf)
+    else:
+        loop(state, clf)
+
+
+def loop(state: BotState, clf, sleep=time.sleep, step=run_once, interval: float = LOOP_INTERVAL,
+         keep_running=lambda: True):
+    """
+    Loop principal: un ciclo de 'step' (run_once) y 'interval' segundos de espera.
+    El modo replay pasa un reloj virtual como 'sleep' (ver bot.replay).
+    """
+    while keep_running():
+        state.new_cycle()  # los reintentos de run_once reutilizan el id: sin órdenes duplicadas
+        try:
+            result = step(state, clf)
             if result == "STOP":
                 logger.critical("🛑 Bot detenido por stop diario.")
                 break
@@ -261,8 +267,43 @@ def main():
         except Exception as e:
             logger.exception("💥 Error en el loop principal")
             alert_error("Error en loop principal", str(e))
-        logger.info("⏳ Esperando 60 segundos para próxima iteración...")
-        time.sleep(60)
+        logger.info(f"⏳ Esperando {interval:g} segundos para próxima iteración...")
+        sleep(interval)
+
+
+def stream_loop(state: BotState, clf, stream: BarStream = None, step=run_once, heartbeat: float = LOOP_INTERVAL,
+                keep_running=lambda: True):
+    """
+    Loop por eventos: espera al cierre de velas en el stream de datos y ejecuta
+    'step' solo con los símbolos que acaban de cerrar (las que cierran a la vez,
+    en un mismo ciclo). Sin velas en 'heartbeat' segundos se hace un ciclo sin
+    símbolos: foto, stops de riesgo y guardado de estado.
+    """
+    if stream is None:
+        history = fetch_bars_many(settings.symbols, start="2023-01-01")
+        stream = BarStream(settings.symbols, history=history)
+        stream.start()
+    try:
+        while keep_running():
+            closed = stream.wait(timeout=heartbeat)
+            symbols = list(closed)
+            state.new_cycle()
+            try:
+                result = step(state, clf, symbols=symbols, bars=stream.frames(symbols))
+                if closed:
+                    latency = (time.perf_counter() - min(closed.values())) * 1000
+                    logger.info(f"🕯️ Vela cerrada: {', '.join(symbols)} | señal en {latency:.0f} ms")
+                if result == "STOP":
+                    logger.critical("🛑 Bot detenido por stop diario.")
+                    break
+            except KeyboardInterrupt:
+                logger.info("🛑 Bot detenido por el usuario.")
+                break
+            except Exception as e:
+                logger.exception("💥 Error en el loop por eventos")
+                alert_error("Error en loop por eventos", str(e))
+    finally:
+        stream.stop()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,112 @@
 import argparse, optuna, pandas as pd, numpy as np
-from .data import fetch_bars
-from .features import make_features, ema, rsi, macd, atr
-from .strategy import load_model, hybrid_signal, FEATURES
+from functools import lru_cache
+from .data import fetch_bars_many
+from .features import ema, rsi, atr
+from .strategy import load_trading_model, signal_frame, FEATURES
 from .config import settings
 from .util import logger
+from . import result_cache
 
-def objective(trial: optuna.Trial, symbols, start, end):
+# ------------------------------------------------------------------
+# Datos del estudio: las velas se descargan una vez por estudio y los
+# indicadores se cachean (LRU) por parámetros, así que repetir rsi_len o
+# la combinación MACD en otro trial no cuesta nada.
+# ------------------------------------------------------------------
+INDICATOR_CACHE_SIZE = 256
+
+_BARS: dict[str, pd.DataFrame] = {}
+_MODEL = None
+_STUDY_FP = None  # (huella de velas, huella de modelo) para la caché de resultados
+
+
+def set_study_data(bars: dict[str, pd.DataFrame], model=None):
+    """Fija velas y modelo del estudio y vacía las cachés de indicadores."""
+    global _BARS, _MODEL, _STUDY_FP
+    _BARS = {s: df for s, df in bars.items() if not df.empty}
+    _MODEL = model
+    _STUDY_FP = None
+    for cached in (_ema, _rsi, _macd, _base, _signals):
+        cached.cache_clear()
+
+
+@lru_cache(maxsize=INDICATOR_CACHE_SIZE)
+def _ema(symbol: str, span: int) -> pd.Series:
+    return ema(_BARS[symbol]["close"], span)
+
+
+@lru_cache(maxsize=INDICATOR_CACHE_SIZE)
+def _rsi(symbol: str, length: int) -> pd.Series:
+    return rsi(_BARS[symbol]["close"], length)
+
+
+@lru_cache(maxsize=INDICATOR_CACHE_SIZE)
+def _macd(symbol: str, fast: int, slow: int, sig: int):
+    m = _ema(symbol, fast) - _ema(symbol, slow)
+    s = ema(m, sig)
+    return m, s, m - s
+
+
+@lru_cache(maxsize=None)
+def _base(symbol: str) -> pd.DataFrame:
+    """Columnas que no dependen de los parámetros del trial."""
+    f = _BARS[symbol].copy()
+    f["ret_1"] = f["close"].pct_change()
+    f["ema_12"] = _ema(symbol, 12)
+    f["ema_26"] = _ema(symbol, 26)
+    f["atr_14"] = atr(f, 14)
+    f["vol_roll"] = f["ret_1"].rolling(24).std() * (24**0.5)
+    return f
+
+
+@lru_cache(maxsize=INDICATOR_CACHE_SIZE)
+def _signals(symbol: str, rsi_len: int, macd_fast: int, macd_slow: int, macd_sig: int):
+    """(cierres, señal híbrida) del símbolo con los indicadores del trial (una inferencia batch)."""
+    f = _base(symbol).copy()
+    f["rsi_14"] = _rsi(symbol, rsi_len)
+    f["macd"], f["macd_sig"], f["macd_hist"] = _macd(symbol, macd_fast, macd_slow, macd_sig)
+    f = f.dropna()
+    if f.empty:
+        return np.empty(0), np.empty(0)
+    sig = signal_frame(f, _MODEL)["signal"].to_numpy(dtype=float)  # usa features modificadas
+    return f["close"].to_numpy(dtype=float), sig
+
+
+def _trade_pnl(close: np.ndarray, hs: np.ndarray, thr_entry: float, thr_exit: float,
+               trades: list = None, symbol: str = None) -> float:
+    """
+    Entra si |señal| > thr_entry, sale si señal * posición < thr_exit; cierra al final.
+    Si se pasa 'trades' se añaden las operaciones (symbol, entrada, salida, lado, precios, pnl).
+    """
+    pos = 0; entry = 0.0; entry_i = 0; equity = 0.0
+    for i, (px, h) in enumerate(zip(close.tolist(), hs.tolist())):
+        if pos != 0 and h * pos < thr_exit:
+            equity += pos * (px - entry)
+            if trades is not None: trades.append((symbol, entry_i, i, pos, entry, px, pos * (px - entry)))
+            pos = 0
+        if pos == 0 and abs(h) > thr_entry:
+            pos = 1 if h > 0 else -1; entry = px; entry_i = i
+    if pos != 0:
+        equity += pos * (close[-1] - entry)
+        if trades is not None:
+            trades.append((symbol, entry_i, len(close) - 1, pos, entry, close[-1], pos * (close[-1] - entry)))
+    return equity
+
+
+def _result_key(params: dict, symbols) -> str:
+    global _STUDY_FP
+    if _STUDY_FP is None:
+        _STUDY_FP = (result_cache.data_fingerprint(_BARS), result_cache.model_fingerprint(_MODEL))
+    return result_cache.result_key("optimizer", _STUDY_FP[0], {**params, "symbols": list(symbols)}, _STUDY_FP[1])
+
+
+def _report(trial: optuna.Trial, pnl: float, step: int):
+    # P&L acumulado por símbolo: el pruner corta los trials que van por debajo de la mediana
+    trial.report(pnl, step)
+    if trial.should_prune():
+        raise optuna.TrialPruned()
+
+
+def objective(trial: optuna.Trial, symbols):
     # Tune thresholds and MACD/RSI params used downstream by signals (simple inline mod)
     macd_fast = trial.suggest_int("macd_fast", 8, 18)
     macd_slow = trial.suggest_int("macd_slow", 20, 30)
@@ -14,34 +115,39 @@ def objective(trial: optuna.Trial, symbols, start, end):
     thr_entry = trial.suggest_float("thr_entry", 0.3, 0.7)
     thr_exit  = trial.suggest_float("thr_exit", -0.7, -0.3)
 
-    pnl = 0.0
-    for s in symbols:
-        df = fetch_bars(s, start, end)
-        if df.empty: continue
-        f = df.copy()
-        f["ret_1"] = f["close"].pct_change()
-        f["ema_12"] = ema(f["close"], 12)
-        f["ema_26"] = ema(f["close"], 26)
-        f["rsi_14"] = rsi(f["close"], rsi_len)
-        m, sig, h = macd(f["close"], macd_fast, macd_slow, macd_sig)
-        f["macd"], f["macd_sig"], f["macd_hist"] = m, sig, h
-        f["atr_14"] = atr(f, 14)
-        f["vol_roll"] = f["ret_1"].rolling(24).std() * (24**0.5)
-        f = f.dropna()
-        clf = load_model()
-        pos = 0; entry=0; equity=0
-        for _, row in f.iterrows():
-            hs = hybrid_signal(row, clf)  # usa features modificadas
-            if pos!=0 and hs*pos < thr_exit: equity += pos*(row["close"]-entry); pos=0
-            if pos==0 and abs(hs) > thr_entry:
-                pos = 1 if hs>0 else -1; entry = row["close"]
-        if pos!=0: equity += pos*(f.iloc[-1]["close"]-entry)
-        pnl += equity
+    # Misma combinación ya evaluada (en este u otro estudio): se reproducen sus reports
+    key = None
+    if result_cache.enabled():
+        key = _result_key(trial.params, symbols)
+        hit = result_cache.lookup(key)
+        if hit is not None:
+            for step, pnl in hit["equity_curve"].items():
+                _report(trial, pnl, int(step))
+            return hit["metrics"]["pnl"]
+
+    pnl, steps, trades = 0.0, {}, [] if key else None
+    for step, s in enumerate(symbols):
+        if s not in _BARS: continue
+        close, hs = _signals(s, rsi_len, macd_fast, macd_slow, macd_sig)
+        if len(close): pnl += _trade_pnl(close, hs, thr_entry, thr_exit, trades, s)
+        steps[step] = pnl
+        _report(trial, pnl, step)
+    if key:
+        result_cache.store(key, "optimizer", trial.params, {"pnl": pnl}, pd.Series(steps, dtype=float),
+                           pd.DataFrame(trades, columns=["symbol", "entry_idx", "exit_idx", "side",
+                                                         "entry_price", "exit_price", "pnl"]))
     return pnl
 
 def run(symbols, start, end, n_trials):
-    study = optuna.create_study(direction="maximize")
-    study.optimize(lambda t: objective(t, symbols, start, end), n_trials=n_trials)
+    bars = fetch_bars_many(symbols, start, end)  # una descarga por estudio
+    set_study_data(bars, load_trading_model())
+    study = optuna.create_study(
+        direction="maximize",
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=0),
+    )
+    study.optimize(lambda t: objective(t, symbols), n_trials=n_trials)
+    info = _signals.cache_info()
+    logger.info(f"🧮 Caché de señales: {info.hits} aciertos / {info.misses} cálculos")
     print("Best params:", study.best_trial.params)
     return study.best_trial.params
 
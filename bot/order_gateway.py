@@ -0,0 +1,153 @@
+# bot/order_gateway.py
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from .config import settings
+from .clients import get_trading_client
+from .orders import OrderTicket, alert_sent, log_sent, rejection_reason
+from .util import logger
+
+# ------------------------------------------------------------------
+# Pasarela de órdenes: las órdenes de un ciclo salen a la vez por un pool de
+# hilos (las patas de un mismo símbolo, en orden, en el mismo hilo), así que
+# el tiempo desde la decisión hasta la última orden es ~un viaje de ida y
+# vuelta en lugar de N. Cada orden lleva un client_order_id determinista por
+# (ciclo, símbolo, pata): si tenacity reintenta run_once, Alpaca rechaza la
+# repetición como duplicada en lugar de ejecutarla dos veces. Las alertas de
+# Telegram salen en segundo plano, fuera del camino crítico.
+# ------------------------------------------------------------------
+ORDER_ID_PREFIX = "ptb"
+DUPLICATE_MARKERS = ("client_order_id must be unique", "duplicate client_order_id")
+
+
+def new_cycle_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def client_order_id(cycle_id: str, symbol: str, leg: int = 0) -> str:
+    """Id estable para la pata 'leg' de 'symbol' en el ciclo 'cycle_id' (≤ 48 caracteres)."""
+    digest = hashlib.sha1(f"{cycle_id}|{symbol}|{leg}".encode()).hexdigest()[:12]
+    return f"{ORDER_ID_PREFIX}-{cycle_id}-{symbol.replace('/', '')[:12]}-{digest}"
+
+
+@dataclass
+class OrderResult:
+    ticket: OrderTicket
+    ok: bool
+    order: object = None
+    latency_ms: float = 0.0
+    reason: str = None
+    duplicate: bool = False
+
+
+class OrderGateway:
+    """
+    submit(chains): cada cadena es la lista de patas de un símbolo; las cadenas
+    salen en paralelo y dentro de una cadena se para en el primer rechazo.
+    Guarda latencia y motivo de rechazo de las últimas 'history' órdenes.
+    """
+
+    def __init__(self, max_workers: int = None, history: int = 1000):
+        self.max_workers = max_workers or settings.order_max_workers
+        self.results = deque(maxlen=history)
+        self._pool = None
+        self._alerts = None
+        self._lock = threading.Lock()
+
+    def _pools(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="orders")
+                self._alerts = ThreadPoolExecutor(1, thread_name_prefix="order-alerts")
+            return self._pool, self._alerts
+
+    def _send(self, client, ticket: OrderTicket) -> OrderResult:
+        t0 = time.perf_counter()
+        try:
+            order = client.submit_order(ticket.request)
+            return OrderResult(ticket, True, order, (time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            reason = rejection_reason(e)
+            duplicate = any(m in reason.lower() for m in DUPLICATE_MARKERS)
+            return OrderResult(ticket, False, None, (time.perf_counter() - t0) * 1000, reason, duplicate)
+
+    def _send_chain(self, client, chain: list[OrderTicket]) -> list[OrderResult]:
+        out = []
+        for ticket in chain:
+            result = self._send(client, ticket)
+            out.append(result)
+            if not result.ok:
+                break  # la pata siguiente depende de esta (cierre antes de apertura)
+        return out
+
+    def submit(self, chains: list[list[OrderTicket]], client=None) -> list[OrderResult]:
+        """Envía todas las cadenas a la vez y devuelve los resultados en el orden de entrada."""
+        chains = [c for c in chains if c]
+        if not chains:
+            return []
+        client = client or get_trading_client()
+        pool, alerts = self._pools()
+        t0 = time.perf_counter()
+        futures = [pool.submit(self._send_chain, client, chain) for chain in chains]
+        results = [r for fut in futures for r in fut.result()]
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        for r in results:
+            self.results.append(r)
+            if r.ok:
+                log_sent(r.ticket)
+                alerts.submit(self._alert, r.ticket)
+            elif r.duplicate:
+                logger.warning(f"♻️ Orden ya enviada en este ciclo ({r.ticket.request.client_order_id}). Skip {r.ticket.symbol}.")
+            else:
+                logger.error(f"❌ Orden rechazada {r.ticket.symbol}: {r.reason}")
+        slowest = max(r.latency_ms for r in results)
+        logger.info(f"⏱️ {len(results)} órdenes en {elapsed:.0f} ms (la más lenta {slowest:.0f} ms, "
+                    f"{sum(not r.ok for r in results)} rechazadas)")
+        return results
+
+    @staticmethod
+    def _alert(ticket: OrderTicket):
+        try:
+            alert_sent(ticket)
+        except Exception:
+            logger.warning(f"⚠️ No se pudo enviar alerta de entrada de {ticket.symbol}.")
+
+    def stats(self) -> dict:
+        """Órdenes, rechazos, latencia media/máxima (ms) y motivos de rechazo más frecuentes."""
+        results = list(self.results)
+        if not results:
+            return {"orders": 0, "rejected": 0, "duplicates": 0, "avg_ms": 0.0, "max_ms": 0.0, "reasons": {}}
+        latencies = [r.latency_ms for r in results]
+        return {
+            "orders": len(results),
+            "rejected": sum(not r.ok for r in results),
+            "duplicates": sum(r.duplicate for r in results),
+            "avg_ms": sum(latencies) / len(latencies),
+            "max_ms": max(latencies),
+            "reasons": dict(Counter(r.reason for r in results if not r.ok).most_common(5)),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            for pool in (self._pool, self._alerts):
+                if pool is not None:
+                    pool.shutdown(wait=True)
+            self._pool = self._alerts = None
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> OrderGateway:
+    """Pasarela compartida del proceso (se crea al primer uso)."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = OrderGateway()
+        return _gateway
@@ -0,0 +1,100 @@
+# bot/orders.py
+import math
+from dataclasses import dataclass
+from alpaca.common.exceptions import APIError
+from alpaca.trading.enums import OrderSide, TimeInForce
+from alpaca.trading.requests import MarketOrderRequest
+from .telegram import alert_trade_entry
+from .util import logger
+
+# ------------------------------------------------------------------
+# Construcción de órdenes de mercado (validación de mínimos y tipo de orden),
+# sin saldo ni envío. La usan el envío orden a orden (bot.execution), el
+# neteo por objetivos (bot.targets), la pasarela (bot.order_gateway) y el
+# monitor de posiciones; no importa ninguno de ellos.
+# ------------------------------------------------------------------
+MIN_ORDER_NOTIONAL = 10.0  # mínimo en USD para cripto y fraccionales
+
+
+def _is_crypto(symbol: str) -> bool:
+    return "/" in symbol or (symbol.endswith("USD") and symbol.isupper() and len(symbol) > 3)
+
+
+def _is_fractional_equity(symbol: str, qty: float) -> bool:
+    return not _is_crypto(symbol) and (not float(qty).is_integer())
+
+
+@dataclass
+class OrderTicket:
+    """Orden de mercado ya validada y construida, lista para enviar."""
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    is_crypto: bool
+    kind: str  # CRYPTO | FRACTIONAL | EQUITY
+    request: MarketOrderRequest
+
+    @property
+    def cost(self) -> float:
+        return self.qty * self.price
+
+
+def build_order(symbol: str, qty: float, side: str, price: float, fractional: bool = True,
+                is_crypto: bool = False, client_order_id: str = None):
+    """
+    Valida mínimos y construye la MarketOrderRequest (sin saldo ni envío).
+    Devuelve un OrderTicket o None si la orden no se debe enviar.
+    """
+    if qty < 1e-6:
+        logger.warning(f"⚠️ Cantidad {qty} demasiado pequeña. Skip {symbol}.")
+        return None
+
+    cost = qty * price
+    if is_crypto and cost < MIN_ORDER_NOTIONAL:
+        logger.warning(f"⚠️ Costo orden ${cost:.2f} < ${MIN_ORDER_NOTIONAL} en cripto. Skip {symbol}.")
+        return None
+
+    base_symbol = symbol.replace("/", "")
+    order_side = OrderSide.BUY if side == "buy" else OrderSide.SELL
+
+    # Las ventas van por cantidad: el notional redondeado puede pedir más de lo
+    # que hay al cerrar una posición (y el exceso sería un corto no permitido)
+    fractional_size = {"qty": math.floor(qty * 1e9) / 1e9} if side == "sell" else {"notional": round(cost, 2)}
+
+    # Caso 1: CRYPTO → notional + GTC
+    if is_crypto:
+        kind, sizing, tif = "CRYPTO", fractional_size, TimeInForce.GTC
+    # Caso 2: FRACTIONAL EQUITY → notional + DAY
+    elif fractional:
+        kind, sizing, tif = "FRACTIONAL", fractional_size, TimeInForce.DAY
+    # Caso 3: NON-FRACTIONAL EQUITY → qty entero + GTC
+    else:
+        qty = math.floor(qty)
+        if qty < 1:
+            logger.warning(f"🚫 Cantidad < 1 para equity no fraccional. Skip {symbol}.")
+            return None
+        kind, sizing, tif = "EQUITY", {"qty": qty}, TimeInForce.GTC
+
+    request = MarketOrderRequest(symbol=base_symbol, side=order_side, time_in_force=tif,
+                                 client_order_id=client_order_id, **sizing)
+    return OrderTicket(symbol, side, qty, price, is_crypto, kind, request)
+
+
+def log_sent(ticket: OrderTicket):
+    if ticket.kind == "EQUITY":
+        logger.info(f"✅ Orden EQUITY enviada: {ticket.side.upper()} {ticket.qty} {ticket.symbol}")
+    else:
+        logger.info(f"✅ Orden {ticket.kind} enviada: {ticket.side.upper()} ${ticket.cost:.2f} {ticket.symbol}")
+
+
+def alert_sent(ticket: OrderTicket):
+    alert_trade_entry(ticket.symbol, ticket.side, ticket.qty, ticket.price)
+
+
+def rejection_reason(e: Exception) -> str:
+    """Mensaje de rechazo de Alpaca (APIError trae JSON con 'message')."""
+    try:
+        return e.message if isinstance(e, APIError) else str(e)
+    except Exception:
+        return str(e)
@@ -0,0 +1,190 @@
+# bot/panel.py
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from .strategy import FEATURES
+
+# ------------------------------------------------------------------
+# Features en modo panel: arrays 2-D (tiempo x símbolo) alineados sobre la
+# unión de timestamps. Todas las columnas de FEATURES se calculan de una vez
+# para todo el universo con operaciones vectorizadas.
+#
+# Historias irregulares (cripto 24/7 frente a sesiones de acciones): cada
+# símbolo se "compacta" (sus velas presentes arriba, en orden), se calcula
+# sobre esa serie y se devuelve a su sitio. Así los huecos no cuentan como
+# velas y el resultado coincide con make_features símbolo a símbolo.
+# ------------------------------------------------------------------
+OHLCV = ["open", "high", "low", "close", "volume"]
+COLUMNS = OHLCV + FEATURES
+
+
+@dataclass
+class FeaturePanel:
+    """
+    Resultado compacto respaldado por un único array:
+    values[t, s, f] con columnas COLUMNS; valid[t, s] marca las filas que
+    make_features conservaría (vela presente y sin NaN).
+    En memoria cada serie (símbolo, columna) es contigua en el tiempo.
+    """
+    index: pd.DatetimeIndex
+    symbols: list[str]
+    columns: list[str]
+    values: np.ndarray
+    valid: np.ndarray
+
+    def column(self, name: str) -> np.ndarray:
+        """Vista (T, S) de una columna."""
+        return self.values[:, :, self.columns.index(name)]
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """DataFrame de un símbolo con solo sus filas válidas (como make_features)."""
+        j = self.symbols.index(symbol)
+        mask = self.valid[:, j]
+        return pd.DataFrame(self.values[mask, j, :], index=self.index[mask], columns=self.columns)
+
+    def frames(self) -> dict[str, pd.DataFrame]:
+        return {s: self.frame(s) for s in self.symbols}
+
+
+def align_frames(frames: dict[str, pd.DataFrame]):
+    """
+    Alinea frames OHLCV sobre la unión de timestamps.
+    Devuelve (index, symbols, {col: array (T, S)}, present (T, S)).
+    """
+    frames = {s: f for s, f in frames.items() if not f.empty}
+    symbols = list(frames)
+    if not symbols:
+        return pd.DatetimeIndex([]), [], {c: np.empty((0, 0)) for c in OHLCV}, np.empty((0, 0), bool)
+    index = frames[symbols[0]].index
+    if not all(f.index.equals(index) for f in frames.values()):
+        index = index.append([f.index for f in frames.values()]).unique().sort_values()
+    # (S, T) en C -> su traspuesta (T, S) tiene cada símbolo contiguo en el tiempo
+    arrays = {c: np.full((len(symbols), len(index)), np.nan) for c in OHLCV}
+    for j, s in enumerate(symbols):
+        f = frames[s]
+        rows = slice(None) if f.index.equals(index) else index.get_indexer(f.index)
+        for c in OHLCV:
+            if c in f.columns:
+                arrays[c][j, rows] = f[c].to_numpy(dtype=float)
+    arrays = {c: a.T for c, a in arrays.items()}
+    present = np.isfinite(arrays["close"])
+    return index, symbols, arrays, present
+
+
+# Los núcleos trabajan con arrays (S, T): el tiempo es el eje contiguo.
+def _shift(x: np.ndarray) -> np.ndarray:
+    out = np.empty_like(x)
+    out[:, 0] = np.nan
+    out[:, 1:] = x[:, :-1]
+    return out
+
+
+def _ema(x: np.ndarray, span: int) -> np.ndarray:
+    """EMA con adjust=False a lo largo del tiempo (y0 = x0)."""
+    a = 2.0 / (span + 1)
+    if x.shape[1] == 0:
+        return x.copy()
+    zi = (1 - a) * x[:, :1]
+    y, _ = lfilter([a], [1, -(1 - a)], x, axis=1, zi=zi)
+    return y
+
+
+def _window_sum(x: np.ndarray, window: int):
+    """Suma móvil por diferencias de acumulados; NaN si falta algún valor en la ventana."""
+    out = np.full_like(x, np.nan)
+    if x.shape[1] < window:
+        return out
+    nan = np.isnan(x)
+    cs = np.cumsum(np.where(nan, 0.0, x), axis=1)
+    cn = np.cumsum(nan, axis=1)
+    out[:, window - 1] = cs[:, window - 1]
+    out[:, window:] = cs[:, window:] - cs[:, :-window]
+    bad = np.empty(x.shape, bool)
+    bad[:, :window - 1] = True
+    bad[:, window - 1] = cn[:, window - 1] > 0
+    bad[:, window:] = (cn[:, window:] - cn[:, :-window]) > 0
+    out[bad] = np.nan
+    return out
+
+
+def _rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    return _window_sum(x, window) / window
+
+
+def _rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    """Desviación típica muestral (ddof=1) móvil."""
+    s1 = _window_sum(x, window)
+    s2 = _window_sum(x * x, window)
+    var = (s2 - s1 * s1 / window) / (window - 1)
+    return np.sqrt(np.clip(var, 0.0, None))
+
+
+def panel_features(index, symbols, open_, high, low, close, volume=None, present=None) -> FeaturePanel:
+    """
+    Calcula todas las columnas de FEATURES para arrays (T, S) alineados.
+    'present' marca las velas que existen para cada símbolo (por defecto: close finito).
+    """
+    close = np.asarray(close, dtype=float)
+    T, S = close.shape
+    volume = np.full((T, S), np.nan) if volume is None else np.asarray(volume, dtype=float)
+    present = np.isfinite(close) if present is None else (np.asarray(present, bool) & np.isfinite(close))
+    if T == 0 or S == 0:
+        empty = np.empty((T, S, len(COLUMNS)))
+        return FeaturePanel(pd.DatetimeIndex(index), list(symbols), list(COLUMNS), empty, np.zeros((T, S), bool))
+    raw = [np.ascontiguousarray(np.asarray(a, dtype=float).T) for a in (open_, high, low, close, volume)]
+    pres = present.T
+
+    # Compactar: velas presentes al principio en orden temporal, huecos al final.
+    # Si no hay huecos (universo homogéneo) no hace falta mover nada.
+    ragged = not pres.all()
+    if ragged:
+        order = np.argsort(~pres, axis=1, kind="stable")
+        keep = np.arange(T)[None, :] < pres.sum(axis=1)[:, None]
+        raw = [np.where(keep, np.take_along_axis(a, order, axis=1), np.nan) for a in raw]
+    o, h, l, c, v = raw
+
+    prev_c = _shift(c)
+    ret_1 = c / prev_c - 1
+    ema_12 = _ema(c, 12)
+    ema_26 = _ema(c, 26)
+
+    d = c - prev_c
+    up = _rolling_mean(np.clip(d, 0, None), 14)
+    dn = _rolling_mean(-np.clip(d, None, 0), 14)
+    rsi_14 = 100 - (100 / (1 + up / (dn + 1e-9)))
+
+    macd = ema_12 - ema_26
+    macd_sig = _ema(macd, 9)
+    macd_hist = macd - macd_sig
+
+    tr = np.fmax(np.fmax(h - l, np.abs(h - prev_c)), np.abs(l - prev_c))
+    atr_14 = _rolling_mean(tr, 14)
+    vol_roll = _rolling_std(ret_1, 24) * (24**0.5)
+
+    cols = {
+        "open": o, "high": h, "low": l, "close": c, "volume": v,
+        "ret_1": ret_1, "ema_12": ema_12, "ema_26": ema_26, "rsi_14": rsi_14,
+        "macd": macd, "macd_sig": macd_sig, "macd_hist": macd_hist,
+        "atr_14": atr_14, "vol_roll": vol_roll,
+    }
+
+    # Buffer (F, S, T): cada serie contigua; values es su vista (T, S, F)
+    buf = np.empty((len(COLUMNS), S, T))
+    valid = pres.copy()
+    for k, name in enumerate(COLUMNS):
+        col = cols[name]
+        if ragged:
+            np.put_along_axis(buf[k], order, np.where(keep, col, np.nan), axis=1)  # vuelve a su timestamp
+        else:
+            buf[k] = col
+        if name != "volume":
+            valid &= np.isfinite(buf[k])
+    values = buf.transpose(2, 1, 0)
+    return FeaturePanel(pd.DatetimeIndex(index), list(symbols), list(COLUMNS), values, valid.T)
+
+
+def make_panel(frames: dict[str, pd.DataFrame]) -> FeaturePanel:
+    """make_features para todo un universo de una vez (frames OHLCV por símbolo)."""
+    index, symbols, a, present = align_frames(frames)
+    return panel_features(index, symbols, a["open"], a["high"], a["low"], a["close"], a["volume"], present)
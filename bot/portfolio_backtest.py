@@ -1,31 +1,35 @@
 import argparse, pandas as pd, numpy as np
-from .data import fetch_bars
-from .features import make_features
-from .strategy import load_model, hybrid_signal
+from .data import fetch_bars_many
+from .panel import make_panel
+from .strategy import load_trading_model, signal_frame
+from .fill_engine import ExtremaTable, bracket_exits
 from .config import settings
 from .util import logger
+from . import result_cache
 
 def _concat_symbols(symbols, start, end):
     frames = {}
+    bars = fetch_bars_many(symbols, start, end)
     for s in symbols:
-        df = fetch_bars(s, start, end)
-        if df.empty: logger.warning(f"No data {s}"); continue
-        f = make_features(df); f["symbol"] = s; frames[s] = f
+        if bars[s].empty: logger.warning(f"No data {s}")
+    panel = make_panel(bars)
+    for s in panel.symbols:
+        f = panel.frame(s); f["symbol"] = s; frames[s] = f
     return frames
 
-def backtest_vectorbt(frames: dict[str, pd.DataFrame]):
+def backtest_vectorbt(frames: dict[str, pd.DataFrame], details: bool = False):
     try:
         import vectorbt as vbt  # heavy, optional
     except Exception:
         logger.warning("vectorbt no disponible; usando backtester simple.")
-        return backtest_simple(frames)
+        return backtest_simple(frames)  # ya incluye curva y operaciones
 
     # Build wide price and signals
     closes = pd.concat({s: f["close"] for s,f in frames.items()}, axis=1).dropna()
-    clf = load_model()
+    clf = load_trading_model()
     sigs = {}
     for s,f in frames.items():
-        sig = f.apply(lambda r: hybrid_signal(r, clf), axis=1)
+        sig = signal_frame(f, clf)["signal"]
         sigs[s] = sig.reindex(closes.index).fillna(0)
     sigs = pd.concat(sigs, axis=1).reindex(closes.index).fillna(0)
 
@@ -42,39 +46,276 @@ def backtest_vectorbt(frames: dict[str, pd.DataFrame]):
     )
     stats = pf.stats()
     print(stats)
+    if details:
+        value = pf.value()
+        equity_curve = value.sum(axis=1) if isinstance(value, pd.DataFrame) else value
+        return {"stats": stats, "equity_curve": equity_curve, "trades": pf.trades.records_readable}
     return stats
 
-def backtest_simple(frames: dict[str, pd.DataFrame]):
-    equity = 100000.0
-    pos = {s:0 for s in frames}
-    entry = {s:0.0 for s in frames}
-    all_idx = sorted(set().union(*[f.index for f in frames.values()]))
-    clf = load_model()
-
-    for ts in all_idx:
-        for s,f in frames.items():
-            if ts not in f.index: continue
-            row = f.loc[ts]
-            sig = hybrid_signal(row, clf)
-            px = float(row["close"])
-            # Exit on opposite signal
-            if pos[s]!=0 and sig*pos[s] < -0.5:
-                equity += pos[s]*(px - entry[s]); pos[s]=0
-            if pos[s]==0 and abs(sig)>0.4:
-                # naive equal risk: 1 unit each
-                pos[s] = 100 * (1 if sig>0 else -1); entry[s]=px
-    # MTM
-    for s,f in frames.items():
-        if pos[s]!=0:
-            equity += pos[s]*(f.iloc[-1]["close"] - entry[s])
+TRADE_COLUMNS = ["symbol", "entry_time", "exit_time", "side", "entry_price", "exit_price", "pnl"]
+
+# Tamaño del backtest simple (también forman parte de la clave de la caché de resultados)
+INITIAL_CASH = 100000.0
+UNITS = 100
+THR_ENTRY = 0.4
+THR_EXIT = 0.5
+
+
+def _exit_plan(f: pd.DataFrame, sig: np.ndarray, tp_pct: float, sl_pct: float, tie: str, thr_exit: float = 0.5):
+    """
+    Salida de cada vela de un símbolo como posible entrada (al cierre): TP/SL
+    intrabar o cierre con señal contraria (señal * lado < -thr_exit).
+    Devuelve (exit_idx, exit_px) por fila de 'f'; exit_idx = n si no sale.
+    """
+    close = f["close"].to_numpy(dtype=float)
+    n = len(close)
+    entries = np.arange(n)
+    is_long = sig > 0
+    tp = np.where(is_long, close * (1 + tp_pct), close * (1 - tp_pct))
+    sl = np.where(is_long, close * (1 - sl_pct), close * (1 + sl_pct))
+    br_idx, br_px, _ = bracket_exits(f["open"], f["high"], f["low"], entries, tp, sl, is_long, tie=tie)
+
+    # Salida por señal contraria: primer cierre posterior con señal por debajo/encima del umbral
+    sig_table = ExtremaTable(sig)
+    sig_long = sig_table.first_at_or_below(entries + 1, np.full(n, np.nextafter(-thr_exit, -np.inf)))
+    sig_short = sig_table.first_at_or_above(entries + 1, np.full(n, np.nextafter(thr_exit, np.inf)))
+    sig_idx = np.where(is_long, sig_long, sig_short)
+    br_idx = np.where(br_idx < 0, n, br_idx)
+    # En la misma vela el bracket (intrabar) llega antes que el cierre
+    exit_idx = np.minimum(br_idx, sig_idx)
+    exit_px = np.where(br_idx <= sig_idx, br_px, close[np.minimum(sig_idx, n - 1)])
+    return exit_idx, exit_px
+
+
+def _carry_exits(f: pd.DataFrame, sig: np.ndarray, side: np.ndarray, entry_px: np.ndarray,
+                 tp_pct: float, sl_pct: float, tie: str, thr_exit: float):
+    """
+    Salida, dentro de 'f', de posiciones abiertas antes de su primera vela
+    (modo streaming): mismas reglas que _exit_plan mirando desde la fila 0.
+    Devuelve (exit_idx, exit_px) por posición; exit_idx = n si no sale.
+    """
+    n = len(f)
+    is_long = side > 0
+    tp = np.where(is_long, entry_px * (1 + tp_pct), entry_px * (1 - tp_pct))
+    sl = np.where(is_long, entry_px * (1 - sl_pct), entry_px * (1 + sl_pct))
+    start = np.full(len(side), -1)
+    br_idx, br_px, _ = bracket_exits(f["open"], f["high"], f["low"], start, tp, sl, is_long, tie=tie)
+    sig_table = ExtremaTable(sig)
+    thr = np.full(len(side), thr_exit)
+    sig_idx = np.where(is_long, sig_table.first_at_or_below(start + 1, np.nextafter(-thr, -np.inf)),
+                       sig_table.first_at_or_above(start + 1, np.nextafter(thr, np.inf)))
+    br_idx = np.where(br_idx < 0, n, br_idx)
+    exit_idx = np.minimum(br_idx, sig_idx)
+    close = f["close"].to_numpy(dtype=float)
+    exit_px = np.where(br_idx <= sig_idx, br_px, close[np.minimum(sig_idx, n - 1)] if n else np.nan)
+    return exit_idx, exit_px
+
+
+def _symbol_leg(f: pd.DataFrame, clf, tp_pct, sl_pct, tie, thr_exit, last: dict = None, carry=None) -> dict:
+    """
+    Datos de un símbolo para el panel: cierres, señal y salidas precalculadas
+    (índices locales a 'f'). 'last' continúa la histéresis y 'carry'
+    (lado, precio de entrada) resuelve la salida de una posición ya abierta.
+    """
+    sig = signal_frame(f, clf, last=last)["signal"].to_numpy(dtype=float)
+    idx, px = _exit_plan(f, sig, tp_pct, sl_pct, tie, thr_exit)
+    leg = {"index": f.index, "close": f["close"].to_numpy(dtype=float), "signal": sig,
+           "exit_idx": idx, "exit_px": px, "carry": None}
+    if carry is not None:
+        c_idx, c_px = _carry_exits(f, sig, np.array([carry[0]]), np.array([carry[1]]), tp_pct, sl_pct, tie, thr_exit)
+        leg["carry"] = (int(c_idx[0]), float(c_px[0]))
+    return leg
+
+
+def _assemble_plan(legs: dict[str, dict], symbols: list[str]) -> dict:
+    """
+    Panel alineado (tiempo x símbolo) sobre la unión de timestamps de 'legs':
+    cierres, último precio conocido, señal, máscara de velas presentes y, para
+    cada posible entrada, la vela (del panel) y el precio de salida (T = no
+    sale dentro del panel). Los símbolos sin datos quedan como columnas vacías.
+    """
+    present_legs = [leg for leg in legs.values() if len(leg["index"])]
+    index = present_legs[0]["index"] if present_legs else pd.DatetimeIndex([], tz="UTC")
+    if not all(leg["index"].equals(index) for leg in present_legs):
+        index = index.append([leg["index"] for leg in present_legs]).unique().sort_values()
+    T, S = len(index), len(symbols)
+    close = np.full((T, S), np.nan)
+    signal = np.zeros((T, S))
+    exit_t = np.full((T, S), T, dtype=np.int64)
+    exit_px = np.full((T, S), np.nan)
+    carry_t = np.full(S, T, dtype=np.int64)
+    carry_px = np.full(S, np.nan)
+    for j, s in enumerate(symbols):
+        leg = legs.get(s)
+        if leg is None:
+            continue
+        n = len(leg["index"])
+        rows = np.arange(T) if leg["index"].equals(index) else index.get_indexer(leg["index"])
+        if n:
+            close[rows, j] = leg["close"]
+            signal[rows, j] = leg["signal"]
+            exit_t[rows, j] = np.where(leg["exit_idx"] < n, rows[np.minimum(leg["exit_idx"], n - 1)], T)
+            exit_px[rows, j] = leg["exit_px"]
+        if leg["carry"] is not None and leg["carry"][0] < n:
+            carry_t[j], carry_px[j] = rows[leg["carry"][0]], leg["carry"][1]
+    present = np.isfinite(close)
+    last = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()  # antes de su primera vela no hay posición
+    return {"index": index, "symbols": symbols, "close": close, "last": last, "signal": signal,
+            "present": present, "exit_t": exit_t, "exit_px": exit_px, "carry_t": carry_t, "carry_px": carry_px}
+
+
+def _portfolio_plan(frames: dict[str, pd.DataFrame], clf, tp_pct, sl_pct, tie, thr_exit) -> dict:
+    """Panel de todo el histórico en memoria (ver _assemble_plan)."""
+    frames = {s: f for s, f in frames.items() if not f.empty}
+    legs = {s: _symbol_leg(f, clf, tp_pct, sl_pct, tie, thr_exit) for s, f in frames.items()}
+    return _assemble_plan(legs, list(frames))
+
+
+def new_portfolio_state(n_symbols: int, initial: float = 100000.0) -> dict:
+    """Estado de cartera que simulate_portfolio continúa entre bloques de tiempo."""
+    return {"cash": initial, "qty": np.zeros(n_symbols), "entry_px": np.zeros(n_symbols),
+            "entry_time": np.full(n_symbols, None, dtype=object), "num_trades": 0, "last_price": np.zeros(n_symbols)}
+
+
+def simulate_portfolio(plan: dict, initial: float = 100000.0, units: float = 100,
+                       max_gross_exposure: float = None, thr_entry: float = 0.4, state: dict = None) -> dict:
+    """
+    Recorre el panel vela a vela con caja compartida; en cada vela todo se
+    hace con operaciones sobre el vector de símbolos:
+    1) salidas precalculadas que caen en la vela (intrabar o al cierre),
+    2) valoración a mercado con el último precio de cada símbolo,
+    3) entradas al cierre de los símbolos planos con |señal| > thr_entry, por
+       |señal| descendente, mientras quepan en la caja (los largos la consumen,
+       los cortos la abonan) y en max_gross_exposure * equity. Se corta en la
+       primera que no cabe.
+    Con 'state' (new_portfolio_state) continúa una simulación anterior y lo
+    deja actualizado; las posiciones sin salida dentro del panel siguen abiertas.
+    """
+    max_gross = settings.max_gross_exposure if max_gross_exposure is None else max_gross_exposure
+    index, symbols = plan["index"], plan["symbols"]
+    close, last, signal, present = plan["close"], plan["last"], plan["signal"], plan["present"]
+    exit_t, exit_px = plan["exit_t"], plan["exit_px"]
+    T, S = close.shape
+    final = state is None
+    state = new_portfolio_state(S, initial) if state is None else state
+
+    qty, entry_px, entry_time = state["qty"], state["entry_px"], state["entry_time"]
+    # Posiciones que vienen de bloques anteriores: su salida dentro de este panel
+    out_t = np.where(qty != 0, plan["carry_t"], T)  # vela de salida (T = no sale)
+    out_px = np.where(qty != 0, plan["carry_px"], 0.0)
+    # Símbolos sin vela todavía en este panel se valoran con su último precio conocido
+    last = np.where(present.cumsum(axis=0) > 0, last, state["last_price"])
+    cash = state["cash"]
+    curve = np.empty(T)
+    trades = []
+    num_trades = 0
+
+    for t in range(T):
+        closing = np.flatnonzero(out_t == t)
+        if closing.size:
+            q, px = qty[closing], out_px[closing]
+            cash += float(q @ px)
+            for j, qj, pj in zip(closing.tolist(), q.tolist(), px.tolist()):
+                trades.append((symbols[j], entry_time[j], index[t], np.sign(qj), entry_px[j], pj,
+                               qj * (pj - entry_px[j])))
+            num_trades += closing.size
+            qty[closing] = 0.0
+            out_t[closing] = T
+
+        price = last[t]
+        equity = cash + float(qty @ price)
+        curve[t] = equity
+
+        sig_t = signal[t]
+        cand = np.flatnonzero(present[t] & (qty == 0) & (np.abs(sig_t) > thr_entry))
+        if not cand.size:
+            continue
+        cand = cand[np.argsort(-np.abs(sig_t[cand]), kind="stable")]
+        side = np.where(sig_t[cand] > 0, 1.0, -1.0)
+        cost = units * close[t, cand]
+        gross = float(np.abs(qty) @ price)
+        fits = (gross + np.cumsum(cost) <= max_gross * equity) & (cash - np.cumsum(side * cost) >= 0)
+        take = cand[np.logical_and.accumulate(fits)]
+        if not take.size:
+            continue
+        qty[take] = side[:take.size] * units
+        entry_px[take] = close[t, take]
+        entry_time[take] = index[t]
+        out_t[take] = exit_t[t, take]
+        out_px[take] = exit_px[t, take]
+        cash -= float(qty[take] @ entry_px[take])
+
+    state["cash"] = cash
+    state["num_trades"] += num_trades
+    if T:
+        state["last_price"] = last[-1].copy()
+    if final:
+        for j in np.flatnonzero(qty).tolist():  # posiciones abiertas al final (valoradas a mercado)
+            trades.append((symbols[j], entry_time[j], pd.NaT, np.sign(qty[j]), entry_px[j], np.nan, np.nan))
+    trades = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    return {"equity_curve": pd.Series(curve, index=index), "num_trades": num_trades, "trades": trades}
+
+
+def backtest_simple(frames: dict[str, pd.DataFrame], tp_pct: float = None, sl_pct: float = None, tie: str = "stop",
+                    model=None, max_gross_exposure: float = None, units: float = UNITS):
+    """
+    Backtest de cartera sin vectorbt: 'units' unidades por operación, brackets
+    TP/SL comprobados con high/low (bot.fill_engine), salida por señal
+    contraria y caja compartida con límite de exposición bruta
+    (settings.max_gross_exposure por defecto). Ver simulate_portfolio.
+    Devuelve equity final, curva de equity (marcada a mercado en cada vela) y operaciones.
+    'model' permite usar un modelo concreto (p. ej. el de un fold walk-forward).
+    """
+    tp_pct = settings.take_profit_pct if tp_pct is None else tp_pct
+    sl_pct = settings.stop_loss_pct if sl_pct is None else sl_pct
+    initial = INITIAL_CASH
+    clf = model if model is not None else load_trading_model()
+
+    if not any(not f.empty for f in frames.values()):
+        return {"final_equity": initial, "num_trades": 0, "equity_curve": pd.Series(dtype=float),
+                "trades": pd.DataFrame(columns=TRADE_COLUMNS)}
+    plan = _portfolio_plan(frames, clf, tp_pct, sl_pct, tie, thr_exit=THR_EXIT)
+    out = simulate_portfolio(plan, initial, units, max_gross_exposure, thr_entry=THR_ENTRY)
+    equity = float(out["equity_curve"].iloc[-1])
     print(f"Equity MTM: {equity:.2f}")
-    return {"final_equity": equity}
+    return {"final_equity": equity, **out}
+
+
+def _record(result) -> dict:
+    """Resultado de cualquiera de los dos motores como {"metrics", "equity_curve", "trades"}."""
+    if "stats" in result:
+        metrics = {str(k): float(v) if isinstance(v, (int, float, np.number)) else str(v)
+                   for k, v in result["stats"].items()}
+    else:
+        metrics = {"final_equity": result["final_equity"], "num_trades": result["num_trades"]}
+    return {"metrics": metrics, "equity_curve": result["equity_curve"], "trades": result["trades"]}
+
 
 def run(symbols, start, end):
+    """Backtest de cartera; devuelve {"metrics", "equity_curve", "trades"} (desde la caché si ya existe)."""
     frames = _concat_symbols(symbols, start, end)
     if not frames: 
         print("Sin datos."); return
-    return backtest_vectorbt(frames)
+    key = None
+    if result_cache.enabled():
+        try:
+            import vectorbt  # noqa: F401
+            engine = "vectorbt"
+        except Exception:
+            engine = "simple"
+        params = {"engine": engine, "take_profit_pct": settings.take_profit_pct, "stop_loss_pct": settings.stop_loss_pct,
+                  "max_gross_exposure": settings.max_gross_exposure, "initial_cash": INITIAL_CASH, "units": UNITS,
+                  "thr_entry": THR_ENTRY, "thr_exit": THR_EXIT, "tie": "stop"}
+        key = result_cache.result_key("portfolio_backtest", result_cache.data_fingerprint(frames), params,
+                                      result_cache.model_fingerprint(load_trading_model()))
+        hit = result_cache.lookup(key)
+        if hit is not None:
+            logger.info("♻️ Resultado de backtest recuperado de la caché")
+            return hit
+    record = _record(backtest_vectorbt(frames, details=True))
+    if key is not None:
+        result_cache.store(key, "portfolio_backtest", params, **record)
+    return record
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
@@ -2,28 +2,22 @@
 import csv
 import os
 import time
+import pandas as pd
 from datetime import datetime, timezone, timedelta
-from alpaca.trading.client import TradingClient
-from alpaca.data.historical import CryptoHistoricalDataClient, StockHistoricalDataClient
-from alpaca.data.requests import CryptoBarsRequest, StockBarsRequest
-from alpaca.data.timeframe import TimeFrame
 from .config import settings
+from .clients import get_trading_client
 from .trade_logger import log_trade_exit
 from .telegram import alert_trade_exit, alert_risk_stop
 from .util import logger
-from .data import fetch_bars
-from .features import make_features
+from .data import fetch_bars_many, fetch_latest_prices
+from .incremental import engines as feature_engines
+from .broker_snapshot import BrokerSnapshot
+from .orders import build_order, _is_crypto
+from .trade_stream import live_order_book, stream_running
 
 
 TRADES_FILE = "trades_log.csv"
 
-# Clientes Alpaca
-trading_client = TradingClient(
-    api_key=settings.alpaca_api_key,
-    secret_key=settings.alpaca_secret_key,
-    paper=(settings.mode == "paper")
-)
-
 # Caché de precios
 _price_cache = {}
 _CACHE_TTL = 5  # segundos
@@ -38,51 +32,57 @@ def normalize_symbol(symbol: str) -> str:
     return symbol
 
 
-def _get_current_price(symbol: str) -> float:
+def _get_current_prices(symbols: list[str]) -> dict[str, float]:
     """
-    Obtiene el precio actual usando barras de 1 minuto (alternativa a LatestTradeRequest).
+    Precio actual (última vela de 1 minuto) de varios símbolos en un lote.
+    Va por la cola prioritaria del ejecutor de datos, por delante de la historia.
     """
     now = time.time()
-    cache_key = f"{symbol}_price"
-    if cache_key in _price_cache:
-        price, timestamp = _price_cache[cache_key]
-        if now - timestamp < _CACHE_TTL:
-            return price
+    prices, missing = {}, []
+    for symbol in symbols:
+        cache_key = f"{symbol}_price"
+        if cache_key in _price_cache:
+            price, timestamp = _price_cache[cache_key]
+            if now - timestamp < _CACHE_TTL:
+                prices[symbol] = price
+                continue
+        missing.append(symbol)
 
-    try:
-        if "/" in symbol:  # Cripto
-            request = CryptoBarsRequest(
-                symbol_or_symbols=symbol,
-                timeframe=TimeFrame.Minute,
-                limit=1
-            )
-            bars = trading_client.get_crypto_bars(request)
-            price = float(bars.df.iloc[-1]["close"])
-        else:  # Acciones
-            request = StockBarsRequest(
-                symbol_or_symbols=symbol,
-                timeframe=TimeFrame.Minute,
-                limit=1
-            )
-            bars = trading_client.get_stock_bars(request)
-            price = float(bars.df.iloc[-1]["close"])
-
-        _price_cache[cache_key] = (price, now)
-        return price
-    except Exception as e:
-        logger.error(f"❌ No se pudo obtener precio de {symbol}: {e}")
-        return None
+    if missing:
+        fresh = fetch_latest_prices(missing)
+        for symbol, price in fresh.items():
+            _price_cache[f"{symbol}_price"] = (price, now)
+        prices.update(fresh)
+    return prices
 
 
-def monitor_closed_positions(clf):
+def _get_current_price(symbol: str) -> float:
+    """Precio actual de un símbolo (None si no se pudo obtener)."""
+    price = _get_current_prices([symbol]).get(symbol)
+    if price is None:
+        logger.error(f"❌ No se pudo obtener precio de {symbol}")
+    return price
+
+
+def monitor_closed_positions(clf, snapshot: BrokerSnapshot = None, bars: dict = None):
     """
     Monitorea posiciones y cierra cuando el modelo predice una reversión.
+    Con 'snapshot' usa la foto del ciclo en vez de volver a leer cuenta y posiciones.
+    Con 'bars' (modo streaming) solo revisa las posiciones de esos símbolos, con
+    su última vela como precio y sin descargar nada.
     """
+    if snapshot is None:
+        try:
+            client = get_trading_client()
+            snapshot = BrokerSnapshot.take(client, book=live_order_book(client))
+        except Exception as e:
+            logger.error(f"❌ No se pudo leer la cuenta: {e}")
+            return
+
     # 1. Verificar stop diario por pérdida
     try:
-        account = trading_client.get_account()
-        equity = float(account.equity)
-        last_equity = float(getattr(account, "last_equity", equity))
+        equity = snapshot.equity
+        last_equity = snapshot.last_equity
         daily_pnl = equity - last_equity
         daily_pnl_pct = daily_pnl / last_equity if last_equity != 0 else 0.0
 
@@ -94,41 +94,48 @@ def monitor_closed_positions(clf):
     except Exception as e:
         logger.error(f"❌ No se pudo calcular P&L diario: {e}")
 
-    # 2. Obtener posiciones abiertas
-    try:
-        positions = trading_client.get_all_positions()
-        if not positions:
-            return
-    except Exception as e:
-        logger.error(f"❌ No se pudieron obtener posiciones: {e}")
+    # 2. Posiciones abiertas
+    positions = snapshot.all_positions()
+    if not positions:
         return
 
-    # 3. Revisar cada posición
+    # 3. Precios e historia de todas las posiciones en lote
+    if bars is not None:
+        positions = [pos for pos in positions if normalize_symbol(pos.symbol) in bars]
+        prices = {s: float(df["close"].iloc[-1]) for s, df in bars.items() if not df.empty}
+    else:
+        symbols = [normalize_symbol(pos.symbol) for pos in positions]
+        prices = _get_current_prices(symbols)
+        bars = fetch_bars_many(symbols, start="2023-01-01")
+
+    # 4. Revisar cada posición
     for pos in positions:
         symbol = normalize_symbol(pos.symbol)
         qty = float(pos.qty)
         entry_price = float(pos.avg_entry_price)
-        current_price = _get_current_price(symbol)
+        current_price = prices.get(symbol)
 
         if not current_price:
+            logger.error(f"❌ No se pudo obtener precio de {symbol}")
             continue
 
         # --- Obtener predicción del modelo ---
         try:
-            df = fetch_bars(symbol, start="2023-01-01")
+            df = bars[symbol]
             if df.empty or len(df) < 100:
                 continue
 
-            feats = make_features(df)
-            latest = feats.iloc[-1]
+            latest = feature_engines.latest(symbol, df)
+            if latest is None:
+                continue
 
             # Validar features
-            missing = [f for f in clf.feature_names_in_ if f not in latest.index]
+            missing = [f for f in clf.feature_names_in_ if f not in latest]
             if missing:
                 logger.warning(f"⚠️ Features faltantes para {symbol}: {missing}")
                 continue
 
-            X = latest[clf.feature_names_in_].to_frame().T
+            X = pd.DataFrame([[latest[f] for f in clf.feature_names_in_]], columns=clf.feature_names_in_)
             predicted_signal = clf.predict(X)[0]
             current_side = "long" if qty > 0 else "short"
             predicted_side = "long" if predicted_signal > 0 else "short"
@@ -149,7 +156,8 @@ def monitor_closed_positions(clf):
                 pnl_pct = pnl / (entry_price * abs(qty)) if entry_price * abs(qty) != 0 else 0.0
 
                 logger.info(f"🔄 {reason}. Cerrando {current_side} en {symbol} @ ${current_price:.2f}")
-                _close_position(pos, symbol, qty, current_price, pnl, pnl_pct, reason)
+                if _close_position(pos, symbol, qty, current_price, pnl, pnl_pct, reason):
+                    snapshot.remove_position(symbol, current_price)
 
         except Exception as e:
             logger.error(f"❌ Error al evaluar cierre para {symbol}: {e}")
@@ -158,20 +166,24 @@ def monitor_closed_positions(clf):
 
 
 def _close_position(pos, symbol: str, qty: float, exit_price: float, pnl: float, pnl_pct: float, reason: str):
-    """Cierra una posición y registra el cierre."""
+    """
+    Cierra una posición y registra el cierre. Devuelve True si se envió la orden.
+    Con el stream de trade updates vivo el cierre se registra al ejecutarse,
+    con el precio real (ver bot.trade_stream).
+    """
     try:
-        base_symbol = symbol.replace("/", "")
         order_side = "sell" if qty > 0 else "buy"
-        trading_client.submit_order(
-            symbol=base_symbol,
-            qty=abs(qty),
-            side=order_side,
-            type="market",
-            time_in_force="GTC"
-        )
+        ticket = build_order(symbol, abs(qty), order_side, exit_price,
+                             fractional=not float(qty).is_integer(), is_crypto=_is_crypto(symbol))
+        if ticket is None:
+            return False
+        get_trading_client().submit_order(ticket.request)
         side_str = "long" if qty > 0 else "short"
         logger.info(f"✅ Cerrada {side_str} {abs(qty)} {symbol} | P&L: ${pnl:.2f} ({pnl_pct:+.2%}) [{reason}]")
         alert_trade_exit(symbol, side_str, abs(qty), exit_price, pnl, pnl_pct)
-        log_trade_exit(symbol, abs(qty), exit_price, pnl, pnl_pct)
+        if not stream_running():
+            log_trade_exit(symbol, abs(qty), exit_price, pnl, pnl_pct)
+        return True
     except Exception as e:
-        logger.error(f"❌ No se pudo cerrar {symbol}: {e}")
\ No newline at end of file
+        logger.error(f"❌ No se pudo cerrar {symbol}: {e}")
+        return False
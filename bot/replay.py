@@ -0,0 +1,560 @@
+# bot/replay.py
+import argparse
+import cProfile
+import functools
+import itertools
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, asdict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from alpaca.common.exceptions import APIError
+from . import auto_tuner, clients, data, execution, main, order_gateway, position_monitor, strategy, targets, trade_logger
+from . import state as bot_state
+from .cash_ledger import CashLedger
+from .config import settings
+from .features import make_features
+from .incremental import FeatureEngines
+from .stream_backtest import bar_interval, store_loader
+from .util import logger
+
+# ------------------------------------------------------------------
+# Modo replay: el loop real (main.loop -> run_once, auto_tuner, sizing,
+# execution.place_order, position_monitor) sobre velas grabadas, con un reloj
+# virtual en lugar de time.sleep y un broker y un proveedor de datos en
+# memoria registrados en bot.clients. Meses de velas pasan en minutos; sirve
+# para comprobar que el camino en vivo coincide con el backtest y como carga
+# de trabajo para perfilar.
+# ------------------------------------------------------------------
+REPLAY_RATE_PER_MIN = 1e9  # sin cuota: las peticiones van a memoria
+FILL_COLUMNS = ["time", "order_id", "symbol", "side", "qty", "price", "notional", "realized_pnl"]
+
+
+class VirtualClock:
+    """Reloj simulado en UTC: sleep() avanza el tiempo al instante."""
+
+    def __init__(self, start):
+        start = pd.Timestamp(start)
+        self.now = start.tz_localize("UTC") if start.tz is None else start.tz_convert("UTC")
+
+    def time(self) -> float:
+        return self.now.value / 1e9
+
+    def sleep(self, seconds: float):
+        self.now += pd.Timedelta(seconds=seconds)
+
+    def datetime_class(self):
+        """Subclase de datetime cuyo now() lee este reloj (para sustituir 'datetime' en un módulo)."""
+        clock = self
+
+        class _VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                t = clock.now.to_pydatetime()
+                return t.astimezone(tz) if tz is not None else t.replace(tzinfo=None)
+
+        return _VirtualDatetime
+
+
+def _api_error(code: int, message: str) -> APIError:
+    return APIError(f'{{"code": {code}, "message": "{message}"}}')
+
+
+def _utc(ts) -> pd.Timestamp:
+    """Las peticiones de alpaca-py guardan start/end sin zona (ya en UTC)."""
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tz is None else ts
+
+
+def _symbols(req) -> list[str]:
+    s = req.symbol_or_symbols
+    return [s] if isinstance(s, str) else list(s)
+
+
+# -------------------- Datos -------------------- #
+@dataclass
+class ReplayBar:
+    symbol: str
+    timestamp: pd.Timestamp
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class _BarSet:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+
+class ReplayMarket:
+    """
+    Velas grabadas con la interfaz de StockHistoricalDataClient y
+    CryptoHistoricalDataClient que usa bot.data. Solo se ven velas cerradas a
+    la hora del reloj (la vela con marca t se cierra en t + intervalo).
+    """
+
+    def __init__(self, bars: dict[str, pd.DataFrame], clock: VirtualClock, interval: pd.Timedelta):
+        self.clock = clock
+        self.interval = interval
+        self.bars = {}
+        for s, df in bars.items():
+            df = df.rename(columns=str.lower).sort_index()
+            if df.index.tz is None:
+                df = df.tz_localize("UTC")
+            self.bars[s] = df
+        self.requests = 0
+
+    def _end(self, df: pd.DataFrame, end=None) -> int:
+        hi = df.index.searchsorted(self.clock.now - self.interval, side="right")
+        if end is not None:
+            hi = min(hi, df.index.searchsorted(_utc(end), side="right"))
+        return hi
+
+    def visible(self, symbol: str, start=None, end=None) -> pd.DataFrame:
+        df = self.bars.get(symbol)
+        if df is None:
+            return pd.DataFrame()
+        lo = df.index.searchsorted(_utc(start), side="left") if start is not None else 0
+        return df.iloc[lo:self._end(df, end)]
+
+    def price(self, symbol: str):
+        """Cierre de la última vela cerrada (None si aún no hay)."""
+        df = self.bars.get(symbol)
+        if df is None:
+            return None
+        hi = self._end(df)
+        return float(df["close"].iat[hi - 1]) if hi else None
+
+    def _bar_set(self, req) -> _BarSet:
+        self.requests += 1
+        frames = {s: self.visible(s, req.start, req.end) for s in _symbols(req)}
+        frames = {s: f for s, f in frames.items() if not f.empty}
+        if not frames:
+            return _BarSet(pd.DataFrame())
+        return _BarSet(pd.concat(frames, names=["symbol", "timestamp"]))
+
+    def _latest(self, req) -> dict[str, ReplayBar]:
+        self.requests += 1
+        out = {}
+        for s in _symbols(req):
+            df = self.bars.get(s)
+            hi = self._end(df) if df is not None else 0
+            if hi:
+                row = df.iloc[hi - 1]
+                out[s] = ReplayBar(s, df.index[hi - 1], float(row["open"]), float(row["high"]),
+                                   float(row["low"]), float(row["close"]), float(row.get("volume", 0.0)))
+        return out
+
+    def get_stock_bars(self, request_params):
+        return self._bar_set(request_params)
+
+    def get_crypto_bars(self, request_params):
+        return self._bar_set(request_params)
+
+    def get_stock_latest_bar(self, request_params):
+        return self._latest(request_params)
+
+    def get_crypto_latest_bar(self, request_params):
+        return self._latest(request_params)
+
+
+# -------------------- Broker -------------------- #
+@dataclass
+class ReplayAccount:
+    equity: float
+    cash: float
+    last_equity: float
+    buying_power: float
+
+
+@dataclass
+class ReplayPosition:
+    symbol: str
+    qty: float
+    avg_entry_price: float
+    market_value: float
+    current_price: float
+
+
+@dataclass
+class ReplayOrder:
+    id: str
+    client_order_id: str
+    symbol: str
+    side: str
+    qty: float
+    notional: float
+    filled_qty: float
+    filled_avg_price: float
+    status: str
+    submitted_at: pd.Timestamp
+    filled_at: pd.Timestamp
+
+
+class ReplayBroker:
+    """
+    Broker en memoria con los métodos de TradingClient que usa el bot.
+    Las órdenes de mercado se ejecutan al momento al cierre de la última vela
+    cerrada (más 'slippage_bps' en contra). Reglas de Alpaca que se imitan:
+    compras limitadas por el cash, cripto sin cortos y solo GTC/IOC, y sin
+    cortos con órdenes fraccionales/notional. Los rechazos se lanzan como
+    APIError. Lo que TradingClient no tiene tampoco existe aquí, así que una
+    llamada inválida falla igual que en producción.
+    """
+
+    def __init__(self, market: ReplayMarket, initial_cash: float, slippage_bps: float = 0.0):
+        self.market = market
+        self.cash = float(initial_cash)
+        self.slippage = slippage_bps / 1e4
+        self.positions: dict[str, ReplayPosition] = {}
+        self.orders: list[ReplayOrder] = []
+        self.fills: list[dict] = []
+        self.last_equity = self.cash
+        self._day = None
+        self._ids = itertools.count(1)
+        self._client_ids = set()
+        self._lock = threading.Lock()  # la pasarela envía órdenes desde varios hilos
+        self._data_symbol = {s.replace("/", ""): s for s in market.bars}
+
+    # -------------------- Valoración -------------------- #
+    def _price(self, key: str):
+        return self.market.price(self._data_symbol.get(key, key))
+
+    def _is_crypto(self, key: str) -> bool:
+        return "/" in self._data_symbol.get(key, key)
+
+    def _mark(self) -> float:
+        value = 0.0
+        for key, pos in self.positions.items():
+            px = self._price(key)
+            if px is not None:
+                pos.current_price = px
+                pos.market_value = pos.qty * px
+            value += pos.market_value
+        return self.cash + value
+
+    def equity(self) -> float:
+        return self._mark()
+
+    def roll_day(self, now: pd.Timestamp):
+        """Al cambiar de día (UTC) el equity actual pasa a ser last_equity, como el cierre de Alpaca."""
+        if now.date() != self._day:
+            if self._day is not None:
+                self.last_equity = self._mark()
+            self._day = now.date()
+
+    # -------------------- Interfaz de TradingClient -------------------- #
+    def get_account(self) -> ReplayAccount:
+        equity = self._mark()
+        return ReplayAccount(equity=equity, cash=self.cash, last_equity=self.last_equity,
+                             buying_power=max(self.cash, 0.0))
+
+    def get_all_positions(self) -> list[ReplayPosition]:
+        self._mark()
+        return [ReplayPosition(**asdict(p)) for p in self.positions.values()]
+
+    def get_open_position(self, symbol_or_asset_id: str) -> ReplayPosition:
+        self._mark()
+        pos = self.positions.get(symbol_or_asset_id.replace("/", ""))
+        if pos is None:
+            raise _api_error(40410000, "position does not exist")
+        return ReplayPosition(**asdict(pos))
+
+    def get_orders(self, filter=None) -> list[ReplayOrder]:
+        status = getattr(getattr(filter, "status", None), "value", None)
+        if status == "open":
+            return [o for o in self.orders if o.status in ("new", "accepted", "partially_filled")]
+        if status == "closed":
+            return [o for o in self.orders if o.status in ("filled", "canceled", "rejected")]
+        return list(self.orders)
+
+    def submit_order(self, order_data) -> ReplayOrder:
+        with self._lock:
+            return self._submit(order_data)
+
+    def _submit(self, order_data) -> ReplayOrder:
+        key = order_data.symbol.replace("/", "")
+        client_id = getattr(order_data, "client_order_id", None)
+        if client_id is not None and client_id in self._client_ids:
+            raise _api_error(40010001, "client_order_id must be unique")
+        side = getattr(order_data.side, "value", order_data.side)
+        tif = getattr(order_data.time_in_force, "value", order_data.time_in_force)
+        price = self._price(key)
+        if price is None:
+            raise _api_error(42210000, f"asset {key} is not tradable")
+        px = price * (1 + self.slippage if side == "buy" else 1 - self.slippage)
+        qty = float(order_data.qty) if order_data.qty is not None else float(order_data.notional) / px
+        signed = qty if side == "buy" else -qty
+        held = self.positions[key].qty if key in self.positions else 0.0
+
+        if self._is_crypto(key):
+            if tif not in ("gtc", "ioc"):
+                raise _api_error(42210000, "invalid crypto time_in_force")
+            if side == "sell" and qty > held + 1e-9:
+                raise _api_error(40310000, f"insufficient balance for {key} (requested: {qty}, available: {held})")
+        elif held + signed < -1e-9 and (order_data.notional is not None or not float(qty).is_integer()):
+            raise _api_error(40310000, "fractional orders cannot be sold short")
+        if side == "buy" and held >= 0 and qty * px > self.cash + 1e-6:
+            raise _api_error(40310000, "insufficient buying power")
+        return self._fill(key, side, qty, px, client_id)
+
+    def close_position(self, symbol_or_asset_id: str, close_options=None) -> ReplayOrder:
+        with self._lock:
+            return self._close(symbol_or_asset_id)
+
+    def _close(self, symbol_or_asset_id: str) -> ReplayOrder:
+        key = symbol_or_asset_id.replace("/", "")
+        pos = self.positions.get(key)
+        if pos is None:
+            raise _api_error(40410000, "position not found")
+        price = self._price(key)
+        if price is None:
+            raise _api_error(42210000, f"asset {key} is not tradable")
+        side = "sell" if pos.qty > 0 else "buy"
+        px = price * (1 + self.slippage if side == "buy" else 1 - self.slippage)
+        return self._fill(key, side, abs(pos.qty), px, None)
+
+    def cancel_order_by_id(self, order_id) -> None:
+        order = next((o for o in self.orders if o.id == str(order_id)), None)
+        if order is None:
+            raise _api_error(40410000, "order not found")
+        raise _api_error(42210000, f"order is not cancelable (status {order.status})")
+
+    # -------------------- Ejecución -------------------- #
+    def _fill(self, key: str, side: str, qty: float, px: float, client_order_id) -> ReplayOrder:
+        now = self.market.clock.now
+        signed = qty if side == "buy" else -qty
+        self.cash -= signed * px
+
+        pos = self.positions.get(key)
+        old = pos.qty if pos else 0.0
+        new = old + signed
+        realized = 0.0
+        if pos is not None and old * signed < 0:  # reduce o da la vuelta
+            closed = min(abs(signed), abs(old))
+            realized = closed * (px - pos.avg_entry_price) * (1 if old > 0 else -1)
+        if abs(new) < 1e-9:
+            self.positions.pop(key, None)
+        elif pos is None or old * new < 0:
+            self.positions[key] = ReplayPosition(key, new, px, new * px, px)
+        else:
+            if abs(new) > abs(old):
+                pos.avg_entry_price = (pos.avg_entry_price * abs(old) + px * abs(signed)) / abs(new)
+            pos.qty, pos.market_value, pos.current_price = new, new * px, px
+
+        oid = str(next(self._ids))
+        if client_order_id is not None:
+            self._client_ids.add(client_order_id)
+        order = ReplayOrder(id=oid, client_order_id=client_order_id or f"replay-{oid}", symbol=key, side=side,
+                            qty=qty, notional=qty * px, filled_qty=qty, filled_avg_price=px, status="filled",
+                            submitted_at=now, filled_at=now)
+        self.orders.append(order)
+        self.fills.append({"time": now, "order_id": oid, "symbol": key, "side": side, "qty": qty, "price": px,
+                           "notional": qty * px, "realized_pnl": realized})
+        return order
+
+
+# -------------------- Replay -------------------- #
+def _swap(stack: ExitStack, obj, name: str, value):
+    """setattr con restauración al salir del replay (o borrado si el atributo no existía)."""
+    if hasattr(obj, name):
+        stack.callback(setattr, obj, name, getattr(obj, name))
+    else:
+        stack.callback(delattr, obj, name)
+    setattr(obj, name, value)
+
+
+def _read_csv(path: str) -> pd.DataFrame:
+    try:
+        return pd.read_csv(path)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return pd.DataFrame()
+
+
+def replay(bars: dict[str, pd.DataFrame], start, end=None, model=None, interval: float = None,
+           initial_cash: float = None, slippage_bps: float = 0.0, timeframe: str = None,
+           workdir: str = None) -> dict:
+    """
+    Reproduce [start, end) por el loop real del bot con reloj, broker y datos
+    simulados. Las velas anteriores a 'start' hacen de historia de arranque.
+    'interval' son los segundos virtuales entre ciclos (por defecto, uno por
+    vela; main.LOOP_INTERVAL reproduce la cadencia real). Estado, log de trades
+    y auto_config van a 'workdir' (temporal si no se da) y Telegram se apaga.
+    Devuelve {"equity_curve", "fills", "orders" (latencias y rechazos de la
+    pasarela), "signals", "trades_log", "cycles", "wall_seconds", "final_equity"}.
+    """
+    timeframe = timeframe or settings.bar_timeframe
+    tf = bar_interval(timeframe)
+    interval = interval or tf.total_seconds()
+    clock = VirtualClock(start)
+    if end is None:
+        end = max(df.index[-1] for df in bars.values()) + tf
+    end = VirtualClock(end).now
+
+    if model is None:
+        model = strategy.load_trading_model()
+    if model is None:
+        logger.critical("❌ Replay sin modelo: el loop en vivo no arranca sin uno.")
+        return None
+
+    market = ReplayMarket(bars, clock, tf)
+    broker = ReplayBroker(market, initial_cash or settings.initial_equity, slippage_bps)
+    tmp = tempfile.TemporaryDirectory(prefix="replay_") if workdir is None else None
+    workdir = workdir or tmp.name
+    os.makedirs(workdir, exist_ok=True)
+
+    curve, signals = {}, []
+    cycles = 0
+
+    def record_signals(rows, clf=None):
+        out = strategy.hybrid_signal_batch(rows, clf)
+        for s, sig in out.items():
+            signals.append((clock.now, s, rows[s].get("timestamp"), sig))
+        return out
+
+    def virtual_sleep(seconds):
+        nonlocal cycles
+        cycles += 1
+        curve[clock.now] = broker.equity()
+        clock.sleep(seconds)
+        broker.roll_day(clock.now)
+
+    engines = FeatureEngines()
+    engines.save = functools.partial(engines.save, os.path.join(workdir, "feature_state.json"))
+
+    with ExitStack() as stack:
+        if tmp is not None:
+            stack.enter_context(tmp)
+        for name, value in (("symbols", list(bars)), ("telegram_enabled", False), ("bar_store_enabled", False),
+                            ("bar_timeframe", timeframe), ("risk_per_trade", settings.risk_per_trade),
+                            ("max_gross_exposure", settings.max_gross_exposure)):
+            _swap(stack, settings, name, value)
+        _swap(stack, auto_tuner, "AUTO_CONFIG_FILE", os.path.join(workdir, "auto_config.json"))
+        _swap(stack, auto_tuner, "TRADES_FILE", os.path.join(workdir, "trades_log.csv"))
+        _swap(stack, trade_logger, "TRADES_FILE", os.path.join(workdir, "trades_log.csv"))
+        _swap(stack, bot_state, "STATE_FILE", os.path.join(workdir, "state.json"))
+        virtual_datetime = clock.datetime_class()
+        for module in (auto_tuner, trade_logger, bot_state):
+            _swap(stack, module, "datetime", virtual_datetime)
+        _swap(stack, position_monitor, "time", clock)
+        _swap(stack, position_monitor, "_price_cache", {})
+        _swap(stack, main, "feature_engines", engines)
+        _swap(stack, position_monitor, "feature_engines", engines)
+        _swap(stack, main, "hybrid_signal_batch", record_signals)
+        _swap(stack, strategy, "_last_signals", {})
+        _swap(stack, data, "_utcnow", lambda: clock.now)
+        _swap(stack, data, "_executor", data.FetchExecutor(settings.data_max_workers, REPLAY_RATE_PER_MIN))
+        stack.enter_context(clients.use_clients(trading=broker, stock=market, crypto=market))
+        gateway = order_gateway.OrderGateway()
+        _swap(stack, order_gateway, "_gateway", gateway)
+        cash_ledger = CashLedger()
+        for module in (main, execution, targets):
+            _swap(stack, module, "ledger", cash_ledger)
+        stack.callback(gateway.shutdown)  # alertas pendientes antes de restaurar la configuración
+
+        broker.roll_day(clock.now)
+        state = bot_state.BotState()
+        logger.info(f"⏯️ Replay {clock.now} → {end} | {len(bars)} símbolos | ciclo cada {interval:g}s virtuales")
+        t0 = time.perf_counter()
+        main.loop(state, model, sleep=virtual_sleep, step=main.run_once.retry_with(sleep=clock.sleep),
+                  interval=interval, keep_running=lambda: clock.now < end)
+        wall = time.perf_counter() - t0
+        trades_log = _read_csv(os.path.join(workdir, "trades_log.csv"))
+
+    equity_curve = pd.Series(curve, dtype=float, name="equity")
+    final_equity = float(equity_curve.iloc[-1]) if not equity_curve.empty else broker.equity()
+    logger.info(f"🏁 Replay: {cycles} ciclos en {wall:.1f}s | {len(broker.fills)} ejecuciones | "
+                f"equity final ${final_equity:,.2f}")
+    return {
+        "equity_curve": equity_curve,
+        "fills": pd.DataFrame(broker.fills, columns=FILL_COLUMNS),
+        "orders": gateway.stats(),
+        "signals": pd.DataFrame(signals, columns=["cycle_time", "symbol", "bar_time", "signal"]),
+        "trades_log": trades_log,
+        "cycles": cycles,
+        "wall_seconds": wall,
+        "final_equity": final_equity,
+    }
+
+
+def signal_fidelity(result: dict, bars: dict[str, pd.DataFrame], model=None, atol: float = 1e-6) -> pd.DataFrame:
+    """
+    Compara por símbolo las señales que usó el loop (motores incrementales +
+    hybrid_signal_batch) con las del backtest (make_features + signal_frame)
+    en las mismas velas. La histéresis del backtest recorre solo las velas que
+    evaluó el loop ('skipped' cuenta las que no vio: ciclos cortados antes de
+    las señales o interval mayor que la vela).
+    """
+    live = result["signals"].dropna(subset=["bar_time"]).drop_duplicates(["symbol", "bar_time"], keep="last")
+    rows = []
+    for symbol, g in live.groupby("symbol", sort=False):
+        feats = make_features(bars[symbol].rename(columns=str.lower))
+        if feats.index.tz is None:
+            feats = feats.tz_localize("UTC")
+        g = g.set_index(pd.DatetimeIndex(g["bar_time"]).tz_convert("UTC"))["signal"]
+        window = feats[(feats.index >= g.index[0]) & (feats.index <= g.index[-1])]
+        # Solo las velas que evaluó el loop: la histéresis avanza en el mismo orden
+        seen = window[window.index.isin(g.index)].assign(symbol=symbol)
+        ref = strategy.signal_frame(seen, model, hysteresis=model is not None, last={})["signal"]
+        live_sig, ref_sig = g.align(ref, join="inner")
+        diff = np.abs(live_sig.to_numpy(dtype=float) - ref_sig.to_numpy(dtype=float))
+        rows.append({"symbol": symbol, "bars": len(diff), "skipped": len(window) - len(seen),
+                     "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+                     "mismatches": int((diff > atol).sum())})
+    return pd.DataFrame(rows, columns=["symbol", "bars", "skipped", "max_abs_diff", "mismatches"])
+
+
+def run(symbols, start, end, warmup_days=30, interval=None, timeframe=None, profile=None, slippage_bps=0.0):
+    """Replay sobre el almacén local de velas (bot.bar_store) con 'warmup_days' de historia previa."""
+    timeframe = timeframe or settings.bar_timeframe
+    start = VirtualClock(start).now
+    end = VirtualClock(end).now if end else None
+    bars = store_loader(timeframe)(symbols, start - pd.Timedelta(days=warmup_days),
+                                   end or pd.Timestamp.now(tz="UTC"))
+    bars = {s: b for s, b in bars.items() if not b.empty}
+    if not bars:
+        logger.error("❌ No hay velas locales para el replay (ver bot.bar_store).")
+        return None
+    model = strategy.load_trading_model()
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    result = replay(bars, start, end, model=model, interval=interval, timeframe=timeframe,
+                    slippage_bps=slippage_bps)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+    if result is not None:
+        result["fidelity"] = signal_fidelity(result, bars, model)
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay del loop en vivo sobre velas grabadas (reloj y broker simulados)")
+    ap.add_argument("--symbols", nargs="+", required=True)
+    ap.add_argument("--start", required=True)
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--warmup-days", type=int, default=30)
+    ap.add_argument("--interval", type=float, default=None, help="segundos virtuales por ciclo (por defecto, una vela)")
+    ap.add_argument("--timeframe", default=None)
+    ap.add_argument("--slippage-bps", type=float, default=0.0)
+    ap.add_argument("--profile", default=None, help="guarda un perfil cProfile en esta ruta")
+    ap.add_argument("--log-level", default="WARNING")
+    args = ap.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    out = run(args.symbols, args.start, args.end, args.warmup_days, args.interval, args.timeframe,
+              args.profile, args.slippage_bps)
+    if out is not None:
+        print(f"Ciclos: {out['cycles']} en {out['wall_seconds']:.1f}s | ejecuciones: {len(out['fills'])} | "
+              f"equity final: ${out['final_equity']:,.2f}")
+        print(out["fidelity"].to_string(index=False))
@@ -0,0 +1,184 @@
+# bot/result_cache.py
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .config import settings
+from .util import logger
+
+try:
+    import pyarrow  # noqa: F401  (curvas y operaciones se guardan en Parquet)
+    _HAS_PARQUET = True
+except Exception:
+    _HAS_PARQUET = False
+
+# ------------------------------------------------------------------
+# Caché de resultados de backtest direccionada por contenido. La clave es un
+# hash de (tipo de backtest, huella de los datos, parámetros, huella del
+# modelo), así que repetir la misma combinación en otro estudio de Optuna o
+# en otra ejecución devuelve el resultado guardado sin recalcular.
+# Cada entrada guarda métricas (JSON), curva de equity y operaciones
+# (Parquet) en un SQLite:  <result_cache_path>  (tabla 'results').
+# ------------------------------------------------------------------
+CACHE_VERSION = 2  # subir si cambia la semántica de los backtests
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    equity BLOB,
+    trades BLOB,
+    created REAL NOT NULL
+)
+"""
+_model_fps: dict[int, tuple] = {}
+_warned = False
+
+
+def enabled() -> bool:
+    global _warned
+    if not settings.result_cache_enabled:
+        return False
+    if not _HAS_PARQUET:
+        if not _warned:
+            logger.warning("⚠️ pyarrow no disponible; caché de resultados desactivada.")
+            _warned = True
+        return False
+    return True
+
+
+# -------------------- Huellas -------------------- #
+def _update(h, arr):
+    arr = np.ascontiguousarray(arr)
+    h.update(str((arr.dtype.str, arr.shape)).encode())
+    h.update(arr.tobytes())
+
+
+def data_fingerprint(data: dict) -> str:
+    """Hash de {símbolo: DataFrame} o {símbolo: {columna: array}} (índices incluidos)."""
+    h = hashlib.sha256()
+    for symbol in sorted(data):
+        item = data[symbol]
+        h.update(symbol.encode())
+        if isinstance(item, pd.DataFrame):
+            h.update(json.dumps([str(c) for c in item.columns]).encode())
+            if isinstance(item.index, pd.DatetimeIndex):
+                h.update(str(item.index.tz).encode())
+                _update(h, item.index.as_unit("ns").asi8)
+            else:
+                _update(h, item.index.to_numpy())
+            for c in item.columns:
+                col = item[c].to_numpy()
+                _update(h, col if col.dtype != object else col.astype(str))
+        else:
+            for c in sorted(item):
+                h.update(c.encode())
+                _update(h, np.asarray(item[c]))
+    return h.hexdigest()
+
+
+def model_fingerprint(model) -> str:
+    """Hash del modelo (bosque compilado o pickle de sklearn); 'rules' si no hay modelo."""
+    if model is None:
+        return "rules"
+    memo = _model_fps.get(id(model))
+    if memo is not None and memo[0] is model:
+        return memo[1]
+    h = hashlib.sha256()
+    if hasattr(model, "children") and hasattr(model, "value"):  # CompiledForest
+        for arr in (model.feature, model.threshold, model.children, model.value, model.roots, model.classes_):
+            _update(h, arr)
+    else:
+        h.update(pickle.dumps(model, protocol=4))
+    fp = h.hexdigest()
+    _model_fps[id(model)] = (model, fp)  # se guarda la referencia: el id no se reutiliza
+    return fp
+
+
+def result_key(kind: str, data_fp: str, params: dict, model_fp: str = "rules") -> str:
+    payload = json.dumps({"v": CACHE_VERSION, "kind": kind, "data": data_fp, "params": params,
+                          "model": model_fp}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# -------------------- Almacén -------------------- #
+@contextmanager
+def _connect():
+    path = settings.result_cache_path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)  # varios workers de Optuna pueden escribir a la vez
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _to_blob(obj):
+    if obj is None:
+        return None
+    if isinstance(obj, (pd.Series, np.ndarray, list)):
+        obj = pd.DataFrame({"equity": obj.values if isinstance(obj, pd.Series) else np.asarray(obj, dtype=float)},
+                           index=obj.index if isinstance(obj, pd.Series) else None)
+    buf = io.BytesIO()
+    obj.to_parquet(buf)
+    return buf.getvalue()
+
+
+def _from_blob(blob):
+    return None if blob is None else pd.read_parquet(io.BytesIO(blob))
+
+
+def lookup(key: str):
+    """Resultado guardado {"metrics", "equity_curve", "trades"} o None."""
+    if not enabled():
+        return None
+    try:
+        with _connect() as conn:
+            row = conn.execute("SELECT metrics, equity, trades FROM results WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Caché de resultados no disponible: {e}")
+        return None
+    if row is None:
+        return None
+    equity = _from_blob(row[1])
+    return {
+        "metrics": json.loads(row[0]),
+        "equity_curve": equity["equity"] if equity is not None else None,
+        "trades": _from_blob(row[2]),
+    }
+
+
+def store(key: str, kind: str, params: dict, metrics: dict, equity_curve=None, trades: pd.DataFrame = None):
+    if not enabled():
+        return
+    try:
+        row = (key, kind, json.dumps(params, sort_keys=True, default=str),
+               json.dumps(metrics, default=float), _to_blob(equity_curve), _to_blob(trades), time.time())
+        with _connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo guardar el resultado en caché: {e}")
+
+
+def load_results(kind: str = None) -> pd.DataFrame:
+    """Tabla de parámetros + métricas guardadas (para análisis sin recalcular)."""
+    if not os.path.exists(settings.result_cache_path):
+        return pd.DataFrame()
+    query, args = "SELECT key, kind, params, metrics, created FROM results", ()
+    if kind:
+        query, args = query + " WHERE kind = ?", (kind,)
+    with _connect() as conn:
+        rows = conn.execute(query, args).fetchall()
+    return pd.DataFrame([{"key": k, "kind": t, **json.loads(p), **json.loads(m), "created": c}
+                         for k, t, p, m, c in rows])
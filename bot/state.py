@@ -30,6 +30,12 @@ def _is_new_day(last_reset: str) -> bool:
 class BotState:
     def __init__(self):
         self.state = self.load()
+        self.cycle_id = None  # id del ciclo en curso (client_order_id de sus órdenes)
+
+    def new_cycle(self) -> str:
+        from .order_gateway import new_cycle_id
+        self.cycle_id = new_cycle_id()
+        return self.cycle_id
 
     def load(self):
         if not os.path.exists(STATE_FILE):
@@ -8,6 +8,7 @@ from sklearn.ensemble import RandomForestClassifier
 from joblib import dump
 from .features import make_features
 from .config import settings
+from .compiled_model import export_compiled, load_compiled
 _trading_model_instance = None
 
 # Lista de features que el modelo espera (deben coincidir con make_features)
@@ -52,19 +53,25 @@ def prepare_xy(df: pd.DataFrame):
     Prepara X e y para entrenamiento.
     y = 1 si el precio sube en la siguiente vela (1h)
     """
-    feats = make_features(df)
+    # Acepta velas crudas o features ya calculadas (p. ej. desde bot.panel)
+    feats = df if set(FEATURES).issubset(df.columns) else make_features(df)
     feats = feats.dropna(subset=FEATURES + ["close"])
     
-    # Usar retorno futuro en lugar de binario simple
-    future_ret = feats["close"].shift(-1) / feats["close"] - 1
+    # Usar retorno futuro en lugar de binario simple (por símbolo si hay varios)
+    if "symbol" in feats.columns:
+        next_close = feats.groupby("symbol", sort=False)["close"].shift(-1)
+    else:
+        next_close = feats["close"].shift(-1)
+    future_ret = next_close / feats["close"] - 1
     y = (future_ret > 0).astype(int)  # 1 si sube, 0 si baja
     
     X = feats[FEATURES]
     return X, y
 
 
-def train_model(df: pd.DataFrame):
-    """Entrena el modelo y lo guarda."""
+def train_model(df: pd.DataFrame, model_path: str = None):
+    """Entrena el modelo y lo guarda (en settings.model_path salvo que se indique otra ruta)."""
+    model_path = model_path or settings.model_path
     X, y = prepare_xy(df)
     if X.empty or len(X) < 100:
         logger.error("❌ No hay suficientes datos para entrenar.")
@@ -80,9 +87,10 @@ def train_model(df: pd.DataFrame):
     clf.fit(X, y)
     
     # Guardar modelo
-    os.makedirs(os.path.dirname(settings.model_path), exist_ok=True)
-    dump(clf, settings.model_path)
-    logger.info(f"✅ Modelo entrenado y guardado en {settings.model_path}")
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    dump(clf, model_path)
+    logger.info(f"✅ Modelo entrenado y guardado en {model_path}")
+    export_compiled(clf, model_path)
     return clf
 
 
@@ -97,12 +105,16 @@ def load_trading_model():
     if _trading_model_instance is not None:
         return _trading_model_instance
 
-    if not os.path.exists(settings.model_path):
+    # ⚡ Preferir el bosque compilado (predicción sin sklearn); si falta, el pickle
+    model = load_compiled(settings.model_path) if settings.compiled_model_enabled else None
+
+    if model is None and not os.path.exists(settings.model_path):
         logger.warning(f"⚠️ No se encontró el modelo en {settings.model_path}")
         return None
 
     try:
-        model = joblib.load(settings.model_path)
+        if model is None:
+            model = joblib.load(settings.model_path)
 
         if hasattr(model, 'feature_names_in_'):
             missing = set(FEATURES) - set(model.feature_names_in_)
@@ -201,6 +213,116 @@ def hybrid_signal(features, model=None):
         logger.debug(f"🔧 [hybrid_signal] Fallback a reglas: {sig:.2f}")
         return sig
 
+# ------------------------------------------------------------------
+# Señales por columnas: mismas reglas que rule_signal/hybrid_signal pero
+# calculadas para un DataFrame completo de una vez (un solo predict_proba).
+# ------------------------------------------------------------------
+def rule_signal_frame(df: pd.DataFrame) -> pd.Series:
+    """Versión vectorizada de rule_signal para todas las filas de df."""
+    close = df["close"].to_numpy(dtype=float)
+    ema_12 = df["ema_12"].to_numpy(dtype=float)
+    ema_26 = df["ema_26"].to_numpy(dtype=float)
+    rsi_14 = df["rsi_14"].to_numpy(dtype=float)
+
+    ema_trend = np.where(ema_12 > ema_26, 1.0, -1.0)
+    rsi_sig = np.where(rsi_14 > 70, -1.0, np.where(rsi_14 < 30, 1.0, 0.0))
+    price_momentum = np.where(close > ema_26, 1.0, -1.0)
+    signal = 0.5 * ema_trend + 0.3 * rsi_sig + 0.2 * price_momentum
+
+    atr_ratio = df["atr_14"].to_numpy(dtype=float) / close
+    signal = np.where(atr_ratio > 0.03, signal * 0.5, signal)
+    return pd.Series(np.clip(signal, -1.0, 1.0), index=df.index, name="rule_signal")
+
+
+def hysteresis_scan(signals: np.ndarray, last: float | None = None):
+    """
+    Recorrido secuencial con la misma regla de estabilidad que hybrid_signal:
+    mantiene la señal anterior si el cambio es pequeño (<0.2) salvo que ambas
+    apunten con fuerza en la misma dirección.
+    Devuelve (señales estabilizadas, última señal) para poder encadenar tramos.
+    """
+    out = np.empty(len(signals))
+    for i, cur in enumerate(signals):
+        if last is not None and not ((cur > 0.3 and last > 0.1) or (cur < -0.3 and last < -0.1)) \
+                and abs(cur - last) < 0.2:
+            cur = last
+        out[i] = cur
+        last = cur
+    return out, last
+
+
+def signal_frame(feats: pd.DataFrame, model=None, hysteresis: bool = True, last: dict | None = None) -> pd.DataFrame:
+    """
+    Señales de todo un DataFrame de features en batch.
+    Devuelve columnas rule_signal, model_signal, combined_signal (ya ajustada
+    por volatilidad y normalizada) y signal (con la histéresis por símbolo).
+    Las filas con NaN en FEATURES usan solo reglas, como hybrid_signal.
+    'last' (símbolo -> última señal) permite continuar un estado previo; se
+    actualiza in situ.
+    """
+    out = pd.DataFrame(index=feats.index)
+    out["rule_signal"] = rule_signal_frame(feats)
+    out["model_signal"] = 0.0
+    out["combined_signal"] = out["rule_signal"]
+    out["signal"] = out["rule_signal"]
+    if model is None or feats.empty:
+        return out
+
+    X = feats[FEATURES]
+    ok = ~X.isna().any(axis=1).to_numpy()
+    if not ok.any():
+        return out
+    try:
+        proba = model.predict_proba(X[ok])
+    except Exception as e:
+        logger.error(f"❌ Error en señal híbrida (batch): {e}. Usando solo reglas.")
+        return out
+
+    model_sig = proba[:, 1] - proba[:, 0]
+    combined = 0.7 * model_sig + 0.3 * out["rule_signal"].to_numpy()[ok]
+    atr_ratio = (feats["atr_14"] / feats["close"]).to_numpy()[ok]
+    combined = np.clip(np.where(atr_ratio > 0.05, combined * 0.5, combined), -1.0, 1.0)
+
+    rows = np.flatnonzero(ok)
+    col = out.columns.get_loc
+    out.iloc[rows, col("model_signal")] = model_sig
+    out.iloc[rows, col("combined_signal")] = combined
+
+    signal = combined
+    if hysteresis:
+        last = {} if last is None else last
+        symbols = feats["symbol"].to_numpy()[ok] if "symbol" in feats.columns else np.full(len(rows), "UNKNOWN")
+        signal = np.empty(len(rows))
+        for sym in pd.unique(symbols):
+            idx = np.flatnonzero(symbols == sym)
+            signal[idx], last[sym] = hysteresis_scan(combined[idx], last.get(sym))
+    out.iloc[rows, col("signal")] = signal
+    return out
+
+
+def hybrid_signal_batch(rows: dict, model=None) -> dict:
+    """
+    hybrid_signal para la última fila de features de varios símbolos a la vez:
+    una sola llamada a predict_proba para todo el universo y después la mezcla
+    con reglas y la histéresis por símbolo (comparte _last_signals con hybrid_signal).
+    rows: símbolo -> fila de features (dict o Series). Devuelve símbolo -> señal.
+    """
+    global _last_signals
+    if not rows:
+        return {}
+    if model is None:
+        model = load_trading_model()
+    if model is None:
+        logger.warning("⚠️ No hay modelo cargado. Usando solo reglas.")
+
+    feats = pd.DataFrame([dict(r) for r in rows.values()])
+    feats["symbol"] = list(rows)
+    if "_last_signals" not in globals():
+        _last_signals = {}
+    sigs = signal_frame(feats, model, hysteresis=model is not None, last=_last_signals)
+    return dict(zip(rows, sigs["signal"].astype(float)))
+
+
 def precompute_model_signals(df: pd.DataFrame, model=None) -> pd.DataFrame:
     """
     Precalcula señales del modelo + híbridas para todo un DataFrame.
@@ -208,32 +330,12 @@ def precompute_model_signals(df: pd.DataFrame, model=None) -> pd.DataFrame:
     """
     if model is None:
         model = load_trading_model()
+    feats = df if set(FEATURES).issubset(df.columns) else make_features(df)
+    feats = feats.dropna(subset=FEATURES + ["close"]).copy()
     if model is None:
         logger.warning("⚠️ No hay modelo. Se usarán solo reglas.")
-        df["rule_signal"] = df.apply(rule_signal, axis=1)
-        df["model_signal"] = 0.0
-        df["combined_signal"] = df["rule_signal"]
-        return df
-
-    feats = make_features(df).dropna(subset=FEATURES + ["close"])
-    X = feats[FEATURES]
-
-    # 🔹 Predicciones en batch
-    probas = model.predict_proba(X)
-    feats["model_signal"] = probas[:, 1] - probas[:, 0]
-
-    # Señal basada en reglas
-    feats["rule_signal"] = feats.apply(rule_signal, axis=1)
-
-    # Combinar con peso 70/30
-    feats["combined_signal"] = 0.7 * feats["model_signal"] + 0.3 * feats["rule_signal"]
-
-    # Ajustar por volatilidad
-    atr_ratio = feats["atr_14"] / feats["close"]
-    feats.loc[atr_ratio > 0.05, "combined_signal"] *= 0.5
-
-    # Normalizar
-    feats["combined_signal"] = feats["combined_signal"].clip(-1.0, 1.0)
 
+    sigs = signal_frame(feats, model, hysteresis=False)
+    for c in ("model_signal", "rule_signal", "combined_signal"):
+        feats[c] = sigs[c]
     return feats
-
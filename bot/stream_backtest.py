@@ -0,0 +1,124 @@
+# bot/stream_backtest.py
+import argparse
+import numpy as np
+import pandas as pd
+from . import bar_store
+from .config import settings
+from .features import make_features
+from .portfolio_backtest import (TRADE_COLUMNS, _assemble_plan, _symbol_leg, new_portfolio_state,
+                                 simulate_portfolio)
+from .strategy import load_trading_model
+from .util import logger
+
+# ------------------------------------------------------------------
+# Backtest de cartera en streaming: el histórico se recorre en bloques de
+# tiempo y, dentro de cada bloque, el universo por grupos de símbolos. Solo
+# vive en memoria el bloque actual (más un tramo de calentamiento para los
+# indicadores); caja, posiciones abiertas e histéresis de las señales pasan
+# de un bloque al siguiente, y las curvas y operaciones se concatenan.
+# El tamaño de bloque y de grupo sale del presupuesto de memoria, no del
+# tamaño del universo ni del histórico.
+# ------------------------------------------------------------------
+WARMUP_BARS = 500           # EMA26 olvida su arranque en ~500 velas ((25/27)^500 ~ 1e-17)
+WARMUP_GAP_FACTOR = 3       # margen de calendario para noches / fines de semana
+PANEL_BYTES_PER_CELL = 160  # panel (tiempo x símbolo) del simulador y temporales
+FEATURE_BYTES_PER_ROW = 2000  # una fila de features por símbolo (pandas + temporales)
+MIN_BLOCK_BARS = 100
+
+_TIMEFRAMES = {"1Min": "1min", "5Min": "5min", "15Min": "15min", "1Hour": "1h", "1Day": "1D"}
+
+
+def bar_interval(timeframe: str = None) -> pd.Timedelta:
+    timeframe = timeframe or settings.bar_timeframe
+    return pd.Timedelta(_TIMEFRAMES.get(timeframe, timeframe))
+
+
+def store_loader(timeframe: str = None):
+    """Cargador por defecto: velas del almacén Parquet local (bot.bar_store), sin caché."""
+    def load(symbols, start, end) -> dict[str, pd.DataFrame]:
+        return {s: bar_store.read_bars_window(s, start, end, timeframe) for s in symbols}
+    return load
+
+
+def block_layout(n_symbols: int, memory_mb: float, interval: pd.Timedelta) -> tuple[pd.Timedelta, int]:
+    """(duración de bloque, símbolos por grupo) para no pasar de 'memory_mb'."""
+    budget = memory_mb * 1024 ** 2
+    rows = max(MIN_BLOCK_BARS, int(0.5 * budget / (max(n_symbols, 1) * PANEL_BYTES_PER_CELL)))
+    chunk = max(1, int(0.3 * budget / ((rows + WARMUP_BARS * WARMUP_GAP_FACTOR) * FEATURE_BYTES_PER_ROW)))
+    return rows * interval, min(chunk, max(n_symbols, 1))
+
+
+def backtest_streaming(symbols: list[str], start, end, load_bars=None, memory_mb: float = 512,
+                       timeframe: str = None, model=None, tp_pct: float = None, sl_pct: float = None,
+                       tie: str = "stop", max_gross_exposure: float = None, units: float = 100,
+                       initial: float = 100000.0) -> dict:
+    """
+    Mismo resultado que backtest_simple sobre las mismas velas, con memoria
+    acotada por 'memory_mb'. load_bars(symbols, start, end) -> {símbolo: velas
+    OHLCV en [start, end)}; por defecto el almacén local.
+    Devuelve {"final_equity", "num_trades", "equity_curve", "trades", "blocks"}.
+    """
+    load_bars = load_bars or store_loader(timeframe)
+    tp_pct = settings.take_profit_pct if tp_pct is None else tp_pct
+    sl_pct = settings.stop_loss_pct if sl_pct is None else sl_pct
+    clf = model if model is not None else load_trading_model()
+    interval = bar_interval(timeframe)
+    block, chunk = block_layout(len(symbols), memory_mb, interval)
+    warmup = WARMUP_BARS * WARMUP_GAP_FACTOR * interval
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    logger.info(f"🌊 Backtest streaming: {len(symbols)} símbolos | bloques de {block} | "
+                f"grupos de {chunk} símbolos | presupuesto {memory_mb:.0f} MB")
+
+    state = new_portfolio_state(len(symbols), initial)
+    pos = {s: j for j, s in enumerate(symbols)}
+    hysteresis = {s: {} for s in symbols}
+    curves, trades, blocks = [], [], 0
+    t0 = start
+    while t0 < end:
+        t1 = min(t0 + block, end)
+        legs = {}
+        for k in range(0, len(symbols), chunk):
+            group = symbols[k:k + chunk]
+            bars = load_bars(group, t0 - warmup, t1)
+            for s in group:
+                df = bars.get(s)
+                if df is None or df.empty:
+                    continue
+                f = make_features(df)
+                f = f[(f.index >= t0) & (f.index < t1)]
+                if f.empty:
+                    continue
+                j = pos[s]
+                carry = (np.sign(state["qty"][j]), state["entry_px"][j]) if state["qty"][j] != 0 else None
+                legs[s] = _symbol_leg(f, clf, tp_pct, sl_pct, tie, 0.5, last=hysteresis[s], carry=carry)
+            del bars
+        if legs:
+            plan = _assemble_plan(legs, symbols)
+            del legs
+            out = simulate_portfolio(plan, initial, units, max_gross_exposure, thr_entry=0.4, state=state)
+            curves.append(out["equity_curve"])
+            trades.append(out["trades"])
+            del plan
+        blocks += 1
+        t0 = t1
+
+    open_rows = [(symbols[j], state["entry_time"][j], pd.NaT, np.sign(state["qty"][j]), state["entry_px"][j],
+                  np.nan, np.nan) for j in np.flatnonzero(state["qty"]).tolist()]
+    trades.append(pd.DataFrame(open_rows, columns=TRADE_COLUMNS))
+    equity_curve = pd.concat(curves) if curves else pd.Series(dtype=float)
+    trades = pd.concat([t for t in trades if not t.empty]) if any(not t.empty for t in trades) \
+        else pd.DataFrame(columns=TRADE_COLUMNS)
+    final_equity = float(equity_curve.iloc[-1]) if not equity_curve.empty else initial
+    return {"final_equity": final_equity, "num_trades": state["num_trades"], "equity_curve": equity_curve,
+            "trades": trades.reset_index(drop=True), "blocks": blocks}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Backtest de cartera en streaming sobre el almacén local de velas")
+    ap.add_argument("--symbols", nargs="+", required=True)
+    ap.add_argument("--start", required=True)
+    ap.add_argument("--end", required=True)
+    ap.add_argument("--memory-mb", type=float, default=512)
+    args = ap.parse_args()
+    out = backtest_streaming(args.symbols, args.start, args.end, memory_mb=args.memory_mb)
+    print(f"Equity MTM: {out['final_equity']:.2f} | operaciones: {out['num_trades']} | bloques: {out['blocks']}")
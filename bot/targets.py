@@ -0,0 +1,153 @@
+# bot/targets.py
+import math
+from dataclasses import dataclass
+from .broker_snapshot import BrokerSnapshot
+from .cash_ledger import ledger
+from .orders import build_order, _is_crypto
+from .order_gateway import OrderGateway, client_order_id, get_gateway, new_cycle_id
+from .util import logger
+
+# ------------------------------------------------------------------
+# Cartera objetivo: el ciclo decide la posición deseada de cada símbolo y
+# aquí se calcula UNA orden neta por símbolo (objetivo - posición actual).
+# Un giro de largo a corto es una sola venta en lugar de cerrar y volver a
+# abrir: la mitad de órdenes y de comprobaciones de saldo, y el bot no queda
+# plano entre las dos.
+# ------------------------------------------------------------------
+MIN_DELTA_QTY = 1e-6
+
+
+@dataclass
+class Target:
+    symbol: str
+    qty: float    # posición deseada con signo (+ largo, - corto)
+    price: float  # precio de referencia para tamaño y saldo
+
+
+@dataclass
+class OrderDelta:
+    symbol: str
+    current: float
+    target: float
+    price: float
+    is_crypto: bool
+
+    @property
+    def qty(self) -> float:
+        return abs(self.target - self.current)
+
+    @property
+    def side(self) -> str:
+        return "buy" if self.target > self.current else "sell"
+
+    @property
+    def action(self) -> str:
+        if self.current == 0:
+            return "abrir"
+        if self.target == 0:
+            return "cerrar"
+        if self.current * self.target < 0:
+            return "girar"
+        return "aumentar" if abs(self.target) > abs(self.current) else "reducir"
+
+    def legs(self) -> list[tuple[float, bool]]:
+        """
+        (cantidad, fraccional) de cada orden a enviar. Normalmente una; una
+        acción que gira con una parte fraccional se parte en cierre + apertura
+        porque Alpaca no acepta cortos fraccionales.
+        """
+        if self.is_crypto:
+            return [(self.qty, False)]
+        if self.action == "girar" and not float(self.qty).is_integer():
+            return [(q, not float(q).is_integer()) for q in (abs(self.current), abs(self.target))]
+        return [(self.qty, not float(self.qty).is_integer())]
+
+
+def target_from_signal(current: float, qty: float, side: str) -> float:
+    """
+    Posición deseada con la regla del loop: en el mismo lado se añade 'qty' a
+    la posición; plano o en el lado contrario la posición pasa a ser 'qty'.
+    """
+    signed = qty if side == "buy" else -qty
+    if current * signed > 0:
+        return current + signed
+    return signed
+
+
+def tradable_target(symbol: str, qty: float) -> float:
+    """Ajusta el objetivo a lo que acepta Alpaca: cripto sin cortos y cortos en acciones enteras."""
+    if qty >= 0:
+        return qty
+    if _is_crypto(symbol):
+        return 0.0
+    return float(math.ceil(qty))  # -3.7 -> -3
+
+
+def plan_orders(targets: list[Target], snapshot: BrokerSnapshot) -> list[OrderDelta]:
+    """Una orden neta por símbolo (el último objetivo de un símbolo manda)."""
+    by_symbol = {t.symbol: t for t in targets}
+    deltas = []
+    for t in by_symbol.values():
+        pos = snapshot.position(t.symbol)
+        current = float(pos.qty) if pos else 0.0
+        delta = OrderDelta(t.symbol, current, tradable_target(t.symbol, t.qty), t.price, _is_crypto(t.symbol))
+        if delta.qty >= MIN_DELTA_QTY:
+            deltas.append(delta)
+    return deltas
+
+
+def submit_orders(deltas: list[OrderDelta], snapshot: BrokerSnapshot, cycle_id: str = None,
+                  gateway: OrderGateway = None) -> int:
+    """
+    Construye las órdenes netas reservando en el ledger de cash el coste de
+    cada compra (en el orden dado), las envía todas a la vez por la pasarela
+    y actualiza la foto con las aceptadas; las rechazadas liberan su reserva.
+    'cycle_id' fija los client_order_id (el mismo ciclo reintentado no
+    duplica órdenes ni reservas). Devuelve las aceptadas.
+    """
+    cycle_id = cycle_id or new_cycle_id()
+    ledger.reconcile_snapshot(snapshot)
+    chains = []
+    for d in deltas:
+        logger.info(f"🎯 {d.symbol}: {d.action} {d.current:+.6g} → {d.target:+.6g} ({d.side.upper()} {d.qty:.6g})")
+        chain = []
+        for leg, (qty, fractional) in enumerate(d.legs()):
+            ticket = build_order(d.symbol, qty, d.side, d.price, fractional, d.is_crypto,
+                                 client_order_id(cycle_id, d.symbol, leg))
+            if ticket is None:
+                break
+            order_id = ticket.request.client_order_id
+            # 🛑 Mismo límite que place_order: 90% del cash menos lo ya reservado
+            if d.side == "buy" and not ledger.try_reserve(order_id, ticket.cost):
+                logger.warning(f"⚠️ Saldo real insuficiente: necesitas ${ticket.cost:.2f}, solo tienes "
+                               f"${ledger.available():.2f}. Skip {d.symbol}.")
+                break
+            if d.side == "sell":
+                ledger.track(order_id, d.side)
+            chain.append(ticket)
+        chains.append(chain)
+
+    results = (gateway or get_gateway()).submit(chains)
+    sent = {r.ticket.request.client_order_id for r in results}
+    for chain in chains:
+        for t in chain:
+            if t.request.client_order_id not in sent:
+                ledger.release(t.request.client_order_id)  # no salió: la pata anterior se rechazó
+    for r in results:
+        t = r.ticket
+        if r.ok:
+            ledger.on_submitted(r.order)
+            snapshot.apply_order(t.symbol, t.qty, t.side, t.price, order=r.order)
+        elif not r.duplicate:
+            ledger.release(t.request.client_order_id)
+    return sum(r.ok for r in results)
+
+
+def rebalance(targets: list[Target], snapshot: BrokerSnapshot, cycle_id: str = None) -> int:
+    """plan_orders + submit_orders."""
+    deltas = plan_orders(targets, snapshot)
+    reversals = sum(d.action == "girar" for d in deltas)
+    sent = submit_orders(deltas, snapshot, cycle_id)
+    if deltas:
+        logger.info(f"🎯 Cartera objetivo: {len(deltas)} símbolos, {sent} órdenes aceptadas ({reversals} giros)")
+    return sent
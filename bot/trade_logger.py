@@ -23,7 +23,7 @@ def init_trades_file():
         logger.info(f"✅ Archivo de trades creado: {TRADES_FILE}")
 
 
-def log_trade_entry(symbol: str, qty: float, side: str, entry_price: float):
+def log_trade_entry(symbol: str, qty: float, side: str, entry_price: float, alert: bool = True):
     """Registra la apertura de una posición."""
     init_trades_file()
     row = {
@@ -40,10 +40,11 @@ def log_trade_entry(symbol: str, qty: float, side: str, entry_price: float):
     }
     _append_row(row)
     logger.info(f"🟢 Entrada registrada: {side.upper()} {qty} {symbol} @ ${entry_price:.2f}")
-    alert_trade_entry(symbol, side, qty, entry_price)
+    if alert:
+        alert_trade_entry(symbol, side, qty, entry_price)
 
 
-def log_trade_exit(symbol: str, qty: float, exit_price: float, pnl: float, pnl_pct: float):
+def log_trade_exit(symbol: str, qty: float, exit_price: float, pnl: float, pnl_pct: float, alert: bool = True):
     """
     Cierra la posición abierta más antigua para el símbolo.
     Maneja cierres totales y parciales.
@@ -65,7 +66,8 @@ def log_trade_exit(symbol: str, qty: float, exit_price: float, pnl: float, pnl_p
                 trade["status"] = "closed"
                 updated = True
                 logger.info(f"✅ Cerrado: {side.upper()} {entry_qty} {symbol} @ ${exit_price:.2f} → P&L: ${pnl:.2f} ({pnl_pct:+.2%})")
-                alert_trade_exit(symbol, side, entry_qty, exit_price, pnl, pnl_pct)
+                if alert:
+                    alert_trade_exit(symbol, side, entry_qty, exit_price, pnl, pnl_pct)
             else:
                 # Cierre parcial
                 partial_pnl = pnl * (qty / entry_qty)
@@ -77,7 +79,8 @@ def log_trade_exit(symbol: str, qty: float, exit_price: float, pnl: float, pnl_p
                 trade["status"] = "partially_closed"
                 updated = True
                 logger.info(f"🟡 Cierre parcial: {side.upper()} {qty} {symbol} @ ${exit_price:.2f} → P&L: ${partial_pnl:.2f}")
-                alert_trade_exit(symbol, side, qty, exit_price, partial_pnl, pnl_pct)
+                if alert:
+                    alert_trade_exit(symbol, side, qty, exit_price, partial_pnl, pnl_pct)
                 qty = 0
 
             if qty <= 0:
@@ -132,6 +135,22 @@ def log_closed_trades(closed_trades: list):
             logger.error(f"❌ Error registrando trade cerrado {t}: {e}")
 
 
+def log_fill(fill: dict):
+    """
+    Registra una ejecución del stream de trade updates (ver bot.trade_stream):
+    la parte que reduce la posición cierra las entradas abiertas con el P&L
+    real contra el precio medio y la que abre o aumenta es una entrada nueva.
+    Sin alertas: ya salieron al enviar la orden.
+    """
+    symbol, price = fill["symbol"], fill["price"]
+    if fill["closed"] > 0:
+        cost = fill["entry_price"] * fill["closed"]
+        pnl_pct = fill["realized_pnl"] / cost if cost else 0.0
+        log_trade_exit(symbol, fill["closed"], price, fill["realized_pnl"], pnl_pct, alert=False)
+    if fill["opened"] > 0:
+        log_trade_entry(symbol, fill["opened"], fill["side"], price, alert=False)
+
+
 def _create_partial_replacement(trade, remaining_qty):
     """Genera una nueva fila 'open' para la parte no cerrada de la posición."""
     new_trade = trade.copy()
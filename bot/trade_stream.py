@@ -0,0 +1,316 @@
+# bot/trade_stream.py
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+from alpaca.trading.requests import GetOrdersRequest
+from alpaca.trading.enums import QueryOrderStatus
+from alpaca.trading.stream import TradingStream
+from .broker_snapshot import SnapshotPosition, _key
+from .cash_ledger import FILL_EVENTS, ledger as cash_ledger
+from .clients import get_trading_client
+from .config import settings
+from .data import fetch_latest_prices
+from .trade_logger import log_fill
+from .util import logger
+
+# ------------------------------------------------------------------
+# Consumidor del stream de trade updates de Alpaca. Mantiene en memoria un
+# libro con nuestras órdenes abiertas y las posiciones (actualizadas con cada
+# ejecución) y publica cada fill al trade_logger, al ledger de cash y al
+# dashboard (JSON en disco). Con el stream vivo, la foto de cada ciclo lee
+# posiciones y órdenes del libro en lugar de la API REST; el libro se
+# resincroniza por REST cada TRADE_STREAM_RESYNC segundos para corregir
+# eventos perdidos en una reconexión, y las posiciones se revalúan al último
+# precio antes de cada foto (la exposición se calcula con su market_value).
+# ------------------------------------------------------------------
+ORDER_BOOK_FILE = "data/order_book.json"
+TERMINAL_EVENTS = ("fill", "canceled", "expired", "rejected", "replaced")
+
+
+def _value(x) -> str:
+    return getattr(x, "value", x)
+
+
+def _order_row(order) -> dict:
+    """Orden en el formato de la tabla del dashboard."""
+    return {
+        "symbol": order.symbol,
+        "side": _value(order.side),
+        "qty": float(order.qty or 0),
+        "type": _value(getattr(order, "order_type", None) or "market"),
+        "filled": float(order.filled_qty or 0),
+        "status": _value(order.status),
+        "client_order_id": order.client_order_id,
+    }
+
+
+class OrderBook:
+    """Órdenes abiertas (por client_order_id), posiciones y últimas ejecuciones."""
+
+    def __init__(self, history: int = 500):
+        self.orders: dict[str, object] = {}
+        self.positions: dict[str, SnapshotPosition] = {}
+        self.fills = deque(maxlen=history)
+        self.synced_at = 0.0
+        self.marked_at = 0.0
+        self.last_event_at = 0.0
+        self._executions = deque(maxlen=5000)
+        self._pending = None  # eventos recibidos durante un sync
+        self._lock = threading.Lock()
+
+    def sync(self, client):
+        """
+        Rehace el libro desde la API REST (arranque y resincronizaciones). Los
+        eventos que llegan mientras dura la consulta se guardan y se vuelven a
+        aplicar sobre la respuesta: la API puede no incluirlos todavía.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            positions = {_key(p.symbol): SnapshotPosition.from_alpaca(p) for p in client.get_all_positions()}
+            orders = {o.client_order_id or str(o.id): o
+                      for o in client.get_orders(GetOrdersRequest(status=QueryOrderStatus.OPEN))}
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self.positions, self.orders = positions, orders
+            for update in pending:
+                self._update(update, replay=True)
+            self.synced_at = self.marked_at = time.time()
+        logger.debug(f"📗 Libro de órdenes sincronizado: {len(positions)} posiciones | {len(orders)} órdenes abiertas"
+                     f"{f' | {len(pending)} eventos reaplicados' if pending else ''}")
+
+    def mark(self, prices: dict[str, float]):
+        """Revalúa las posiciones a los últimos precios ({símbolo: precio})."""
+        with self._lock:
+            for symbol, price in prices.items():
+                key = _key(symbol)
+                if key in self.positions:
+                    self.positions[key] = replace(self.positions[key], market_value=self.positions[key].qty * price)
+            self.marked_at = time.time()
+
+    def apply(self, update) -> dict:
+        """
+        Aplica un trade update. Devuelve la ejecución (dict) para fill y
+        partial_fill, o None: la parte que abre o aumenta la posición
+        ('opened') y la que la reduce ('closed', con su P&L contra el precio medio).
+        """
+        with self._lock:
+            self.last_event_at = time.time()
+            if self._pending is not None:
+                self._pending.append(update)  # sync en curso: se reaplica sobre su respuesta
+            return self._update(update)
+
+    def _update(self, update, replay: bool = False) -> dict:
+        """Aplica 'update' al libro (con el lock tomado). 'replay': reaplicación tras un sync, sin ejecución."""
+        event, order = _value(update.event), update.order
+        order_id = order.client_order_id or str(order.id)
+        if event in TERMINAL_EVENTS:
+            self.orders.pop(order_id, None)
+        else:
+            self.orders[order_id] = order
+        if event not in FILL_EVENTS:
+            return None
+        if update.execution_id is not None and not replay:
+            if update.execution_id in self._executions:
+                return None  # repetido tras reconexión
+            self._executions.append(update.execution_id)
+
+        qty, price = float(update.qty or 0), float(update.price or 0)
+        signed = qty if _value(order.side) == "buy" else -qty
+        key = _key(order.symbol)
+        pos = self.positions.get(key)
+        if replay and update.position_qty is None:
+            return None  # sin la posición resultante no se sabe si la API ya incluía la ejecución
+        after = float(update.position_qty) if update.position_qty is not None else (pos.qty if pos else 0.0) + signed
+        before = after - signed
+        avg = pos.avg_entry_price if pos and before else price
+
+        closed = min(qty, abs(before)) if before * signed < 0 else 0.0
+        opened = qty - closed
+        pnl = closed * (price - avg) * (1 if before > 0 else -1)
+
+        if abs(after) < 1e-9:
+            self.positions.pop(key, None)
+        elif replay and pos is not None and abs(pos.qty - after) < 1e-9:
+            pass  # la respuesta de la API ya incluía esta ejecución
+        else:
+            if closed and opened:
+                new_avg = price  # giro: la parte nueva entra a este precio
+            elif opened:
+                new_avg = (avg * abs(before) + price * opened) / abs(after)
+            else:
+                new_avg = avg
+            self.positions[key] = SnapshotPosition(key, after, new_avg, after * price)
+        if replay:
+            return None
+
+        fill = {
+            "symbol": order.symbol, "side": _value(order.side), "qty": qty, "price": price,
+            "position_qty": after, "opened": opened, "closed": closed, "entry_price": avg,
+            "realized_pnl": pnl, "client_order_id": order_id, "event": event,
+            "timestamp": str(update.timestamp),
+        }
+        self.fills.append(fill)
+        return fill
+
+    # -------------------- Consultas -------------------- #
+    def all_positions(self) -> dict[str, SnapshotPosition]:
+        """Copia de las posiciones (la foto del ciclo las modifica sin tocar el libro)."""
+        with self._lock:
+            return {k: replace(p) for k, p in self.positions.items()}
+
+    def open_orders(self) -> dict[str, list]:
+        """Órdenes abiertas por símbolo (mismo formato que BrokerSnapshot.open_orders)."""
+        with self._lock:
+            by_symbol = {}
+            for order in self.orders.values():
+                by_symbol.setdefault(_key(order.symbol), []).append(order)
+            return by_symbol
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "published_at": time.time(),
+                "synced_at": self.synced_at,
+                "marked_at": self.marked_at,
+                "open_orders": [_order_row(o) for o in self.orders.values()],
+                "positions": [vars(p) for p in self.positions.values()],
+                "fills": list(self.fills)[-50:],
+            }
+
+
+class TradeStream:
+    """Hilo con el TradingStream de alpaca-py que alimenta un OrderBook."""
+
+    def __init__(self, book: OrderBook = None, ledger=None, url: str = None, stream: TradingStream = None,
+                 publish_path: str = ORDER_BOOK_FILE, resync: float = None):
+        self.book = book or OrderBook()
+        self.ledger = ledger or cash_ledger
+        self.publish_path = publish_path
+        self.resync = resync if resync is not None else settings.trade_stream_resync
+        self.stream = stream or TradingStream(settings.alpaca_api_key, settings.alpaca_secret_key,
+                                              paper=settings.mode == "paper",
+                                              url_override=url or settings.trade_stream_url or None)
+        self.stream.subscribe_trade_updates(self._on_update)
+        self._thread = None
+
+    async def _on_update(self, update):
+        self.handle(update)
+
+    def handle(self, update):
+        """Libro → ledger → trade_logger → dashboard."""
+        try:
+            fill = self.book.apply(update)
+            self.ledger.on_trade_update(update.event, update.order)
+            if fill is not None:
+                logger.info(f"⚡ Ejecución {fill['side'].upper()} {fill['qty']:.6g} {fill['symbol']} @ "
+                            f"${fill['price']:.2f} → posición {fill['position_qty']:+.6g}")
+                log_fill(fill)
+            self.publish()
+        except Exception as e:
+            logger.error(f"❌ Error procesando trade update: {e}")
+
+    def publish(self):
+        """Escribe el libro para el dashboard (reemplazo atómico: nunca se lee a medias)."""
+        try:
+            os.makedirs(os.path.dirname(self.publish_path) or ".", exist_ok=True)
+            tmp = f"{self.publish_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.book.to_dict(), f, default=str)
+            os.replace(tmp, self.publish_path)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo publicar el libro de órdenes: {e}")
+
+    def start(self, client=None):
+        self.book.sync(client or get_trading_client())
+        self.publish()
+        self._thread = threading.Thread(target=self.stream.run, name="trade-stream", daemon=True)
+        self._thread.start()
+        logger.info("📡 Stream de trade updates iniciado")
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        try:
+            self.stream.stop()
+        except Exception:
+            pass  # el loop aún no había arrancado
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def live_book(self, client=None):
+        """
+        El libro si el stream está vivo (resincronizado si toca y con las
+        posiciones revaluadas) o None para leer por REST.
+        """
+        if not self.running:
+            return None
+        if time.time() - self.book.synced_at > self.resync:
+            try:
+                self.book.sync(client or get_trading_client())
+                self.publish()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo resincronizar el libro de órdenes: {e}")
+                return None
+        elif not self.refresh_marks():
+            return None
+        return self.book
+
+    def refresh_marks(self) -> bool:
+        """Revalúa las posiciones del libro al último precio. False si faltan precios."""
+        held = self.book.all_positions()
+        if not held:
+            return True
+        symbols = {_key(s): s for s in settings.symbols}
+        prices = fetch_latest_prices([symbols.get(k, k) for k in held])
+        self.book.mark(prices)
+        missing = set(held) - {_key(s) for s in prices}
+        if missing:
+            logger.warning(f"⚠️ Sin último precio para {', '.join(sorted(missing))}; la foto se lee por REST")
+            return False
+        return True
+
+
+_stream = None
+
+
+def start_trade_stream(client=None) -> TradeStream:
+    """Arranca el stream compartido del proceso (una sola conexión por cuenta)."""
+    global _stream
+    if _stream is None or not _stream.running:
+        _stream = TradeStream()
+        _stream.start(client)
+    return _stream
+
+
+def live_order_book(client=None):
+    """Libro del stream compartido si está vivo, o None."""
+    return _stream.live_book(client) if _stream is not None else None
+
+
+def stream_running() -> bool:
+    return _stream is not None and _stream.running
+
+
+def load_published_book(path: str = ORDER_BOOK_FILE, max_age: float = None):
+    """Libro publicado por el bot (para el dashboard) o None si no existe o está caducado."""
+    max_age = max_age if max_age is not None else 2 * settings.trade_stream_resync
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            book = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if time.time() - float(book.get("published_at", 0)) > max_age:
+        return None
+    return book
@@ -3,18 +3,23 @@ import pandas as pd
 import joblib
 from typing import List, Optional
 
-from bot.data import fetch_bars
+from bot.data import fetch_bars_many
+from bot.panel import make_panel
 from bot.strategy import train_model
 from bot.util import logger
 
 
 def train(symbols: List[str], start: str, end: Optional[str] = None, model_path: str = "model.pkl"):
     dfs = []
+    bars = fetch_bars_many(symbols, start, end)
     for s in symbols:
-        df = fetch_bars(s, start, end)
-        if df.empty:
+        if bars[s].empty:
             logger.warning(f"⚠️ Skip {s}, no data.")
-            continue
+
+    # Features de todo el universo en una pasada (cada símbolo con su propia historia)
+    panel = make_panel(bars)
+    for s in panel.symbols:
+        df = panel.frame(s)
         df["symbol"] = s
         dfs.append(df)
 
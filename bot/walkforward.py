@@ -0,0 +1,163 @@
+# bot/walkforward.py
+import argparse
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import joblib
+import pandas as pd
+from .compiled_model import load_compiled
+from .config import settings
+from .portfolio_backtest import _concat_symbols, backtest_simple
+from .strategy import train_model
+from .util import logger
+
+# ------------------------------------------------------------------
+# Walk-forward: ventanas móviles de entrenamiento (wfo_train_window) y prueba
+# (wfo_test_window). Las features se calculan una vez sobre toda la historia
+# y cada fold solo recorta su tramo; el modelo de cada fold se entrena en el
+# proceso principal y los backtests fuera de muestra se reparten entre
+# procesos. Las curvas OOS se encadenan en una sola curva de equity.
+# ------------------------------------------------------------------
+MODEL_DIR = "models/wfo"
+INITIAL_CAPITAL = 100000.0
+
+
+@dataclass
+class Fold:
+    index: int
+    train_start: pd.Timestamp
+    train_end: pd.Timestamp   # exclusivo (= test_start)
+    test_start: pd.Timestamp
+    test_end: pd.Timestamp    # exclusivo
+
+
+def make_folds(start, end, train_window: str = None, test_window: str = None) -> list[Fold]:
+    """Ventanas [train) + [test) que avanzan de test en test hasta cubrir 'end'."""
+    train = pd.Timedelta(train_window or settings.wfo_train_window)
+    test = pd.Timedelta(test_window or settings.wfo_test_window)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    folds = []
+    t = start
+    while t + train < end:
+        folds.append(Fold(len(folds), t, t + train, t + train, min(t + train + test, end)))
+        t += test
+    return folds
+
+
+def _slice(frames: dict[str, pd.DataFrame], lo, hi) -> dict[str, pd.DataFrame]:
+    """Tramo [lo, hi) de cada símbolo (vistas de las features ya calculadas)."""
+    out = {}
+    for s, f in frames.items():
+        part = f[(f.index >= lo) & (f.index < hi)]
+        if not part.empty:
+            out[s] = part
+    return out
+
+
+def _load_fold_model(path: str):
+    return load_compiled(path) or joblib.load(path)
+
+
+def _oos_backtest(fold: Fold, model_path: str, test_frames: dict, tp_pct, sl_pct, tie):
+    """Backtest fuera de muestra de un fold (se ejecuta en un proceso worker)."""
+    model = _load_fold_model(model_path) if model_path else None
+    result = backtest_simple(test_frames, tp_pct=tp_pct, sl_pct=sl_pct, tie=tie, model=model)
+    return fold.index, result
+
+
+def stitch_equity(curves: list[pd.Series], initial: float = INITIAL_CAPITAL) -> pd.Series:
+    """
+    Encadena curvas OOS que empiezan cada una en 'initial': cada tramo se
+    reescala al equity con el que terminó el anterior (retornos compuestos).
+    """
+    parts, level = [], initial
+    for curve in curves:
+        if curve.empty:
+            continue
+        scaled = curve * (level / initial)
+        parts.append(scaled)
+        level = float(scaled.iloc[-1])
+    if not parts:
+        return pd.Series(dtype=float)
+    return pd.concat(parts)
+
+
+def walk_forward(frames: dict[str, pd.DataFrame], train_window: str = None, test_window: str = None,
+                 workers: int = 1, model_dir: str = MODEL_DIR, tp_pct: float = None,
+                 sl_pct: float = None, tie: str = "stop") -> dict:
+    """
+    Ejecuta el walk-forward sobre features ya calculadas (symbol -> DataFrame).
+    Devuelve {"folds": DataFrame por fold, "equity_curve": curva OOS encadenada,
+    "final_equity": float}.
+    """
+    frames = {s: f for s, f in frames.items() if not f.empty}
+    if not frames:
+        logger.error("❌ Walk-forward sin datos.")
+        return {"folds": pd.DataFrame(), "equity_curve": pd.Series(dtype=float), "final_equity": INITIAL_CAPITAL}
+    start = min(f.index[0] for f in frames.values())
+    end = max(f.index[-1] for f in frames.values()) + pd.Timedelta(1, "ns")
+    folds = make_folds(start, end, train_window, test_window)
+    logger.info(f"🧭 Walk-forward: {len(folds)} folds | train {train_window or settings.wfo_train_window} "
+                f"| test {test_window or settings.wfo_test_window}")
+
+    # 1) Entrenamiento por fold (el RandomForest ya usa todos los núcleos)
+    tasks = []
+    for fold in folds:
+        train = _slice(frames, fold.train_start, fold.train_end)
+        test = _slice(frames, fold.test_start, fold.test_end)
+        if not test:
+            continue
+        data = pd.concat([f.assign(symbol=s) for s, f in train.items()]).sort_index() if train else pd.DataFrame()
+        path = os.path.join(model_dir, f"fold_{fold.index:02d}.pkl")
+        clf = train_model(data, model_path=path) if not data.empty else None
+        if clf is None:
+            logger.warning(f"⚠️ Fold {fold.index}: sin modelo, se usan solo reglas")
+        tasks.append((fold, path if clf is not None else None, test))
+
+    # 2) Backtests OOS en paralelo
+    results = {}
+    if workers <= 1:
+        for fold, path, test in tasks:
+            i, r = _oos_backtest(fold, path, test, tp_pct, sl_pct, tie)
+            results[i] = r
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = [pool.submit(_oos_backtest, fold, path, test, tp_pct, sl_pct, tie)
+                       for fold, path, test in tasks]
+            for fut in futures:
+                i, r = fut.result()
+                results[i] = r
+
+    # 3) Resumen por fold y curva encadenada
+    rows, curves = [], []
+    for fold, path, _ in tasks:
+        r = results[fold.index]
+        curves.append(r["equity_curve"])
+        rows.append({
+            "fold": fold.index, "train_start": fold.train_start, "test_start": fold.test_start,
+            "test_end": fold.test_end, "model": path, "num_trades": r["num_trades"],
+            "return": r["final_equity"] / INITIAL_CAPITAL - 1,
+        })
+    equity_curve = stitch_equity(curves)
+    final_equity = float(equity_curve.iloc[-1]) if not equity_curve.empty else INITIAL_CAPITAL
+    logger.info(f"🏁 Walk-forward OOS: equity final ${final_equity:,.2f} en {len(rows)} folds")
+    return {"folds": pd.DataFrame(rows), "equity_curve": equity_curve, "final_equity": final_equity}
+
+
+def run(symbols, start, end=None, workers=1, train_window=None, test_window=None):
+    frames = _concat_symbols(symbols, start, end)  # features una sola vez para toda la historia
+    return walk_forward(frames, train_window, test_window, workers=workers)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Walk-forward: entrena por ventanas y backtestea fuera de muestra")
+    ap.add_argument("--symbols", nargs="+", required=True)
+    ap.add_argument("--start", required=True)
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--train-window", default=None, help="p. ej. 365D (por defecto WFO_TRAIN_WINDOW)")
+    ap.add_argument("--test-window", default=None, help="p. ej. 90D (por defecto WFO_TEST_WINDOW)")
+    args = ap.parse_args()
+    out = run(args.symbols, args.start, args.end, args.workers, args.train_window, args.test_window)
+    print(out["folds"].to_string(index=False))
@@ -1,12 +1,7 @@
 # check_balance.py
-from alpaca.trading.client import TradingClient
-from bot.config import settings
+from bot.clients import get_trading_client
 
-client = TradingClient(
-    api_key=settings.alpaca_api_key,
-    secret_key=settings.alpaca_secret_key,
-    paper=(settings.mode == "paper")
-)
+client = get_trading_client()
 
 account = client.get_account()
 print(f"💵 Cash: {account.cash}")
@@ -9,7 +9,8 @@ from streamlit_autorefresh import st_autorefresh  # Para recarga automática
 
 # Módulos del bot
 from bot.config import settings
-from alpaca.trading.client import TradingClient
+from bot.clients import get_trading_client
+from bot.trade_stream import load_published_book
 from alpaca.trading.requests import GetOrdersRequest
 from alpaca.trading.enums import QueryOrderStatus
 
@@ -21,11 +22,7 @@ st.markdown("### Monitor en tiempo real | Modo Paper")
 # Cliente de Alpaca (en caché)
 @st.cache_resource
 def get_alpaca_client():
-    return TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
+    return get_trading_client()
 
 client = get_alpaca_client()
 
@@ -61,6 +58,10 @@ def get_open_positions():
         return []
 
 def get_open_orders():
+    # El bot publica su libro de órdenes (stream de trade updates): sin llamada REST
+    book = load_published_book()
+    if book is not None:
+        return book["open_orders"]
     try:
         req = GetOrdersRequest(status=QueryOrderStatus.OPEN)
         orders = client.get_orders(req)
@@ -137,6 +138,11 @@ with tab2:
     else:
         st.info("No hay órdenes abiertas.")
 
+    book = load_published_book()
+    if book is not None and book["fills"]:
+        st.subheader("⚡ Últimas Ejecuciones")
+        st.dataframe(pd.DataFrame(book["fills"][::-1]), use_container_width=True)
+
 # --- TAB 3: TRADES ---
 with tab3:
     st.subheader("📊 Historial de Trades")
@@ -8,7 +8,8 @@ from pathlib import Path
 
 # Módulos del bot
 from bot.config import settings
-from alpaca.trading.client import TradingClient
+from bot.clients import get_trading_client
+from bot.trade_stream import load_published_book
 from alpaca.trading.requests import GetOrdersRequest
 from alpaca.trading.enums import QueryOrderStatus
 
@@ -20,11 +21,7 @@ st.markdown("### Monitor en tiempo real | Modo Paper")
 # Cliente de Alpaca
 @st.cache_resource
 def get_alpaca_client():
-    return TradingClient(
-        api_key=settings.alpaca_api_key,
-        secret_key=settings.alpaca_secret_key,
-        paper=(settings.mode == "paper")
-    )
+    return get_trading_client()
 
 client = get_alpaca_client()
 
@@ -60,6 +57,10 @@ def get_open_positions():
         return []
 
 def get_open_orders():
+    # El bot publica su libro de órdenes (stream de trade updates): sin llamada REST
+    book = load_published_book()
+    if book is not None:
+        return book["open_orders"]
     try:
         req = GetOrdersRequest(status=QueryOrderStatus.OPEN)
         orders = client.get_orders(req)
@@ -119,6 +120,11 @@ with tab2:
     else:
         st.info("No hay órdenes abiertas.")
 
+    book = load_published_book()
+    if book is not None and book["fills"]:
+        st.subheader("⚡ Últimas Ejecuciones")
+        st.dataframe(pd.DataFrame(book["fills"][::-1]), use_container_width=True)
+
 # --- TAB 3: TRADES ---
 with tab3:
     st.subheader("📊 Historial de Trades")
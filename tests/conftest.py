@@ -0,0 +1,30 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Los tests no escriben en la caché de resultados del repo (data/results.db);
+# los que la prueban la activan con una ruta temporal.
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+
+
+def ohlc_bars(n=600, seed=0, start="2024-01-01", freq="h", index=None, vol=0.01, spread=0.5, wrap=False,
+              volume=None) -> pd.DataFrame:
+    """
+    Velas OHLCV sintéticas (paseo aleatorio log-normal) deterministas por 'seed'
+    (entero o un np.random.Generator ya creado, para encadenar varios símbolos).
+    - index: índice propio en lugar de 'n' velas de 'freq' desde 'start'.
+    - spread: escala de |N(0, spread)| entre high/low y el cierre; con
+      wrap=True high/low envuelven también la apertura.
+    - volume: None -> 1.0; (lo, hi) -> enteros aleatorios en [lo, hi).
+    """
+    rng = np.random.default_rng(seed)
+    if index is None:
+        index = pd.date_range(start, periods=n, freq=freq, tz="UTC", name="timestamp")
+    n = len(index)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, vol, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    noise = np.abs(rng.normal(0, spread, n))
+    top, bottom = (np.maximum(open_, close), np.minimum(open_, close)) if wrap else (close, close)
+    vol_col = 1.0 if volume is None else rng.integers(*volume, n).astype(float)
+    return pd.DataFrame({"open": open_, "high": top + noise, "low": bottom - noise, "close": close,
+                         "volume": vol_col}, index=index)
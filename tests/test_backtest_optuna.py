@@ -0,0 +1,69 @@
+import numpy as np
+import optuna
+import backtest_optuna as bo
+from bot.features import make_features
+from conftest import ohlc_bars
+
+
+def _arrays(n=600, seed=0):
+    return bo.symbol_arrays(make_features(ohlc_bars(n, seed)).dropna())
+
+
+def test_shared_arrays_roundtrip(tmp_path):
+    arrays = {"SPY": _arrays(seed=1), "BTC/USD": _arrays(seed=2, n=400)}
+    attached = bo.attach_shared(bo.export_shared(arrays, str(tmp_path)))
+    assert isinstance(attached["SPY"]["close"], np.memmap)
+    for s in arrays:
+        for c in bo.ARRAY_COLUMNS:
+            np.testing.assert_array_equal(attached[s][c], arrays[s][c])
+    params = {"risk_per_trade": 0.01, "take_profit_pct": 0.02, "stop_loss_pct": 0.02, "max_gross_exposure": 2.0}
+    assert bo.run_backtest_arrays(params, attached) == bo.run_backtest_arrays(params, arrays)
+
+
+def test_parallel_study_in_sqlite_resumes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'optuna.db'}"
+    arrays = {"SPY": _arrays(seed=3)}
+    bo.optimize(n_trials=4, workers=2, storage_url=url, study_name="t", arrays=arrays,
+                shared_dir=str(tmp_path / "arrays"))
+    study = bo.optimize(n_trials=1, workers=1, storage_url=url, study_name="t", arrays=arrays)
+    states = [t.state for t in study.trials]
+    assert len(states) == 5 and all(s == optuna.trial.TrialState.COMPLETE for s in states)
+
+
+def test_sweep_matches_run_backtest_per_config():
+    arrays = {"SPY": _arrays(seed=4, n=900), "QQQ": _arrays(seed=5, n=700)}
+    grid = bo.param_grid(risk_per_trade=[0.004, 0.02], take_profit_pct=[0.01, 0.03],
+                         stop_loss_pct=[0.01, 0.02], max_gross_exposure=[1.0, 3.0],
+                         thr_entry=[0.0, 0.3], thr_exit=[None, 0.2])
+    for fill in ("intrabar", "close"):
+        got = bo.sweep(grid, arrays, fill=fill, chunk_size=7)  # bloques que no dividen K
+        assert len(got) == len(grid)
+        for k, params in enumerate(grid):
+            expected = bo.run_backtest_arrays(params, arrays, fill=fill)
+            for m in ("pnl", "num_trades", "win_rate", "sharpe", "max_drawdown", "final_equity"):
+                assert np.isclose(got[m].iloc[k], expected[m], rtol=1e-9, atol=1e-9), (params, m)
+    assert got["num_trades"].nunique() > 1
+
+
+def test_seed_study_enqueues_best_configs():
+    results = bo.sweep(bo.param_grid(**bo.SEED_GRID), {"SPY": _arrays(seed=6)})
+    study = optuna.create_study(direction="maximize")
+    bo.seed_study(study, results, top=3)
+    waiting = study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.WAITING,))
+    best = results.nlargest(3, "objective")
+    assert [t.system_attrs["fixed_params"]["take_profit_pct"] for t in waiting] == best["take_profit_pct"].tolist()
+    assert [t.system_attrs["fixed_params"]["risk_per_trade"] for t in waiting] == best["risk_per_trade"].tolist()
+
+
+def test_sweep_memory_does_not_grow_with_history_times_configs():
+    import tracemalloc
+    arrays = {"SPY": _arrays(seed=7, n=4000)}
+    grid = bo.param_grid(risk_per_trade=[0.001 * (i + 1) for i in range(256)], take_profit_pct=[0.02],
+                         stop_loss_pct=[0.02], max_gross_exposure=[2.0])
+    tracemalloc.start()
+    try:
+        bo.sweep(grid, arrays)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < len(arrays["SPY"]["close"]) * len(grid) * 8 / 2  # menos de media curva (velas x K)
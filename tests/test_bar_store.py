@@ -0,0 +1,123 @@
+import pandas as pd
+from bot import bar_store, data
+from bot.config import settings
+
+
+def _bars(start, periods):
+    idx = pd.date_range(start, periods=periods, freq="h", tz="UTC", name="timestamp")
+    close = pd.Series(range(periods), index=idx, dtype=float) + 100
+    return pd.DataFrame({"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0})
+
+
+def test_fetch_bars_only_requests_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bar_store_path", str(tmp_path))
+    bar_store.clear_cache()
+    full = _bars("2024-01-01", 300)
+    calls = []
+
+    def fake_download(symbols, start_dt, end_dt):
+        calls.append((start_dt, end_dt))
+        return {s: full.loc[start_dt:end_dt] for s in symbols}
+
+    monkeypatch.setattr(data, "_bars_request", fake_download)
+
+    first = data.fetch_bars("SPY", start="2024-01-01", end="2024-01-10")
+    assert len(first) == len(full.loc[:pd.Timestamp("2024-01-10", tz="UTC")])
+    assert len(calls) == 1
+
+    # Mismo rango: todo sale del disco
+    again = data.fetch_bars("SPY", start="2024-01-01", end="2024-01-10")
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, again, check_freq=False)
+
+    # Rango ampliado: solo se pide la cola desde la última vela guardada
+    longer = data.fetch_bars("SPY", start="2024-01-01", end="2024-01-12")
+    assert len(calls) == 2
+    assert calls[-1][0] == first.index[-1]
+    assert len(longer) == len(full.loc[:pd.Timestamp("2024-01-12", tz="UTC")])
+
+    # Un proceso nuevo relee las partes del disco
+    bar_store.clear_cache()
+    reread = bar_store.read_bars("SPY", start=pd.Timestamp("2024-01-01", tz="UTC"))
+    assert reread.index.is_unique
+    assert len(reread) == len(longer)
+
+
+def test_fetch_bars_many_batches_by_asset_class(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bar_store_path", str(tmp_path))
+    bar_store.clear_cache()
+    full = _bars("2024-01-01", 300)
+    calls = []
+
+    class FakeClient:
+        def __init__(self, kind):
+            self.kind = kind
+
+        def _bars(self, req):
+            syms = req.symbol_or_symbols
+            calls.append((self.kind, tuple(syms)))
+            df = pd.concat({s: full for s in syms}, names=["symbol"])
+            return type("BarSet", (), {"df": df})()
+
+        get_stock_bars = get_crypto_bars = _bars
+
+    stock, crypto = FakeClient("stock"), FakeClient("crypto")
+    monkeypatch.setattr(data.clients, "get_stock_client", lambda: stock)
+    monkeypatch.setattr(data.clients, "get_crypto_client", lambda: crypto)
+
+    out = data.fetch_bars_many(["SPY", "AAPL", "BTC/USD", "ETH/USD"], start="2024-01-01", end="2024-01-20")
+    assert sorted(calls) == [("crypto", ("BTC/USD", "ETH/USD")), ("stock", ("SPY", "AAPL"))]
+    assert set(out) == {"SPY", "AAPL", "BTC/USD", "ETH/USD"}
+    assert all(len(df) == len(full) for df in out.values())
+
+
+def test_read_bars_window_skips_row_groups_outside_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bar_store_path", str(tmp_path))
+    monkeypatch.setattr(bar_store, "ROW_GROUP_SIZE", 100)
+    bar_store.clear_cache()
+    full = _bars("2024-01-01", 1000)
+    bar_store.write_bars("SPY", full.iloc[:700], full.index[0], full.index[699], timeframe="1Hour")
+    bar_store.write_bars("SPY", full.iloc[650:], full.index[650], full.index[-1], timeframe="1Hour")
+
+    read = []
+    real = bar_store.pq.ParquetFile.read_row_groups
+    monkeypatch.setattr(bar_store.pq.ParquetFile, "read_row_groups",
+                        lambda self, groups, *a, **k: read.append(list(groups)) or real(self, groups, *a, **k))
+    start, end = full.index[250], full.index[720]
+    window = bar_store.read_bars_window("SPY", start, end, timeframe="1Hour")
+    pd.testing.assert_frame_equal(window, full.loc[start:end].iloc[:-1], check_freq=False)
+    assert read == [[2, 3, 4, 5, 6], [0]]  # velas 200-699 del primer fichero y 650-749 del segundo
+    assert bar_store.read_bars_window("SPY", full.index[-1] + pd.Timedelta("1h"), full.index[-1] + pd.Timedelta("1D"),
+                                      timeframe="1Hour").empty and len(read) == 2
+
+
+def test_sync_batches_tails_per_symbol_and_fetches_only_the_head(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bar_store_path", str(tmp_path))
+    monkeypatch.setattr(settings, "bar_timeframe", "1Hour")
+    bar_store.clear_cache()
+    full = _bars("2024-01-01", 500)
+    halted = full.loc[:"2024-01-03"]  # deja de cotizar el día 3
+    calls = []
+
+    def fake_download(symbols, start_dt, end_dt):
+        calls.append((tuple(symbols), start_dt, end_dt))
+        src = {"SPY": full, "HALT": halted}
+        return {s: src[s].loc[start_dt:end_dt] for s in symbols}
+
+    monkeypatch.setattr(data, "_bars_request", fake_download)
+    ts = lambda s: pd.Timestamp(s, tz="UTC")  # noqa: E731
+
+    data.fetch_bars_many(["SPY", "HALT"], start="2024-01-02", end="2024-01-10")
+    calls.clear()
+    data.fetch_bars_many(["SPY", "HALT"], start="2024-01-02", end="2024-01-11")
+    data.fetch_bars_many(["SPY", "HALT"], start="2024-01-02", end="2024-01-12")
+    # Cada cola desde su propia última vela; la de HALT, como mucho una vela antes de lo cubierto
+    assert sorted(calls) == [(("HALT",), ts("2024-01-09 23:00"), ts("2024-01-11")),
+                             (("HALT",), ts("2024-01-10 23:00"), ts("2024-01-12")),
+                             (("SPY",), ts("2024-01-10"), ts("2024-01-11")),
+                             (("SPY",), ts("2024-01-11"), ts("2024-01-12"))]
+
+    calls.clear()
+    out = data.fetch_bars_many(["SPY"], start="2024-01-01", end="2024-01-12")
+    assert calls == [(("SPY",), ts("2024-01-01"), ts("2024-01-02"))]  # solo la cabeza
+    assert len(out["SPY"]) == len(full.loc[ts("2024-01-01"):ts("2024-01-12")])
@@ -0,0 +1,85 @@
+import time
+import pandas as pd
+from bot import main
+from bot.bar_stream import BarAggregator, BarReplayServer, BarStream, RingBuffer
+from bot.state import BotState
+from conftest import ohlc_bars
+
+
+def _minutes(n, seed, start="2024-01-02 14:00"):
+    return ohlc_bars(n, seed, start, freq="min", vol=0.001, spread=0.05, wrap=True, volume=(1, 100))
+
+
+def _resample(df, freq):
+    return df.resample(freq).agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+
+
+def test_ring_buffer_and_aggregator_match_resample():
+    buf = RingBuffer(4)
+    for i, ts in enumerate(pd.date_range("2024-01-01", periods=6, freq="h", tz="UTC")):
+        buf.append(ts, dict(open=i, high=i, low=i, close=i, volume=i))
+    assert list(buf.frame()["close"]) == [2, 3, 4, 5] and buf.last_ts == pd.Timestamp("2024-01-01 05:00", tz="UTC")
+
+    minutes = _minutes(23, 1, start="2024-01-02 14:02")  # conectado a mitad de la vela de las 14:00
+    agg = BarAggregator(pd.Timedelta("5min"))
+    closed = [c for ts, bar in zip(minutes.index, minutes.to_dict("records")) for c in agg.add("SPY", ts, bar)]
+    expected = _resample(minutes, "5min").iloc[1:]  # la primera está incompleta: se descarta
+    assert [c[1] for c in closed] == list(expected.index)
+    got = pd.DataFrame([c[2] for c in closed], index=expected.index)
+    pd.testing.assert_frame_equal(got, expected, check_freq=False)
+
+
+def test_bucket_missing_its_last_minute_is_flushed_after_grace(monkeypatch):
+    minutes = _minutes(4, 1)  # 14:00-14:03: el minuto 14:04 no llega
+    grace = pd.Timedelta(seconds=10)
+    agg = BarAggregator(pd.Timedelta("5min"), grace=grace)
+    assert not [c for ts, bar in zip(minutes.index, minutes.to_dict("records")) for c in agg.add("SPY", ts, bar)]
+    due = pd.Timestamp("2024-01-02 14:05", tz="UTC") + grace
+    assert agg.flush(due - pd.Timedelta(seconds=1)) == []
+    (closed,) = agg.flush(due)
+    assert closed[:2] == ("SPY", pd.Timestamp("2024-01-02 14:00", tz="UTC"))
+    expected = _resample(minutes, "5min").iloc[0]
+    assert closed[2] == expected.to_dict()
+    assert agg.flush(due) == []
+
+    stream = BarStream(["SPY"], timeframe="5Min", capacity=10, grace=10)
+    for ts, bar in zip(minutes.index, minutes.to_dict("records")):
+        stream.handle_bar("SPY", ts, bar)
+    assert stream.wait(timeout=0.1) == {}  # aún dentro del margen
+    monkeypatch.setattr(stream, "now", lambda: due)
+    assert list(stream.wait(timeout=1)) == ["SPY"]
+    assert stream.buffers["SPY"].last_ts == pd.Timestamp("2024-01-02 14:00", tz="UTC")
+
+
+def test_stream_loop_evaluates_only_symbols_that_closed_a_bar():
+    minutes = {"SPY": _minutes(30, 1), "BTC/USD": _minutes(30, 2)}
+    minutes["SPY"] = minutes["SPY"].iloc[:20]  # SPY deja de cotizar a las 14:20
+    history = {s: _resample(_minutes(600, 3, start="2024-01-01 00:00"), "5min").iloc[:-60] for s in minutes}
+
+    server = BarReplayServer(minutes, delay=0.02).start()
+    stream = BarStream(list(minutes), history=history, timeframe="5Min", capacity=50,
+                       stock_url=server.url, crypto_url=server.url)
+    calls = []
+
+    def step(state, clf, symbols, bars):
+        calls.append({s: bars[s].index[-1] for s in symbols})
+
+    deadline = time.perf_counter() + 30
+    stream.start()
+    try:
+        main.stream_loop(BotState(), None, stream=stream, step=step, heartbeat=1,
+                         keep_running=lambda: sum(len(c) for c in calls) < 10 and time.perf_counter() < deadline)
+    finally:
+        server.stop()
+
+    closes = {}
+    assert all(calls[:-1])  # solo latidos vacíos al final, tras la última vela
+    for c in calls:
+        for s, ts in c.items():
+            closes.setdefault(s, []).append(ts)
+    assert [ts.minute for ts in closes["SPY"]] == [0, 5, 10, 15]
+    assert [ts.minute for ts in closes["BTC/USD"]] == [0, 5, 10, 15, 20, 25]
+    frame = stream.buffers["BTC/USD"].frame()
+    assert len(frame) == 50  # 60 de historia + 6 nuevas en un buffer de 50
+    pd.testing.assert_frame_equal(frame.iloc[-6:], _resample(minutes["BTC/USD"], "5min"),
+                                  check_freq=False, check_names=False, check_index_type=False)
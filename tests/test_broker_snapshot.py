@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+from bot import execution, orders
+from bot.broker_snapshot import BrokerSnapshot
+from bot.exposure import get_total_exposure
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def get_account(self):
+        self.calls.append("account")
+        return SimpleNamespace(equity="10000", cash="5000", last_equity="9800")
+
+    def get_all_positions(self):
+        self.calls.append("positions")
+        return [SimpleNamespace(symbol="BTCUSD", qty="0.1", avg_entry_price="40000", market_value="4000")]
+
+    def get_orders(self, req):
+        self.calls.append("orders")
+        return [SimpleNamespace(symbol="SPY", id="o1")]
+
+    def submit_order(self, order):
+        self.calls.append("submit")
+        return SimpleNamespace(symbol=order.symbol, id="o2")
+
+
+def test_snapshot_serves_cycle_without_extra_calls(monkeypatch):
+    client = FakeClient()
+    snap = BrokerSnapshot.take(client)
+    assert client.calls == ["account", "positions", "orders"]
+    assert snap.position("BTC/USD").qty == 0.1
+    assert snap.has_open_order("SPY") and not snap.has_open_order("QQQ")
+    assert get_total_exposure(snap) == 0.4
+
+    monkeypatch.setattr(execution, "_client", lambda: client)
+    monkeypatch.setattr(orders, "alert_trade_entry", lambda *a, **k: None)
+    execution.place_order("BTC/USD", 0.05, "buy", 50000.0, fractional=False, is_crypto=True, snapshot=snap)
+    execution.place_order("SPY", 100, "buy", 500.0, fractional=False, snapshot=snap)  # sin saldo
+
+    assert client.calls[3:] == ["submit"]
+    pos = snap.position("BTC/USD")
+    assert abs(pos.qty - 0.15) < 1e-12
+    assert abs(pos.avg_entry_price - (0.1 * 40000 + 0.05 * 50000) / 0.15) < 1e-6
+    assert snap.cash == 2500.0
+    assert snap.has_open_order("BTCUSD")
+
+
+def test_apply_order_flip_and_close():
+    snap = BrokerSnapshot(equity=1000.0, cash=1000.0, last_equity=1000.0)
+    snap.apply_order("SPY", 2, "buy", 100.0)
+    snap.apply_order("SPY", 3, "sell", 110.0)
+    pos = snap.position("SPY")
+    assert pos.qty == -1 and pos.avg_entry_price == 110.0
+    snap.apply_order("SPY", 1, "buy", 105.0)
+    assert snap.position("SPY") is None
+    assert snap.cash == 1000.0 - 200.0 + 330.0 - 105.0
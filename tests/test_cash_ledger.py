@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from bot import execution, orders
+from bot.cash_ledger import CashLedger
+
+
+def _order(coid, qty=0, price=0, status="new"):
+    return SimpleNamespace(client_order_id=coid, id=coid, filled_qty=qty, filled_avg_price=price, status=status)
+
+
+def test_reservations_release_on_fill_cancel_and_reconcile():
+    ledger = CashLedger()
+    ledger.reconcile(1000.0, [])
+    assert ledger.try_reserve("a", 500.0) and ledger.try_reserve("b", 300.0)
+    assert not ledger.try_reserve("c", 200.0)  # 900 - 800 disponible
+    assert ledger.try_reserve("a", 500.0) and ledger.reserved == 800.0  # reintento: sin doble reserva
+
+    ledger.on_trade_update("partial_fill", _order("a", 2, 100.0))
+    assert ledger.cash == 800.0 and ledger.reserved == 600.0
+    ledger.on_trade_update("fill", _order("a", 4, 99.0))  # mejor precio: sobra reserva
+    assert ledger.cash == 1000.0 - 396.0 and ledger.reserved == 300.0 and "a" not in ledger.reservations
+
+    ledger.on_trade_update("canceled", _order("b"))
+    assert ledger.reserved == 0.0
+
+    ledger.try_reserve("c", 100.0)
+    ledger.try_reserve("d", 100.0)
+    ledger.reconcile(500.0, ["d"])  # 'c' ya no está abierta: su efecto está en el cash
+    assert ledger.cash == 500.0 and ledger.reserved == 100.0 and set(ledger.reservations) == {"d"}
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def get_account(self):
+        self.calls.append("account")
+        return SimpleNamespace(cash="1000")
+
+    def get_orders(self, req):
+        self.calls.append("orders")
+        return []
+
+    def submit_order(self, order):
+        self.calls.append("submit")
+        if order.symbol == "BAD":
+            raise RuntimeError("boom")
+        return _order(order.client_order_id, order.notional / 100.0, 100.0, status="filled")
+
+
+def test_place_order_checks_locally_and_fills_free_the_cash(monkeypatch):
+    client = FakeClient()
+    ledger = CashLedger()
+    monkeypatch.setattr(execution, "_client", lambda: client)
+    monkeypatch.setattr(execution, "ledger", ledger)
+    monkeypatch.setattr(orders, "alert_trade_entry", lambda *a, **k: None)
+
+    for _ in range(3):  # antes: reservas que solo crecían dejaban sin saldo al bot
+        execution.place_order("SPY", 2.5, "buy", 100.0)
+    execution.place_order("BAD", 1.5, "buy", 100.0)
+
+    assert client.calls == ["account", "orders", "submit", "submit", "submit", "submit"]
+    assert ledger.cash == 250.0 and ledger.reserved == 0.0 and not ledger.reservations
+    execution.place_order("SPY", 2.5, "buy", 100.0)  # 250 * 0.9 < 250
+    assert client.calls.count("submit") == 4
+
+
+def test_snapshot_without_open_orders_keeps_reservations():
+    from bot.broker_snapshot import BrokerSnapshot
+
+    def orders_down(req):
+        raise RuntimeError("503")
+
+    client = SimpleNamespace(get_account=lambda: SimpleNamespace(equity="1000", cash="800", last_equity="1000"),
+                             get_all_positions=lambda: [], get_orders=orders_down)
+    ledger = CashLedger()
+    ledger.reconcile(1000.0, [], at=0.0)
+    ledger.try_reserve("a", 200.0)
+
+    snap = BrokerSnapshot.take(client)
+    assert snap.open_orders is None and not snap.has_open_order("SPY")
+    ledger.reconcile_snapshot(snap)
+    assert ledger.cash == 800.0 and ledger.reserved == 200.0 and "a" in ledger.reservations
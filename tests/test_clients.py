@@ -0,0 +1,66 @@
+import http.server
+import threading
+from bot import clients
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_clients_are_shared_and_reuse_connections():
+    clients.reset()
+    try:
+        a, b = clients.get_trading_client(), clients.get_trading_client()
+        stock = clients.get_stock_client()
+        assert a is b
+        assert a._session is stock._session is clients.get_session()
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/v2/account"
+        for _ in range(5):
+            a._session.get(url).raise_for_status()
+        server.shutdown()
+
+        stats = clients.connection_stats()["_total"]
+        assert stats["requests"] == 5 and stats["connections"] == 1
+        assert stats["reuse_ratio"] == 0.8
+    finally:
+        clients.reset()
+
+
+def test_replaced_session_is_closed_and_missing_session_is_tolerated():
+    closed = []
+
+    class _Own(clients.requests.Session):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    class _Client:
+        def __init__(self, *creds):
+            self._session = _Own()
+
+    class _Renamed:
+        def __init__(self, *creds):
+            self.http = clients.requests.Session()
+
+    clients.reset()
+    try:
+        client = clients._get("fake", _Client)
+        assert client._session is clients.get_session() and len(closed) == 1
+        renamed = clients._get("renamed", _Renamed)
+        assert not hasattr(renamed, "_session")
+    finally:
+        clients.reset()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from bot import strategy
+from bot.compiled_model import CompiledForest, compiled_path, export_compiled
+from bot.strategy import FEATURES
+
+
+def _data(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURES))), columns=FEATURES)
+    X["rsi_14"] = rng.uniform(0, 100, n)
+    y = ((X["ret_1"] + 0.3 * X["macd"] + rng.normal(0, 1, n)) > 0).astype(int)
+    return X, y
+
+
+def test_compiled_forest_matches_predict_proba(tmp_path):
+    X, y = _data()
+    clf = RandomForestClassifier(n_estimators=50, max_depth=8, random_state=42,
+                                 class_weight="balanced").fit(X, y)
+    path = str(tmp_path / "rf_clf.pkl")
+    assert export_compiled(clf, path) == compiled_path(path)
+    compiled = CompiledForest.load(compiled_path(path))
+
+    X_test, _ = _data(n=500, seed=1)
+    np.testing.assert_allclose(compiled.predict_proba(X_test), clf.predict_proba(X_test), atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(X_test), clf.predict(X_test))
+    row = X_test.iloc[0].to_dict()
+    np.testing.assert_allclose(compiled.predict_proba(row), clf.predict_proba(X_test.iloc[:1]), atol=1e-12)
+    assert list(compiled.feature_names_in_) == FEATURES
+
+
+def test_nan_features_route_like_sklearn_in_both_paths(tmp_path):
+    X, y = _data()
+    X.loc[X.sample(frac=0.2, random_state=0).index, "macd"] = np.nan  # NaN vistos al entrenar
+    clf = RandomForestClassifier(n_estimators=30, max_depth=8, random_state=0).fit(X, y)
+    path = str(tmp_path / "rf_clf.pkl")
+    export_compiled(clf, path)
+    compiled = CompiledForest.load(compiled_path(path))
+    assert compiled.missing_left.any()
+
+    X_test, _ = _data(n=200, seed=2)
+    X_test["macd"] = np.nan
+    X_test.loc[X_test.index[::2], "ret_1"] = np.nan  # sin NaN al entrenar: va al hijo con más muestras
+    batch = compiled.predict_proba(X_test)
+    np.testing.assert_allclose(batch, clf.predict_proba(X_test), atol=1e-12)
+    singles = np.vstack([compiled.predict_proba(X_test.iloc[[i]]) for i in range(len(X_test))])
+    np.testing.assert_allclose(singles, batch, atol=1e-12)
+
+
+def test_loader_falls_back_to_pickle(tmp_path, monkeypatch):
+    from joblib import dump
+    X, y = _data(n=500)
+    clf = RandomForestClassifier(n_estimators=5, max_depth=3, random_state=0).fit(X, y)
+    path = str(tmp_path / "rf_clf.pkl")
+    dump(clf, path)
+    monkeypatch.setattr(strategy.settings, "model_path", path)
+
+    monkeypatch.setattr(strategy, "_trading_model_instance", None)
+    assert isinstance(strategy.load_trading_model(), RandomForestClassifier)
+
+    export_compiled(clf, path)
+    monkeypatch.setattr(strategy, "_trading_model_instance", None)
+    assert isinstance(strategy.load_trading_model(), CompiledForest)
@@ -0,0 +1,63 @@
+import threading
+import time
+from bot.data import FetchExecutor, TokenBucket, PRIORITY_PRICE, PRIORITY_BARS
+
+
+def test_price_lane_runs_before_bulk_history():
+    ex = FetchExecutor(max_workers=1, rate_per_min=60_000)
+    gate = threading.Event()
+    order = []
+
+    ex.submit(gate.wait, label="blocker")
+    time.sleep(0.05)
+    bulk = [ex.submit(order.append, f"bars{i}", priority=PRIORITY_BARS) for i in range(3)]
+    price = ex.submit(order.append, "price", priority=PRIORITY_PRICE)
+    gate.set()
+    for f in bulk + [price]:
+        f.result(timeout=5)
+
+    assert order[0] == "price"
+    assert ex.stats()["append"]["count"] == 4
+
+
+def test_requests_run_concurrently_and_errors_propagate():
+    ex = FetchExecutor(max_workers=4, rate_per_min=60_000)
+    t0 = time.perf_counter()
+    futures = [ex.submit(time.sleep, 0.2) for _ in range(4)]
+    for f in futures:
+        f.result(timeout=5)
+    assert time.perf_counter() - t0 < 0.6
+
+    boom = ex.submit(int, "x")
+    try:
+        boom.result(timeout=5)
+        assert False, "debería propagar ValueError"
+    except ValueError:
+        pass
+
+
+def test_token_bucket_throttles_after_burst():
+    bucket = TokenBucket(rate_per_min=600, capacity=2)  # 10 fichas/s
+    t0 = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.perf_counter() - t0 >= 0.15
+
+
+def test_pool_reuses_its_workers_and_priority_overtakes_while_throttled():
+    ex = FetchExecutor(max_workers=2, rate_per_min=600)  # 10 fichas/s tras la ráfaga
+    ex.bucket.tokens = ex.bucket.capacity = 1
+    order, threads = [], set()
+
+    def job(name):
+        threads.add(threading.current_thread().name)
+        order.append(name)
+
+    bulk = [ex.submit(job, f"bars{i}") for i in range(4)]
+    time.sleep(0.03)  # bars0 ha salido; el siguiente espera cuota
+    price = ex.submit(job, "price", priority=PRIORITY_PRICE)
+    for f in bulk + [price]:
+        f.result(timeout=5)
+
+    assert order[:2] == ["bars0", "price"]
+    assert len(threads) <= 2 and len(ex.timings) == 5
@@ -0,0 +1,164 @@
+import numpy as np
+import backtest_optuna
+from bot.features import make_features
+from bot.fill_engine import ExtremaTable, first_passage_exits, bracket_exits
+from bot.risk import compute_brackets
+from bot.sizing import volatility_target_size
+from bot.strategy import signal_frame
+from conftest import ohlc_bars
+
+
+def _scan_exit(close, i, tp, sl, side):
+    """Bucle original de run_backtest: primera vela futura que toca TP o SL."""
+    for j, f_price in enumerate(close[i + 1:]):
+        if side == "long":
+            if f_price >= tp:
+                return i + 1 + j, tp
+            if f_price <= sl:
+                return i + 1 + j, sl
+        else:
+            if f_price <= tp:
+                return i + 1 + j, tp
+            if f_price >= sl:
+                return i + 1 + j, sl
+    return -1, np.nan
+
+
+def test_first_passage_matches_scan_loop():
+    rng = np.random.default_rng(0)
+    for n in (1, 2, 7, 64, 1000):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        close[rng.random(n) < 0.02] = np.nan
+        entries = np.arange(n)
+        is_long = rng.random(n) < 0.5
+        pct_tp, pct_sl = rng.uniform(0.001, 0.05, n), rng.uniform(0.001, 0.05, n)
+        tp = np.where(is_long, close * (1 + pct_tp), close * (1 - pct_tp))
+        sl = np.where(is_long, close * (1 - pct_sl), close * (1 + pct_sl))
+
+        idx, px, _ = first_passage_exits(close, entries, tp, sl, is_long, ExtremaTable(close))
+        for i in entries:
+            e_idx, e_px = _scan_exit(close, i, tp[i], sl[i], "long" if is_long[i] else "short")
+            assert idx[i] == e_idx
+            assert (np.isnan(px[i]) and np.isnan(e_px)) or px[i] == e_px
+
+
+def _legacy_run_backtest(bt, params, symbol_data):
+    """run_backtest antes del motor de primer paso (señales ya precalculadas)."""
+    cash = bt.INITIAL_CAPITAL
+    positions, equity_curve = [], []
+    total_pnl, num_trades, win_count, loss_count = 0.0, 0, 0, 0
+    max_drawdown, peak = 0.0, bt.INITIAL_CAPITAL
+    for symbol, feats in symbol_data.items():
+        for i in range(100, len(feats)):
+            latest = feats.iloc[i]
+            price = float(latest["close"])
+            equity = cash + sum(bt.simulate_trade(p["entry_price"], price, p["qty"], p["side"]) for p in positions)
+            equity_curve.append(equity)
+            peak = max(peak, equity)
+            max_drawdown = max(max_drawdown, peak - equity)
+            gross = sum(abs(p["qty"] * p["entry_price"]) for p in positions) / (equity + 1e-8)
+            if gross >= params["max_gross_exposure"]:
+                continue
+            sig = latest["signal"]
+            if sig == 0:
+                continue
+            qty = volatility_target_size(equity, price, float(latest["atr_14"]), params["risk_per_trade"]) * max(min(abs(sig) + 0.5, 1.5), 0.1)
+            if qty < 1e-6:
+                continue
+            side = "long" if sig > 0 else "short"
+            rp = type("RiskParams", (), {"take_profit_pct": params["take_profit_pct"],
+                                         "stop_loss_pct": params["stop_loss_pct"]})()
+            tp, sl, _ = compute_brackets(price, side, rp)
+            cost = qty * price
+            if cost > cash * 0.95:
+                continue
+            positions.append({"qty": qty, "entry_price": price, "side": side, "open_idx": i})
+            cash -= cost
+            j, exit_price = _scan_exit(feats["close"].values, i, tp, sl, side)
+            if j >= 0:
+                pnl = bt.simulate_trade(price, exit_price, qty, side)
+                cash += qty * exit_price
+                total_pnl += pnl
+                num_trades += 1
+                win_count += pnl > 0
+                loss_count += pnl <= 0
+                positions = [p for p in positions if p["open_idx"] != i]
+    return {"pnl": total_pnl, "num_trades": num_trades, "win_count": win_count,
+            "max_drawdown": max_drawdown, "final_equity": cash, "equity_curve": equity_curve}
+
+
+def test_run_backtest_matches_legacy_loop():
+    rng = np.random.default_rng(5)
+    symbol_data = {}
+    for s in ["SPY", "QQQ"]:
+        symbol_data[s] = make_features(ohlc_bars(1500, rng)).dropna()
+
+    params = {"risk_per_trade": 0.01, "take_profit_pct": 0.02, "stop_loss_pct": 0.04, "max_gross_exposure": 3.0}
+    got = backtest_optuna.run_backtest(params, {s: f.copy() for s, f in symbol_data.items()}, fill="close")
+
+    for f in symbol_data.values():
+        f["signal"] = signal_frame(f)["signal"]
+    expected = _legacy_run_backtest(backtest_optuna, params, symbol_data)
+
+    assert got["num_trades"] == expected["num_trades"] > 0
+    assert got["win_rate"] == expected["win_count"] / expected["num_trades"]
+    assert np.isclose(got["pnl"], expected["pnl"], rtol=1e-9)
+    assert np.isclose(got["max_drawdown"], expected["max_drawdown"], rtol=1e-9)
+    assert np.isclose(got["final_equity"], expected["final_equity"], rtol=1e-9)
+
+
+def test_bracket_exits_intrabar_rules():
+    #            0      1      2      3      4
+    open_ = np.array([100.0, 100.0, 100.0, 95.0, 100.0])
+    high = np.array([100.0, 101.0, 103.0, 96.0, 100.0])
+    low = np.array([100.0, 99.5, 97.0, 94.0, 100.0])
+    close = open_
+    entries = np.array([0, 0, 0, 2])
+    is_long = np.array([True, True, True, True])
+    tp = np.array([102.0, 102.0, 102.0, 110.0])
+    sl = np.array([98.0, 98.0, 98.0, 96.5])
+
+    idx, px, hit = bracket_exits(open_, high, low, entries[:1], tp[:1], sl[:1], is_long[:1], tie="stop")
+    assert idx[0] == 2 and px[0] == 98.0 and not hit[0]            # ambos en la vela 2: pesimista
+    idx, px, hit = bracket_exits(open_, high, low, entries[:1], tp[:1], sl[:1], is_long[:1], tie="target")
+    assert idx[0] == 2 and px[0] == 102.0 and hit[0]
+    idx, px, _ = bracket_exits(open_, high, low, entries[3:], tp[3:], sl[3:], is_long[3:])
+    assert idx[0] == 3 and px[0] == 95.0                          # hueco bajo el stop: sale a la apertura
+
+    # Con solo cierres esa vela no habría tocado nada
+    idx, _, _ = first_passage_exits(close, entries[:1], tp[:1], sl[:1], is_long[:1])
+    assert idx[0] == 3
+
+
+def test_bracket_exits_match_bar_by_bar_scan():
+    rng = np.random.default_rng(1)
+    n = 800
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]] * np.exp(rng.normal(0, 0.003, n))
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, 0.4, n))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, 0.4, n))
+    is_long = rng.random(n) < 0.5
+    tp = np.where(is_long, close * 1.01, close * 0.99)
+    sl = np.where(is_long, close * 0.99, close * 1.01)
+
+    idx, px, hit = bracket_exits(open_, high, low, np.arange(n), tp, sl, is_long, tie="open")
+    for i in range(n):
+        d = 1 if is_long[i] else -1
+        expected = (-1, None)
+        for k in range(i + 1, n):
+            hit_tp = (high[k] >= tp[i]) if d > 0 else (low[k] <= tp[i])
+            hit_sl = (low[k] <= sl[i]) if d > 0 else (high[k] >= sl[i])
+            if not (hit_tp or hit_sl):
+                continue
+            if (sl[i] - open_[k]) * d >= 0:
+                expected = (k, open_[k])
+            elif (open_[k] - tp[i]) * d >= 0:
+                expected = (k, open_[k])
+            elif hit_tp and hit_sl:
+                expected = (k, tp[i] if abs(open_[k] - tp[i]) < abs(open_[k] - sl[i]) else sl[i])
+            else:
+                expected = (k, tp[i] if hit_tp else sl[i])
+            break
+        assert idx[i] == expected[0]
+        if expected[0] >= 0:
+            assert px[i] == expected[1]
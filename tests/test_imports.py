@@ -1,3 +1,9 @@
 def test_imports():
     import bot, bot.features, bot.strategy, bot.portfolio_backtest, bot.optimizer
     assert True
+
+
+def test_order_modules_import_in_any_order():
+    import subprocess, sys
+    for first in ("bot.targets", "bot.execution", "bot.order_gateway", "bot.position_monitor"):
+        subprocess.run([sys.executable, "-c", f"import {first}, bot.main"], check=True)
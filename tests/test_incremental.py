@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pandas as pd
+from bot.features import make_features
+from bot.incremental import IncrementalFeatures, FeatureEngines
+from bot.strategy import FEATURES
+from conftest import ohlc_bars
+
+
+def test_streaming_matches_make_features():
+    df = ohlc_bars(seed=7, volume=(1, 1000))
+    expected = make_features(df)[FEATURES]
+
+    eng = IncrementalFeatures("SPY")
+    rows = {}
+    for ts, bar in df.iterrows():
+        out = eng.update(bar, ts)
+        if out is not None:
+            rows[ts] = [out[c] for c in FEATURES]
+    got = pd.DataFrame.from_dict(rows, orient="index", columns=FEATURES)
+
+    assert list(got.index) == list(expected.index)
+    np.testing.assert_allclose(got.values, expected.values, rtol=1e-9, atol=1e-9)
+
+
+def test_state_roundtrip_and_partial_bar_update():
+    df = ohlc_bars(seed=7, volume=(1, 1000))
+    head, tail = df.iloc[:400], df.iloc[400:]
+    eng = IncrementalFeatures.from_history(head, "SPY")
+
+    # Snapshot JSON a mitad de camino y continuar desde él
+    restored = IncrementalFeatures.from_state(json.loads(json.dumps(eng.to_state())))
+    for ts, bar in tail.iterrows():
+        a, b = eng.update(bar, ts), restored.update(bar, ts)
+    np.testing.assert_allclose([a[c] for c in FEATURES], [b[c] for c in FEATURES], rtol=1e-12)
+
+    # La última vela llega otra vez con otro cierre: se rehace, no se duplica
+    bar = tail.iloc[-1].copy()
+    bar["close"] *= 1.01
+    redone = eng.update(bar, tail.index[-1])
+    changed = df.copy()
+    changed.iloc[-1, changed.columns.get_loc("close")] = bar["close"]
+    expected = make_features(changed)[FEATURES].iloc[-1]
+    np.testing.assert_allclose([redone[c] for c in FEATURES], expected.values, rtol=1e-9, atol=1e-9)
+
+
+def test_feature_engines_only_process_new_bars(tmp_path):
+    df = ohlc_bars(seed=7, volume=(1, 1000))
+    engines = FeatureEngines()
+    first = engines.latest("SPY", df.iloc[:500])
+    assert first["timestamp"] == df.index[499]
+
+    path = str(tmp_path / "features.json")
+    engines.save(path)
+    reloaded = FeatureEngines()
+    reloaded.load(path)
+
+    row = reloaded.latest("SPY", df)
+    expected = make_features(df)[FEATURES].iloc[-1]
+    np.testing.assert_allclose([row[c] for c in FEATURES], expected.values, rtol=1e-9, atol=1e-9)
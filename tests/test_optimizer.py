@@ -0,0 +1,34 @@
+import numpy as np
+import optuna
+import pandas as pd
+from bot import optimizer
+from bot.features import macd, rsi
+from conftest import ohlc_bars
+
+
+def test_cached_indicators_match_direct_computation():
+    bars = {"SPY": ohlc_bars(800, seed=1), "QQQ": ohlc_bars(800, seed=2)}
+    optimizer.set_study_data(bars)
+    m, s, h = optimizer._macd("SPY", 10, 24, 7)
+    em, es, eh = macd(bars["SPY"]["close"], 10, 24, 7)
+    pd.testing.assert_series_equal(m, em)
+    pd.testing.assert_series_equal(h, eh)
+    pd.testing.assert_series_equal(optimizer._rsi("SPY", 9), rsi(bars["SPY"]["close"], 9))
+
+    params = {"macd_fast": 10, "macd_slow": 24, "macd_sig": 7, "rsi_len": 9, "thr_entry": 0.4, "thr_exit": -0.4}
+    a = optimizer.objective(optuna.trial.FixedTrial(params), ["SPY", "QQQ"])
+    b = optimizer.objective(optuna.trial.FixedTrial({**params, "thr_entry": 0.5}), ["SPY", "QQQ"])
+    info = optimizer._signals.cache_info()
+    assert info.misses == 2 and info.hits == 2   # mismos indicadores: segunda pasada gratis
+    assert np.isfinite(a) and np.isfinite(b)
+
+
+def test_study_reports_and_prunes():
+    optimizer.set_study_data({f"S{i}": ohlc_bars(800, seed=i) for i in range(4)})
+    study = optuna.create_study(direction="maximize",
+                                pruner=optuna.pruners.MedianPruner(n_startup_trials=3, n_warmup_steps=0),
+                                sampler=optuna.samplers.RandomSampler(seed=0))
+    study.optimize(lambda t: optimizer.objective(t, ["S0", "S1", "S2", "S3"]), n_trials=25)
+    states = [t.state for t in study.trials]
+    assert optuna.trial.TrialState.PRUNED in states
+    assert all(len(t.intermediate_values) >= 1 for t in study.trials)
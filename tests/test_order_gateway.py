@@ -0,0 +1,60 @@
+import threading
+import time
+from types import SimpleNamespace
+from alpaca.common.exceptions import APIError
+from bot import orders
+from bot.order_gateway import OrderGateway, client_order_id
+
+
+class SlowClient:
+    """Cada envío tarda 'delay' s; rechaza client_order_id repetidos como Alpaca."""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.ids = set()
+        self.lock = threading.Lock()
+
+    def submit_order(self, order):
+        time.sleep(self.delay)
+        with self.lock:
+            if order.client_order_id in self.ids:
+                raise APIError('{"code": 40010001, "message": "client_order_id must be unique"}')
+            self.ids.add(order.client_order_id)
+        if order.symbol == "BAD":
+            raise APIError('{"code": 40310000, "message": "insufficient buying power"}')
+        return SimpleNamespace(id=order.client_order_id, symbol=order.symbol)
+
+
+def _chains(cycle):
+    symbols = ["SPY", "QQQ", "IWM", "DIA", "BAD"]
+    return [[orders.build_order(s, 2, "buy", 100.0, fractional=False, client_order_id=client_order_id(cycle, s))]
+            for s in symbols]
+
+
+def test_cycle_orders_go_out_concurrently_and_retry_is_idempotent(monkeypatch):
+    monkeypatch.setattr(orders, "alert_trade_entry", lambda *a, **k: None)
+    client = SlowClient()
+    gateway = OrderGateway(max_workers=8)
+
+    t0 = time.perf_counter()
+    first = gateway.submit(_chains("c1"), client=client)
+    assert time.perf_counter() - t0 < 0.3  # ~1 viaje, no 5
+    assert [r.ok for r in first] == [True, True, True, True, False]
+    assert first[-1].reason == "insufficient buying power"
+    assert all(r.latency_ms >= 100 for r in first)
+
+    retry = gateway.submit(_chains("c1"), client=client)  # mismo ciclo reintentado
+    assert not any(r.ok for r in retry) and all(r.duplicate for r in retry[:4])
+    assert len(gateway.submit(_chains("c2"), client=client)) == 5
+
+    stats = gateway.stats()
+    assert stats["orders"] == 15 and stats["duplicates"] == 5
+    assert stats["reasons"]["insufficient buying power"] == 2
+    gateway.shutdown()
+
+
+def test_client_order_id_is_stable_per_cycle_symbol_and_leg():
+    assert client_order_id("abc", "BTC/USD") == client_order_id("abc", "BTC/USD", 0)
+    assert client_order_id("abc", "BTC/USD", 1) != client_order_id("abc", "BTC/USD", 0)
+    assert client_order_id("abd", "BTC/USD") != client_order_id("abc", "BTC/USD")
+    assert len(client_order_id("0" * 16, "SOMEVERYLONGSYMBOL")) <= 48
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+from bot.features import make_features
+from bot.panel import make_panel
+from bot.strategy import FEATURES
+from conftest import ohlc_bars
+
+
+def test_panel_matches_make_features_on_ragged_histories():
+    hours = pd.date_range("2024-01-01", periods=24 * 40, freq="h", tz="UTC", name="timestamp")
+    session = hours[(hours.dayofweek < 5) & (hours.hour >= 14) & (hours.hour < 21)]
+    frames = {
+        "BTC/USD": ohlc_bars(index=hours, seed=1, volume=(1, 1000)),               # 24/7
+        "SPY": ohlc_bars(index=session, seed=2, volume=(1, 1000)),                 # solo sesión
+        "NEW": ohlc_bars(index=hours[500:], seed=3, volume=(1, 1000)),             # empieza tarde
+        "EMPTY": ohlc_bars(index=hours[:10], seed=4, volume=(1, 1000)),            # sin historia suficiente
+    }
+    panel = make_panel(frames)
+
+    for s, df in frames.items():
+        expected = make_features(df)
+        got = panel.frame(s)
+        assert list(got.index) == list(expected.index), s
+        if len(expected):
+            np.testing.assert_allclose(got[FEATURES].values, expected[FEATURES].values, rtol=1e-9, atol=1e-9)
+    assert panel.column("close").shape == (len(hours), len(frames))
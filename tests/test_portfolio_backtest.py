@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from bot import portfolio_backtest as pb
+from bot.features import make_features
+from conftest import ohlc_bars
+
+
+def _frame(n, seed, start="2024-01-01"):
+    return make_features(ohlc_bars(n, seed, start, wrap=True)).dropna()
+
+
+def _bar_by_bar(f, sig, tp_pct, sl_pct):
+    """Referencia: recorrido vela a vela con TP/SL intrabar (regla 'stop')."""
+    o, h, l, c = (f[k].to_numpy() for k in ("open", "high", "low", "close"))
+    pos, entry, tp, sl, pnl = 0, 0.0, 0.0, 0.0, 0.0
+    for t in range(len(c)):
+        if pos:
+            hit_tp = h[t] >= tp if pos > 0 else l[t] <= tp
+            hit_sl = l[t] <= sl if pos > 0 else h[t] >= sl
+            px = None
+            if (sl - o[t]) * pos >= 0:
+                px = o[t]
+            elif (o[t] - tp) * pos >= 0:
+                px = o[t]
+            elif hit_sl:
+                px = sl
+            elif hit_tp:
+                px = tp
+            elif sig[t] * pos < -0.5:
+                px = c[t]
+            if px is not None:
+                pnl += 100 * pos * (px - entry)
+                pos = 0
+        if not pos and abs(sig[t]) > 0.4:
+            pos = 1 if sig[t] > 0 else -1
+            entry = c[t]
+            tp = entry * (1 + tp_pct) if pos > 0 else entry * (1 - tp_pct)
+            sl = entry * (1 - sl_pct) if pos > 0 else entry * (1 + sl_pct)
+    return pnl + (100 * pos * (c[-1] - entry) if pos else 0.0)
+
+
+def test_backtest_simple_matches_bar_by_bar(monkeypatch):
+    monkeypatch.setattr(pb, "load_trading_model", lambda: None)
+    frames = {"SPY": _frame(1200, 1), "BTC/USD": _frame(900, 2, start="2024-01-10")}
+    out = pb.backtest_simple(frames, tp_pct=0.01, sl_pct=0.01)
+
+    expected = 100000.0
+    for f in frames.values():
+        sig = pb.signal_frame(f)["signal"].to_numpy()
+        expected += _bar_by_bar(f, sig, 0.01, 0.01)
+
+    assert out["num_trades"] > 0
+    assert np.isclose(out["final_equity"], expected, rtol=1e-12)
+    curve = out["equity_curve"]
+    assert curve.index.equals(frames["SPY"].index.union(frames["BTC/USD"].index))
+    assert curve.iloc[-1] == out["final_equity"]
+
+
+def test_shared_gross_limit_caps_open_positions(monkeypatch):
+    monkeypatch.setattr(pb, "load_trading_model", lambda: None)
+    frames = {s: _frame(800, 10 + k) for k, s in enumerate(["A", "B", "C", "D"])}
+    free = pb.backtest_simple(frames, tp_pct=0.01, sl_pct=0.01, max_gross_exposure=10.0)
+    # ~10k$ por posición y 100k$ de equity: con 0.15 solo cabe una a la vez
+    capped = pb.backtest_simple(frames, tp_pct=0.01, sl_pct=0.01, max_gross_exposure=0.15)
+    assert 0 < capped["num_trades"] < free["num_trades"]
+
+    tr = capped["trades"]
+    end = tr["exit_time"].fillna(frames["A"].index[-1] + pd.Timedelta("1h"))
+    for t in frames["A"].index[::25]:
+        assert ((tr["entry_time"] <= t) & (end > t)).sum() <= 1
+
+    none = pb.backtest_simple(frames, tp_pct=0.01, sl_pct=0.01, max_gross_exposure=0.0)
+    assert none["num_trades"] == 0 and (none["equity_curve"] == 100000.0).all()
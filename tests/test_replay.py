@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from alpaca.common.exceptions import APIError
+from alpaca.trading.enums import OrderSide, TimeInForce
+from alpaca.trading.requests import MarketOrderRequest
+from sklearn.ensemble import RandomForestClassifier
+from bot import replay as rp
+from bot.config import settings
+from bot.features import make_features
+from bot.strategy import prepare_xy
+from conftest import ohlc_bars
+
+
+def test_replay_runs_live_loop_and_matches_backtest_signals(tmp_path):
+    bars = {"BTC/USD": ohlc_bars(300, 1, wrap=True), "SPY": ohlc_bars(300, 2, wrap=True)}
+    X, y = prepare_xy(pd.concat([make_features(b).assign(symbol=s) for s, b in bars.items()]))
+    clf = RandomForestClassifier(n_estimators=10, max_depth=4, random_state=0).fit(X, y)
+    symbols = list(settings.symbols)
+
+    start = pd.Timestamp("2024-01-01", tz="UTC") + pd.Timedelta(hours=220)
+    out = rp.replay(bars, start, model=clf, timeframe="1Hour", workdir=str(tmp_path))
+
+    assert out["cycles"] == 80 and len(out["equity_curve"]) == 80
+    assert out["equity_curve"].index[0] == start
+    assert len(out["fills"]) > 0
+    assert (tmp_path / "state.json").exists() and (tmp_path / "feature_state.json").exists()
+    assert settings.symbols == symbols  # configuración restaurada
+
+    fidelity = rp.signal_fidelity(out, bars, clf)
+    assert set(fidelity["symbol"]) == set(bars)
+    assert (fidelity["bars"] > 0).all() and (fidelity["mismatches"] == 0).all()
+
+
+def test_broker_fills_at_last_closed_bar_and_applies_alpaca_rules():
+    bars = {"BTC/USD": ohlc_bars(10, 1, wrap=True), "SPY": ohlc_bars(10, 2, wrap=True)}
+    clock = rp.VirtualClock(bars["SPY"].index[5])
+    broker = rp.ReplayBroker(rp.ReplayMarket(bars, clock, pd.Timedelta("1h")), 10000.0)
+
+    with pytest.raises(APIError, match="insufficient balance"):
+        broker.submit_order(MarketOrderRequest(symbol="BTCUSD", notional=100, side=OrderSide.SELL,
+                                               time_in_force=TimeInForce.GTC))
+    with pytest.raises(APIError, match="sold short"):
+        broker.submit_order(MarketOrderRequest(symbol="SPY", notional=100, side=OrderSide.SELL,
+                                               time_in_force=TimeInForce.DAY))
+
+    order = broker.submit_order(MarketOrderRequest(symbol="SPY", qty=3, side=OrderSide.BUY,
+                                                   time_in_force=TimeInForce.DAY))
+    price = bars["SPY"]["close"].iloc[4]  # la vela de las 05:00 aún no se ha cerrado
+    assert order.filled_avg_price == pytest.approx(price)
+    assert broker.get_account().cash == pytest.approx(10000.0 - 3 * price)
+
+    clock.sleep(3600)
+    close = broker.close_position("SPY")
+    assert close.filled_avg_price == pytest.approx(bars["SPY"]["close"].iloc[5])
+    assert broker.fills[-1]["realized_pnl"] == pytest.approx(3 * (close.filled_avg_price - price))
+    assert broker.get_all_positions() == []
@@ -0,0 +1,71 @@
+import optuna
+import pandas as pd
+import pytest
+import backtest_optuna as bo
+from bot import optimizer, result_cache
+from bot.config import settings
+from bot.features import make_features
+from conftest import ohlc_bars
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    monkeypatch.setattr(settings, "result_cache_path", str(tmp_path / "results.db"))
+
+
+PARAMS = {"risk_per_trade": 0.01, "take_profit_pct": 0.02, "stop_loss_pct": 0.02, "max_gross_exposure": 2.0}
+
+
+def test_run_backtest_is_served_from_cache(cache, monkeypatch):
+    feats = {"SPY": make_features(ohlc_bars(seed=1)).dropna()}
+    first = bo.run_backtest(PARAMS, feats)
+
+    def boom(*a, **k):
+        raise AssertionError("no debería recalcular")
+    monkeypatch.setattr(bo, "run_backtest_arrays", boom)
+    assert bo.run_backtest(PARAMS, {"SPY": feats["SPY"].copy()}) == pytest.approx(first)
+
+    # Otros parámetros u otros datos: otra clave
+    with pytest.raises(AssertionError):
+        bo.run_backtest({**PARAMS, "stop_loss_pct": 0.03}, feats)
+    with pytest.raises(AssertionError):
+        bo.run_backtest(PARAMS, {"SPY": make_features(ohlc_bars(seed=2)).dropna()})
+
+    stored = result_cache.load_results("run_backtest")
+    assert len(stored) == 1 and stored["num_trades"].iloc[0] == first["num_trades"]
+    key = result_cache.result_key("run_backtest", result_cache.data_fingerprint(feats),
+                                  {**PARAMS, "fill": "intrabar", "tie": "stop"}, "rules")
+    hit = result_cache.lookup(key)
+    assert len(hit["equity_curve"]) == len(feats["SPY"]) - 100
+    assert (hit["trades"]["exit_idx"] >= 0).sum() == first["num_trades"]
+
+
+def test_optimizer_objective_replays_cached_reports(cache, monkeypatch):
+    optimizer.set_study_data({"A": ohlc_bars(seed=3), "B": ohlc_bars(seed=4)})
+    params = {"macd_fast": 12, "macd_slow": 26, "macd_sig": 9, "rsi_len": 14, "thr_entry": 0.4, "thr_exit": -0.4}
+    first = optimizer.objective(optuna.trial.FixedTrial(params), ["A", "B"])
+
+    monkeypatch.setattr(optimizer, "_signals", lambda *a: (_ for _ in ()).throw(AssertionError("recalcula")))
+    study = optuna.create_study(direction="maximize")
+    study.enqueue_trial(params)
+    study.optimize(lambda t: optimizer.objective(t, ["A", "B"]), n_trials=1)
+    trial = study.trials[0]
+    assert trial.value == first
+    assert sorted(trial.intermediate_values) == [0, 1]
+
+
+def test_portfolio_run_key_includes_gross_exposure(cache, monkeypatch):
+    from bot import portfolio_backtest as pb
+    frames = {"SPY": ohlc_bars(seed=5)}
+    calls = []
+    monkeypatch.setattr(pb, "_concat_symbols", lambda *a: frames)
+    monkeypatch.setattr(pb, "load_trading_model", lambda: None)
+    monkeypatch.setattr(pb, "backtest_vectorbt", lambda f, details=False: calls.append(settings.max_gross_exposure) or
+                        {"final_equity": 1.0, "num_trades": 0, "equity_curve": pd.Series([1.0]), "trades": pd.DataFrame()})
+
+    pb.run(["SPY"], "2024-01-01", None)
+    pb.run(["SPY"], "2024-01-01", None)
+    monkeypatch.setattr(settings, "max_gross_exposure", settings.max_gross_exposure + 1.0)
+    pb.run(["SPY"], "2024-01-01", None)  # otro límite bruto: no sirve el resultado anterior
+    assert len(calls) == 2 and calls[1] == calls[0] + 1.0
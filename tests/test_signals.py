@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from bot import strategy
+from bot.features import make_features
+from bot.strategy import FEATURES, rule_signal, hybrid_signal, signal_frame
+from conftest import ohlc_bars
+
+
+def _feats(n=400, seed=3, symbol="SPY"):
+    f = make_features(ohlc_bars(n, seed, vol=0.02, spread=2.0, volume=(1, 1000)))
+    f["symbol"] = symbol
+    return f
+
+
+def test_rule_signal_frame_matches_rowwise():
+    f = _feats()
+    expected = f.apply(rule_signal, axis=1)
+    got = signal_frame(f)["rule_signal"]
+    np.testing.assert_allclose(got.values, expected.values)
+
+
+def test_signal_frame_reproduces_hybrid_signal_hysteresis():
+    f = pd.concat([_feats(seed=3, symbol="SPY"), _feats(seed=4, symbol="QQQ")])
+    y = (f["close"].shift(-1) > f["close"]).astype(int)
+    clf = RandomForestClassifier(n_estimators=20, max_depth=4, random_state=0).fit(f[FEATURES], y)
+
+    strategy._last_signals = {}
+    expected = [hybrid_signal(row, clf) for _, row in f.iterrows()]
+    got = signal_frame(f, clf)["signal"]
+
+    np.testing.assert_allclose(got.values, expected, atol=1e-12)
+    assert np.isclose(strategy._last_signals["QQQ"], got.iloc[-1])
+
+
+def test_hybrid_signal_batch_matches_per_symbol_calls():
+    frames = {s: _feats(seed=i, symbol=s) for i, s in enumerate(["BTC/USD", "SPY", "QQQ"])}
+    f = pd.concat(frames.values())
+    y = (f["close"].shift(-1) > f["close"]).astype(int)
+    clf = RandomForestClassifier(n_estimators=20, max_depth=4, random_state=0).fit(f[FEATURES], y)
+
+    strategy._last_signals = {}
+    expected = []
+    for t in range(-5, 0):
+        expected.append({s: hybrid_signal(fr.iloc[t], clf) for s, fr in frames.items()})
+    state = dict(strategy._last_signals)
+
+    strategy._last_signals = {}
+    got = [strategy.hybrid_signal_batch({s: fr.iloc[t].to_dict() for s, fr in frames.items()}, clf)
+           for t in range(-5, 0)]
+
+    for e, g in zip(expected, got):
+        np.testing.assert_allclose([g[s] for s in e], list(e.values()), atol=1e-12)
+    assert strategy._last_signals == state
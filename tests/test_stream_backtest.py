@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from bot import portfolio_backtest as pb
+from bot import stream_backtest as sb
+from bot.features import make_features
+from conftest import ohlc_bars
+
+
+def test_streaming_matches_in_memory_backtest(monkeypatch):
+    monkeypatch.setattr(pb, "load_trading_model", lambda: None)
+    monkeypatch.setattr(sb, "load_trading_model", lambda: None)
+    bars = {"A": ohlc_bars(3000, 1, wrap=True), "B": ohlc_bars(2500, 2, "2024-01-20", wrap=True), "C": ohlc_bars(3000, 3, wrap=True)}
+    loads = []
+
+    def loader(symbols, start, end):
+        loads.append((tuple(symbols), start, end))
+        return {s: bars[s][(bars[s].index >= start) & (bars[s].index < end)] for s in symbols}
+
+    # Bloques de 100 velas y grupos de 1 símbolo: muchas fronteras con posiciones abiertas
+    monkeypatch.setattr(sb, "block_layout", lambda n, mb, iv: (100 * iv, 1))
+    start, end = "2024-01-01", pd.Timestamp("2024-01-01", tz="UTC") + pd.Timedelta(hours=3000)
+    got = sb.backtest_streaming(list(bars), pd.Timestamp(start, tz="UTC"), end, load_bars=loader, timeframe="1Hour",
+                                tp_pct=0.01, sl_pct=0.01, max_gross_exposure=0.25)
+    ref = pb.backtest_simple({s: make_features(b) for s, b in bars.items()}, tp_pct=0.01, sl_pct=0.01,
+                             max_gross_exposure=0.25)
+
+    assert got["blocks"] == 30 and len(loads) == 90
+    assert got["num_trades"] == ref["num_trades"] > 0
+    assert got["equity_curve"].index.equals(ref["equity_curve"].index)
+    np.testing.assert_allclose(got["equity_curve"].to_numpy(), ref["equity_curve"].to_numpy(), rtol=1e-12)
+    assert len(got["trades"]) == len(ref["trades"])
+
+
+def test_block_layout_follows_memory_budget():
+    small = sb.block_layout(500, 64, pd.Timedelta("1h"))
+    large = sb.block_layout(500, 1024, pd.Timedelta("1h"))
+    assert small[0] < large[0]
+    assert sb.block_layout(10, 256, pd.Timedelta("1h"))[0] > sb.block_layout(500, 256, pd.Timedelta("1h"))[0]
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+import pytest
+from bot import clients, orders
+from bot.broker_snapshot import BrokerSnapshot, SnapshotPosition
+from bot.targets import Target, plan_orders, rebalance, target_from_signal
+
+
+class FakeClient:
+    def __init__(self):
+        self.orders = []
+
+    def submit_order(self, order):
+        self.orders.append(order)
+        return SimpleNamespace(symbol=order.symbol, id=str(len(self.orders)))
+
+
+def _snapshot(**positions):
+    snap = BrokerSnapshot(equity=100000.0, cash=100000.0, last_equity=100000.0)
+    for key, (qty, px) in positions.items():
+        snap.positions[key] = SnapshotPosition(key, qty, px, qty * px)
+    return snap
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(orders, "alert_trade_entry", lambda *a, **k: None)
+    with clients.use_clients(trading=client):
+        yield client
+
+
+def test_target_from_signal_adds_on_same_side_and_replaces_on_flip():
+    assert target_from_signal(2.0, 1.0, "buy") == 3.0
+    assert target_from_signal(2.0, 3.0, "sell") == -3.0
+    assert target_from_signal(0.0, 1.5, "sell") == -1.5
+
+
+def test_reversal_is_one_net_order(client):
+    snap = _snapshot(SPY=(2.0, 100.0))
+    assert rebalance([Target("SPY", -3.0, 110.0)], snap) == 1
+    assert len(client.orders) == 1
+    order = client.orders[0]
+    assert order.side.value == "sell" and order.qty == 5
+    assert snap.position("SPY").qty == -3.0
+
+
+def test_targets_follow_alpaca_short_rules(client):
+    snap = _snapshot(BTCUSD=(0.5, 40000.0), AAPL=(1.5, 200.0))
+    deltas = plan_orders([Target("BTC/USD", -0.2, 40000.0), Target("AAPL", -2.7, 200.0),
+                          Target("QQQ", 0.0, 400.0)], snap)
+    btc, aapl = deltas  # QQQ ya está en su objetivo
+    assert btc.target == 0.0 and btc.action == "cerrar"       # cripto sin cortos
+    assert aapl.target == -2.0 and aapl.legs() == [(1.5, True), (2.0, False)]  # sin cortos fraccionales
+    rebalance([Target("BTC/USD", -0.2, 40000.0), Target("AAPL", -2.7, 200.0)], snap)
+    assert [o.symbol for o in client.orders] == ["BTCUSD", "AAPL", "AAPL"]
+    assert snap.position("BTC/USD") is None and snap.position("AAPL").qty == -2.0
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from alpaca.trading.models import TradeUpdate
+from websockets.asyncio.server import serve
+from bot import trade_logger, trade_stream
+from bot.broker_snapshot import BrokerSnapshot
+from bot.cash_ledger import CashLedger
+from bot.trade_stream import OrderBook, TradeStream, load_published_book
+
+
+def _update(event, coid, side, qty, filled_qty, price, position_qty, symbol="SPY", status=None):
+    now = "2024-01-02T15:00:00Z"
+    order = {"id": str(uuid.uuid5(uuid.NAMESPACE_DNS, coid)), "client_order_id": coid, "created_at": now,
+             "updated_at": now, "submitted_at": now, "symbol": symbol, "asset_class": "us_equity",
+             "qty": str(qty), "filled_qty": str(filled_qty), "filled_avg_price": str(price),
+             "order_class": "simple", "order_type": "market", "side": side, "time_in_force": "day",
+             "status": status or {"partial_fill": "partially_filled", "fill": "filled"}.get(event, event),
+             "extended_hours": False}
+    data = {"event": event, "order": order, "timestamp": now}
+    if event in ("fill", "partial_fill"):
+        data.update(execution_id=str(uuid.uuid4()), qty=str(filled_qty), price=str(price),
+                    position_qty=str(position_qty))
+    return data
+
+
+class LocalTradeServer:
+    """Servidor websocket que habla el protocolo de trade updates de Alpaca (auth + listen)."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.queue = None
+        self.ready = threading.Event()
+        threading.Thread(target=self.loop.run_until_complete, args=(self._main(),), daemon=True).start()
+        assert self.ready.wait(5)
+
+    async def _handler(self, ws):
+        await ws.recv()  # authenticate
+        await ws.send(json.dumps({"stream": "authorization", "data": {"status": "authorized", "action": "authenticate"}}))
+        await ws.recv()  # listen
+        await ws.send(json.dumps({"stream": "listening", "data": {"streams": ["trade_updates"]}}))
+        while True:
+            await ws.send(json.dumps({"stream": "trade_updates", "data": await self.queue.get()}))
+
+    async def _main(self):
+        self.queue = asyncio.Queue()
+        async with serve(self._handler, "127.0.0.1", 0) as server:
+            self.url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+            self.stop = asyncio.Event()
+            self.ready.set()
+            await self.stop.wait()
+
+    def push(self, data):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, data)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.stop.set)
+
+
+def _apply(book, data):
+    return book.apply(TradeUpdate(**data))
+
+
+def test_order_book_tracks_positions_and_realized_pnl():
+    book = OrderBook()
+    assert _apply(book, _update("new", "a", "buy", 10, 0, 0, None)) is None
+    assert list(book.open_orders()) == ["SPY"]
+    _apply(book, _update("partial_fill", "a", "buy", 10, 4, 100.0, 4))
+    fill = _apply(book, _update("fill", "a", "buy", 10, 6, 110.0, 10))
+    assert fill["opened"] == 6 and book.open_orders() == {}
+    assert book.positions["SPY"].avg_entry_price == (4 * 100 + 6 * 110) / 10
+
+    fill = _apply(book, _update("fill", "b", "sell", 15, 15, 120.0, -5))  # giro a corto
+    assert fill["closed"] == 10 and fill["opened"] == 5
+    assert fill["realized_pnl"] == 10 * (120.0 - 106.0)
+    assert book.positions["SPY"].qty == -5 and book.positions["SPY"].avg_entry_price == 120.0
+
+
+def test_sync_replays_events_that_arrive_during_the_rest_fetch():
+    book = OrderBook()
+    _apply(book, _update("fill", "a", "buy", 10, 10, 100.0, 10))
+    stale = [SimpleNamespace(symbol="SPY", qty="10", avg_entry_price="100", market_value="1000")]
+
+    def positions_while_filling():
+        # Llega una ejecución mientras la API responde con la foto anterior
+        _apply(book, _update("new", "b", "buy", 5, 0, 0, None, symbol="AAPL"))
+        _apply(book, _update("fill", "c", "sell", 4, 4, 110.0, 6))
+        return stale
+
+    client = SimpleNamespace(get_all_positions=positions_while_filling, get_orders=lambda req: [])
+    book.sync(client)
+    assert book.positions["SPY"].qty == 6 and book.positions["SPY"].avg_entry_price == 100.0
+    assert list(book.open_orders()) == ["AAPL"]
+
+    # Si la respuesta ya incluía la ejecución, se respeta la posición de la API
+    def positions_with_fill():
+        _apply(book, _update("fill", "d", "buy", 2, 2, 120.0, 8))
+        return [SimpleNamespace(symbol="SPY", qty="8", avg_entry_price="105", market_value="960")]
+
+    client.get_all_positions = positions_with_fill
+    book.sync(client)
+    assert book.positions["SPY"].qty == 8 and book.positions["SPY"].avg_entry_price == 105.0
+
+
+def test_live_book_marks_positions_before_the_snapshot(monkeypatch):
+    client = SimpleNamespace(get_account=lambda: SimpleNamespace(equity="10000", cash="9000", last_equity="10000"))
+    consumer = TradeStream(stream=SimpleNamespace(subscribe_trade_updates=lambda f: None), resync=3600)
+    consumer.book.synced_at = time.time()
+    _apply(consumer.book, _update("fill", "a", "buy", 10, 10, 100.0, 10))
+    monkeypatch.setattr(TradeStream, "running", True)
+    monkeypatch.setattr(trade_stream, "fetch_latest_prices", lambda symbols: {"SPY": 150.0})
+
+    snap = BrokerSnapshot.take(client, book=consumer.live_book(client))
+    assert snap.gross_value() == 1500.0  # no el valor de la ejecución (1000)
+
+    monkeypatch.setattr(trade_stream, "fetch_latest_prices", lambda symbols: {})
+    assert consumer.live_book(client) is None  # sin precio: la foto se lee por REST
+
+
+def test_stream_feeds_book_ledger_trade_log_and_dashboard(tmp_path, monkeypatch):
+    monkeypatch.setattr(trade_logger, "TRADES_FILE", str(tmp_path / "trades_log.csv"))
+    monkeypatch.setattr(trade_stream, "fetch_latest_prices", lambda symbols: {"SPY": 99.0})
+    client = SimpleNamespace(get_all_positions=lambda: [], get_orders=lambda req: [])
+    ledger = CashLedger()
+    ledger.reconcile(10000.0, [])
+    ledger.try_reserve("ptb-1", 1000.0)
+    server = LocalTradeServer()
+    consumer = TradeStream(ledger=ledger, url=server.url, publish_path=str(tmp_path / "order_book.json"))
+    consumer.start(client)
+    try:
+        t0 = time.perf_counter()
+        server.push(_update("fill", "ptb-1", "buy", 10, 10, 99.0, 10))
+        while ledger.reservations and time.perf_counter() - t0 < 10:
+            time.sleep(0.005)
+        assert ledger.reserved == 0.0 and ledger.cash == 10000.0 - 990.0
+        assert consumer.book.positions["SPY"].qty == 10
+        assert consumer.live_book(client) is consumer.book
+
+        server.push(_update("fill", "ptb-2", "sell", 10, 10, 101.0, 0))
+        while consumer.book.positions and time.perf_counter() - t0 < 10:
+            time.sleep(0.005)
+        assert consumer.book.positions == {}
+    finally:
+        consumer.stop()
+        server.close()
+
+    rows = trade_logger._read_all_trades()
+    assert [r["status"] for r in rows] == ["closed"] and rows[0]["realized_pnl"] == "20.00"
+    published = load_published_book(str(tmp_path / "order_book.json"))
+    assert [f["client_order_id"] for f in published["fills"]] == ["ptb-1", "ptb-2"]
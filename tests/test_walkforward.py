@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from bot.features import make_features
+from bot.walkforward import make_folds, stitch_equity, walk_forward
+from conftest import ohlc_bars
+
+
+def _frame(n=2400, seed=0):
+    return make_features(ohlc_bars(n, seed))
+
+
+def test_make_folds_roll_by_test_window():
+    folds = make_folds("2024-01-01", "2024-03-01", "30D", "10D")
+    assert [f.index for f in folds] == [0, 1, 2]
+    for f in folds:
+        assert f.train_end == f.test_start
+        assert f.train_end - f.train_start == pd.Timedelta("30D")
+    assert folds[1].test_start == folds[0].test_end
+    assert folds[-1].test_end == pd.Timestamp("2024-03-01")
+
+
+def test_stitch_equity_compounds_fold_returns():
+    a = pd.Series([100000.0, 110000.0], index=[0, 1])
+    b = pd.Series([100000.0, 90000.0], index=[2, 3])
+    out = stitch_equity([a, b])
+    np.testing.assert_allclose(out.to_numpy(), [100000.0, 110000.0, 110000.0, 99000.0])
+
+
+def test_walk_forward_runs_folds_in_workers(tmp_path):
+    frames = {"SPY": _frame(seed=1), "QQQ": _frame(seed=2)}
+    out = walk_forward(frames, "40D", "20D", workers=2, model_dir=str(tmp_path))
+    folds = out["folds"]
+    assert len(folds) == 3 and folds["model"].notna().all()
+    assert (tmp_path / "fold_00.pkl").exists()
+    curve = out["equity_curve"]
+    assert curve.index.is_monotonic_increasing and curve.index[0] >= folds["test_start"].iloc[0]
+    expected = 100000.0 * np.prod(1 + folds["return"].to_numpy())
+    assert np.isclose(out["final_equity"], expected)